@@ -0,0 +1,340 @@
+"""Closed-loop HTTP load generator for the chat API.
+
+Each virtual user logs in once, then repeatedly picks an operation from a
+weighted mix (login / chat / streaming chat / list sessions / list messages),
+optionally pausing between requests. Latencies recorded after the warm-up
+period are summarised as throughput and p50/p95/p99 per operation.
+
+Run it against an already running server:
+
+    python benchmarks/load.py --base-url http://127.0.0.1:8000 --users 20 --duration 60
+
+or let benchmarks/run.py start the app and a stub upstream first.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+OPERATIONS = ("login", "chat", "stream", "sessions", "messages")
+DEFAULT_MIX = "login=1,chat=3,stream=2,sessions=3,messages=3"
+
+# A small pool of prompts reused by a fraction of chats, so the response cache
+# and request coalescing see the repetition real traffic has
+QUESTIONS = (
+    "What is the difference between a process and a thread?",
+    "Explain database indexing in simple terms.",
+    "How do I reverse a list in Python?",
+    "What does HTTP status code 429 mean?",
+    "Summarise the CAP theorem.",
+    "How does a hash map handle collisions?",
+    "What is the capital of Australia?",
+    "Give me three tips for writing clear commit messages.",
+)
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse ``"chat=3,stream=1"`` into operation weights"""
+    mix = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("Operation mix must have at least one positive weight")
+    return mix
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+def summarise(latencies: List[float], errors: int, elapsed: float) -> dict:
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        "count": count,
+        "errors": errors,
+        "rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(values) / count * 1000, 2) if count else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if count else 0.0,
+    }
+
+class StreamFailed(Exception):
+    """The stream ended with an error event instead of ``done``"""
+
+@dataclass
+class VirtualUser:
+    username: str
+    password: str
+    token: Optional[str] = None
+    session_ids: List[int] = field(default_factory=list)
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.statuses: Counter = Counter()
+        self.recording = False
+
+    def success(self, op: str, seconds: float):
+        if self.recording:
+            self.latencies[op].append(seconds)
+
+    def failure(self, op: str, status):
+        if self.recording:
+            self.errors[op] += 1
+            self.statuses[str(status)] += 1
+
+class LoadTest:
+    def __init__(self, base_url: str, users: int = 10, duration: float = 30.0, warmup: float = 5.0,
+                 mix: Optional[Dict[str, float]] = None, think_time: float = 0.0,
+                 repeat_ratio: float = 0.2, new_session_ratio: float = 0.3,
+                 max_tokens: int = 128, timeout: float = 60.0, seed: int = 0,
+                 user_prefix: str = "bench"):
+        self.base_url = base_url.rstrip("/")
+        self.users = users
+        self.duration = duration
+        self.warmup = warmup
+        self.mix = mix or parse_mix(DEFAULT_MIX)
+        self.think_time = think_time
+        self.repeat_ratio = repeat_ratio
+        self.new_session_ratio = new_session_ratio
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.seed = seed
+        self.user_prefix = user_prefix
+        self.recorder = Recorder()
+
+    def config(self) -> dict:
+        return {
+            "users": self.users,
+            "duration": self.duration,
+            "warmup": self.warmup,
+            "mix": self.mix,
+            "think_time": self.think_time,
+            "repeat_ratio": self.repeat_ratio,
+            "new_session_ratio": self.new_session_ratio,
+            "max_tokens": self.max_tokens,
+            "seed": self.seed,
+        }
+
+    async def _login(self, client: httpx.AsyncClient, user: VirtualUser):
+        response = await client.post("/api/auth/token", data={"username": user.username, "password": user.password})
+        response.raise_for_status()
+        user.token = response.json()["access_token"]
+
+    async def _prepare_user(self, client: httpx.AsyncClient, index: int) -> VirtualUser:
+        user = VirtualUser(f"{self.user_prefix}{index:04d}", f"{self.user_prefix}-password-{index}")
+        response = await client.post("/api/auth/register", json={
+            "username": user.username,
+            "email": f"{user.username}@bench.example.com",
+            "password": user.password,
+        })
+        # 400 means the user survived from an earlier run against the same database
+        if response.status_code not in (200, 400):
+            response.raise_for_status()
+        await self._login(client, user)
+        return user
+
+    def _chat_payload(self, rng: random.Random, user: VirtualUser) -> dict:
+        if rng.random() < self.repeat_ratio:
+            message = rng.choice(QUESTIONS)
+        else:
+            message = f"{rng.choice(QUESTIONS)} Request {uuid.UUID(int=rng.getrandbits(128)).hex[:12]}."
+        payload = {"message": message, "max_tokens": self.max_tokens}
+        if user.session_ids and rng.random() >= self.new_session_ratio:
+            payload["session_id"] = rng.choice(user.session_ids)
+        return payload
+
+    def _remember_session(self, user: VirtualUser, session_id: Optional[int]):
+        if session_id is not None and session_id not in user.session_ids:
+            user.session_ids.append(session_id)
+
+    async def _run_op(self, op: str, client: httpx.AsyncClient, user: VirtualUser, rng: random.Random):
+        # Listing messages needs a session; chat until the user has one
+        if op == "messages" and not user.session_ids:
+            op = "chat"
+        started = time.perf_counter()
+        try:
+            if op == "login":
+                await self._login(client, user)
+            elif op == "chat":
+                response = await client.post("/api/chat/chat", json=self._chat_payload(rng, user), headers=user.headers)
+                response.raise_for_status()
+                self._remember_session(user, response.json()["session_id"])
+            elif op == "stream":
+                await self._stream(client, user, rng, started)
+            elif op == "sessions":
+                response = await client.get("/api/chat/sessions", params={"limit": 20}, headers=user.headers)
+                response.raise_for_status()
+            else:
+                session_id = rng.choice(user.session_ids)
+                response = await client.get(f"/api/chat/sessions/{session_id}/messages",
+                                            params={"limit": 50}, headers=user.headers)
+                response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            self.recorder.failure(op, e.response.status_code)
+        except (httpx.HTTPError, StreamFailed) as e:
+            self.recorder.failure(op, type(e).__name__)
+        else:
+            self.recorder.success(op, time.perf_counter() - started)
+
+    async def _stream(self, client: httpx.AsyncClient, user: VirtualUser, rng: random.Random, started: float):
+        first_token = None
+        async with client.stream("POST", "/api/chat/chat/stream",
+                                 json=self._chat_payload(rng, user), headers=user.headers) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[6:])
+                if event["type"] == "session":
+                    self._remember_session(user, event["session_id"])
+                elif event["type"] == "delta" and first_token is None:
+                    first_token = time.perf_counter() - started
+                elif event["type"] == "error":
+                    raise StreamFailed(event.get("error"))
+        if first_token is not None:
+            self.recorder.success("stream_ttft", first_token)
+
+    async def _user_loop(self, client: httpx.AsyncClient, user: VirtualUser, index: int, deadline: float):
+        rng = random.Random(self.seed * 100003 + index)
+        ops, weights = zip(*self.mix.items())
+        while time.perf_counter() < deadline:
+            await self._run_op(rng.choices(ops, weights)[0], client, user, rng)
+            if self.think_time:
+                await asyncio.sleep(rng.expovariate(1 / self.think_time))
+
+    async def run(self) -> dict:
+        limits = httpx.Limits(max_connections=self.users * 2, max_keepalive_connections=self.users * 2)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits) as client:
+            setup = asyncio.Semaphore(16)
+
+            async def prepare(index: int) -> VirtualUser:
+                async with setup:
+                    return await self._prepare_user(client, index)
+
+            users = await asyncio.gather(*(prepare(i) for i in range(self.users)))
+
+            loop_started = time.perf_counter()
+            deadline = loop_started + self.warmup + self.duration
+            workers = [asyncio.create_task(self._user_loop(client, user, i, deadline))
+                       for i, user in enumerate(users)]
+
+            await asyncio.sleep(self.warmup)
+            self.recorder.recording = True
+            measured_from = time.perf_counter()
+            await asyncio.gather(*workers)
+            elapsed = time.perf_counter() - measured_from
+
+        recorder = self.recorder
+        operations = {
+            op: summarise(recorder.latencies.get(op, []), recorder.errors.get(op, 0), elapsed)
+            for op in (*OPERATIONS, "stream_ttft")
+            if recorder.latencies.get(op) or recorder.errors.get(op)
+        }
+        total = summarise(
+            [s for op, samples in recorder.latencies.items() if op != "stream_ttft" for s in samples],
+            sum(recorder.errors.values()), elapsed
+        )
+        return {
+            "config": self.config(),
+            "elapsed": round(elapsed, 2),
+            "operations": operations,
+            "total": total,
+            "errors_by_status": dict(recorder.statuses),
+        }
+
+def format_report(report: dict) -> str:
+    header = f"{'operation':<12} {'count':>7} {'errors':>6} {'rps':>8} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"
+    lines = [header, "-" * len(header)]
+    rows = list(report["operations"].items()) + [("TOTAL", report["total"])]
+    for name, s in rows:
+        lines.append(
+            f"{name:<12} {s['count']:>7} {s['errors']:>6} {s['rps']:>8.2f} {s['mean_ms']:>7.1f}ms "
+            f"{s['p50_ms']:>7.1f}ms {s['p95_ms']:>7.1f}ms {s['p99_ms']:>7.1f}ms {s['max_ms']:>7.1f}ms"
+        )
+    if report["errors_by_status"]:
+        lines.append("errors by status: " + ", ".join(f"{k}={v}" for k, v in sorted(report["errors_by_status"].items())))
+    return "\n".join(lines)
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """List operations whose p95 grew, or whose throughput fell, by more than ``tolerance``"""
+    regressions = []
+    for op, current in {**report["operations"], "TOTAL": report["total"]}.items():
+        previous = baseline["total"] if op == "TOTAL" else baseline["operations"].get(op)
+        if not previous or not previous["count"] or not current["count"]:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{op}: p95 {previous['p95_ms']:.1f}ms -> {current['p95_ms']:.1f}ms")
+        if op != "stream_ttft" and current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{op}: throughput {previous['rps']:.2f} -> {current['rps']:.2f} req/s")
+    return regressions
+
+def add_arguments(parser: argparse.ArgumentParser):
+    group = parser.add_argument_group("load")
+    group.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    group.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    group.add_argument("--warmup", type=float, default=5.0, help="seconds of traffic discarded before measuring")
+    group.add_argument("--mix", default=DEFAULT_MIX, help=f"operation weights (default: {DEFAULT_MIX})")
+    group.add_argument("--think-time", type=float, default=0.0, help="mean pause between a user's requests (s)")
+    group.add_argument("--repeat-ratio", type=float, default=0.2, help="fraction of chats reusing a common prompt")
+    group.add_argument("--new-session-ratio", type=float, default=0.3, help="fraction of chats starting a session")
+    group.add_argument("--max-tokens", type=int, default=128)
+    group.add_argument("--request-timeout", type=float, default=60.0)
+    group.add_argument("--load-seed", type=int, default=0, help="seed for the traffic mix")
+    group.add_argument("--output", help="write the JSON report here")
+    group.add_argument("--baseline", help="JSON report to compare against; exit 1 on regression")
+    group.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+
+def load_test_from_args(args, base_url: str) -> LoadTest:
+    return LoadTest(
+        base_url, users=args.users, duration=args.duration, warmup=args.warmup,
+        mix=parse_mix(args.mix), think_time=args.think_time, repeat_ratio=args.repeat_ratio,
+        new_session_ratio=args.new_session_ratio, max_tokens=args.max_tokens,
+        timeout=args.request_timeout, seed=args.load_seed,
+    )
+
+def report_and_compare(report: dict, args) -> int:
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions beyond {:.0%}:".format(args.tolerance))
+            print("\n".join(f"  {r}" for r in regressions))
+            return 1
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Drive a running API with a realistic traffic mix")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    add_arguments(parser)
+    args = parser.parse_args()
+    report = asyncio.run(load_test_from_args(args, args.base_url).run())
+    return report_and_compare(report, args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Micro-benchmarks for the per-request hot paths.
+
+Times the pure-CPU pieces every chat request goes through (token counting,
+cache fingerprints, the semantic index scan, rate-limit checks, password
+hashing) in isolation, so a regression can be pinned to a function rather than
+inferred from end-to-end latency.
+
+    python benchmarks/micro.py
+    python benchmarks/micro.py --filter vector --json micro.json
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("REDIS_ENABLED", "false")
+
+import numpy as np
+
+from src.config import settings
+from src.core.cache import LRUCache
+from src.core.rate_limit import Limit, RateLimiter
+from src.core.vector_index import VectorIndex
+from src.services.password_hasher import pwd_context
+from src.services.response_cache import prompt_fingerprint
+from src.services.tokens import count_prompt_tokens, count_tokens
+
+PARAGRAPH = (
+    "知答 answers questions about databases, networking and programming. "
+    "A typical user turn is a few sentences long and mixes English with 中文 text. "
+) * 8
+
+CONVERSATION = [{"role": "system", "content": "You are a helpful assistant."}] + [
+    {"role": "user" if i % 2 == 0 else "assistant", "content": f"{PARAGRAPH} turn {i}"}
+    for i in range(10)
+]
+
+def benchmarks(args):
+    """Yield ``(name, callable)`` pairs; setup runs once, outside the timing"""
+    yield "count_tokens(1KB)", lambda: count_tokens(PARAGRAPH, settings.OPENAI_MODEL)
+    yield "count_prompt_tokens(11 msgs)", lambda: count_prompt_tokens(CONVERSATION, settings.OPENAI_MODEL)
+    yield "prompt_fingerprint(11 msgs)", lambda: prompt_fingerprint(settings.OPENAI_MODEL, CONVERSATION, 0.0, 512)
+
+    rng = np.random.default_rng(0)
+    index = VectorIndex(maxsize=args.vectors, ttl=3600)
+    for i in range(args.vectors):
+        index.add(rng.standard_normal(args.dim), "global", i)
+    query = rng.standard_normal(args.dim)
+    yield f"VectorIndex.search({args.vectors}x{args.dim})", lambda: index.search(query, "global", 0.95)
+
+    cache = LRUCache(maxsize=10000, ttl=60)
+    for i in range(10000):
+        cache.set(f"user:{i}", {"id": i})
+    counter = iter(range(10 ** 12))
+    yield "LRUCache.get+set", lambda: cache.set(f"user:{next(counter) % 10000}", cache.get("user:42"))
+
+    limiter = RateLimiter(maxsize=100000)
+    limits = [Limit("user:1:chat", 10 ** 9, 60), Limit("ip:127.0.0.1", 10 ** 9, 60)]
+    yield "RateLimiter local check(2 limits)", lambda: limiter._check_local(limits)
+
+    hashed = pwd_context.hash("bench-password")
+    yield f"bcrypt verify({settings.BCRYPT_ROUNDS} rounds)", lambda: pwd_context.verify("bench-password", hashed)
+
+def measure(fn, repeat: int) -> float:
+    """Best per-call time in seconds over ``repeat`` auto-ranged runs"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Time the per-request hot paths")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--vectors", type=int, default=5000, help="entries in the semantic index")
+    parser.add_argument("--dim", type=int, default=1536, help="embedding dimensions")
+    parser.add_argument("--json", dest="output", help="write results here")
+    args = parser.parse_args()
+
+    results = {}
+    for name, fn in benchmarks(args):
+        if args.filter and args.filter.lower() not in name.lower():
+            continue
+        seconds = measure(fn, args.repeat)
+        results[name] = {"us_per_call": round(seconds * 1e6, 3), "calls_per_second": round(1 / seconds, 1)}
+        print(f"{name:<40} {seconds * 1e6:>12.2f} us/call {1 / seconds:>14,.0f} calls/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Fake OpenAI-compatible upstream for load tests.
+
+Serves /v1/chat/completions (plain and streaming) and /v1/embeddings with a
+configurable latency profile, so benchmark numbers measure this service rather
+than a third-party API.
+
+    python benchmarks/stub_openai.py --port 9100 --latency 0.3 --ttft 0.2 --tokens-per-second 80
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+WORDS = ("the quick brown fox jumps over the lazy dog while a patient assistant "
+         "explains every step in plain and careful language").split()
+
+class StubConfig:
+    def __init__(self, latency: float = 0.3, jitter: float = 0.1, ttft: float = 0.2,
+                 tokens_per_second: float = 80.0, reply_tokens: int = 60,
+                 error_rate: float = 0.0, embedding_dim: int = 64, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.embedding_dim = embedding_dim
+        self.random = random.Random(seed)
+
+    def delay(self, base: float) -> float:
+        return max(0.0, base + self.random.uniform(-self.jitter, self.jitter))
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and self.random.random() < self.error_rate
+
+def _prompt_tokens(messages) -> int:
+    # Rough whitespace count; the service does its own accounting with tiktoken
+    return sum(len(str(m.get("content", "")).split()) + 4 for m in messages)
+
+def _reply_words(config: StubConfig, max_tokens) -> list:
+    count = min(config.reply_tokens, max_tokens or config.reply_tokens)
+    return [WORDS[i % len(WORDS)] for i in range(count)]
+
+def _embedding(text: str, dim: int) -> list:
+    """Deterministic unit vector per text, so identical inputs embed identically"""
+    seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).round(6).tolist()
+
+def _error(status: int = 500) -> JSONResponse:
+    headers = {"retry-after": "1"} if status == 429 else None
+    return JSONResponse({"error": {"message": "stub upstream failure", "type": "server_error"}},
+                        status_code=status, headers=headers)
+
+def create_app(config: StubConfig) -> Starlette:
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if config.should_fail():
+            await asyncio.sleep(config.delay(config.ttft))
+            return _error(config.random.choice((429, 500, 503)))
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        model = body.get("model", "stub")
+        words = _reply_words(config, body.get("max_tokens"))
+        prompt_tokens = _prompt_tokens(body.get("messages", []))
+
+        if not body.get("stream"):
+            await asyncio.sleep(config.delay(config.latency))
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(words),
+                    "total_tokens": prompt_tokens + len(words),
+                },
+            })
+
+        def chunk(delta: dict, finish_reason=None) -> str:
+            return "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }) + "\n\n"
+
+        async def events():
+            await asyncio.sleep(config.delay(config.ttft))
+            yield chunk({"role": "assistant", "content": ""})
+            interval = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+            for i, word in enumerate(words):
+                yield chunk({"content": word if i == 0 else " " + word})
+                if interval:
+                    await asyncio.sleep(interval)
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def embeddings(request: Request):
+        body = await request.json()
+        if config.should_fail():
+            return _error()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        await asyncio.sleep(config.delay(config.latency / 4))
+        tokens = sum(len(text.split()) for text in inputs)
+        return JSONResponse({
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": _embedding(text, config.embedding_dim)}
+                for i, text in enumerate(inputs)
+            ],
+            "model": body.get("model", "stub-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    async def models(request: Request):
+        return JSONResponse({"object": "list", "data": [{"id": "stub", "object": "model"}]})
+
+    return Starlette(routes=[
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/v1/embeddings", embeddings, methods=["POST"]),
+        Route("/v1/models", models),
+    ])
+
+def add_arguments(parser: argparse.ArgumentParser):
+    group = parser.add_argument_group("stub upstream")
+    group.add_argument("--latency", type=float, default=0.3, help="non-streaming response time (s)")
+    group.add_argument("--jitter", type=float, default=0.1, help="uniform +/- jitter applied to delays (s)")
+    group.add_argument("--ttft", type=float, default=0.2, help="time to first streamed token (s)")
+    group.add_argument("--tokens-per-second", type=float, default=80.0, help="streaming rate, 0 for no delay")
+    group.add_argument("--reply-tokens", type=int, default=60, help="tokens per completion")
+    group.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 429/5xx")
+    group.add_argument("--seed", type=int, default=0)
+
+def config_from_args(args) -> StubConfig:
+    return StubConfig(
+        latency=args.latency, jitter=args.jitter, ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second, reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate, seed=args.seed,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port,
+                log_level="warning", access_log=False)
+
+if __name__ == "__main__":
+    main()
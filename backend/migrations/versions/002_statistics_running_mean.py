@@ -0,0 +1,32 @@
+"""Store response time sum and count for statistics running mean
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('statistics', sa.Column('response_time_sum', sa.BigInteger(), nullable=False, server_default='0'))
+    op.add_column('statistics', sa.Column('response_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Seed the new columns from existing rows, treating every chat as one response
+    op.execute(
+        "UPDATE statistics "
+        "SET response_count = chat_count, "
+        "response_time_sum = ROUND(avg_response_time * chat_count) "
+        "WHERE avg_response_time IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('statistics', 'response_count')
+    op.drop_column('statistics', 'response_time_sum')
@@ -0,0 +1,35 @@
+"""Composite indexes for keyset pagination of sessions and messages
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Sessions are paged by (last_message_time, id); backfill so the column can be NOT NULL
+    op.execute("UPDATE sessions SET last_message_time = created_at WHERE last_message_time IS NULL")
+    op.alter_column('sessions', 'last_message_time', existing_type=sa.DateTime(), nullable=False)
+
+    op.create_index('idx_sessions_user_last_message', 'sessions', ['user_id', 'last_message_time', 'id'], unique=False)
+    op.create_index('idx_messages_session_created', 'messages', ['session_id', 'created_at', 'id'], unique=False)
+
+    # The composite indexes lead with the same columns and also back the foreign keys
+    op.drop_index('idx_sessions_user_id', table_name='sessions')
+    op.drop_index('idx_messages_session', table_name='messages')
+
+
+def downgrade() -> None:
+    op.create_index('idx_messages_session', 'messages', ['session_id'], unique=False)
+    op.create_index('idx_sessions_user_id', 'sessions', ['user_id'], unique=False)
+    op.drop_index('idx_messages_session_created', table_name='messages')
+    op.drop_index('idx_sessions_user_last_message', table_name='sessions')
+    op.alter_column('sessions', 'last_message_time', existing_type=sa.DateTime(), nullable=True)
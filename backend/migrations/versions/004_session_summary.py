@@ -0,0 +1,26 @@
+"""Rolling conversation summary on sessions
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('sessions', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('sessions', sa.Column('summary_message_id', sa.BigInteger(), nullable=True))
+    op.add_column('sessions', sa.Column('summary_tokens', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('sessions', 'summary_tokens')
+    op.drop_column('sessions', 'summary_message_id')
+    op.drop_column('sessions', 'summary')
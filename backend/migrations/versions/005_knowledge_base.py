@@ -0,0 +1,54 @@
+"""Knowledge base documents and embedded chunks
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('kb_documents',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('title', sa.String(255), nullable=False),
+        sa.Column('source', sa.String(1024), nullable=True),
+        sa.Column('content_hash', sa.String(64), nullable=False),
+        sa.Column('status', sa.Enum('indexed', 'deleted', name='kb_document_status'), nullable=False, server_default='indexed'),
+        sa.Column('chunk_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('token_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_by', sa.BigInteger(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP')),
+        sa.Column('meta', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['users.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_kb_documents_content_hash', 'kb_documents', ['content_hash'], unique=False)
+    op.create_index('idx_kb_documents_status_updated', 'kb_documents', ['status', 'updated_at'], unique=False)
+
+    op.create_table('kb_chunks',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('document_id', sa.BigInteger(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('tokens', sa.Integer(), nullable=False),
+        sa.Column('embedding', sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(['document_id'], ['kb_documents.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_kb_chunks_document_position', 'kb_chunks', ['document_id', 'position'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_kb_chunks_document_position', table_name='kb_chunks')
+    op.drop_table('kb_chunks')
+    op.drop_index('idx_kb_documents_status_updated', table_name='kb_documents')
+    op.drop_index('idx_kb_documents_content_hash', table_name='kb_documents')
+    op.drop_table('kb_documents')
@@ -0,0 +1,33 @@
+"""Full-text index on message content for history search
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+def _is_mysql() -> bool:
+    # The ngram parser is MySQL's; other databases search through the in-process index
+    dialect = op.get_bind().dialect
+    return dialect.name == 'mysql' and not getattr(dialect, 'is_mariadb', False)
+
+def upgrade() -> None:
+    if not _is_mysql():
+        return
+    # The ngram parser (ngram_token_size, default 2) indexes Chinese text, which has
+    # no spaces between words. The first FULLTEXT index on a table adds a hidden
+    # FTS_DOC_ID column and so rebuilds it; run this on large tables off-peak.
+    op.execute("ALTER TABLE messages ADD FULLTEXT INDEX ft_messages_content (content) WITH PARSER ngram")
+
+
+def downgrade() -> None:
+    if not _is_mysql():
+        return
+    op.drop_index('ft_messages_content', table_name='messages')
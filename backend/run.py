@@ -1,15 +1,16 @@
+import asyncio
 import uvicorn
-from src.api.main import app
 from src.core.database import init_db
 
 if __name__ == "__main__":
     # Initialize the database
-    init_db()
-    
-    # Start the FastAPI application
+    asyncio.run(init_db())
+
+    # Start the FastAPI application with auto-reload for development;
+    # use serve.py in production
     uvicorn.run(
-        app,
+        "src.api.main:app",
         host="0.0.0.0",
         port=8000,
         reload=True
-    )
\ No newline at end of file
+    )
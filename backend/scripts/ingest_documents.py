@@ -0,0 +1,92 @@
+"""Bulk-load files into the knowledge base.
+
+    python scripts/ingest_documents.py docs/ faq.csv
+    python scripts/ingest_documents.py /data/manuals --workers 8 --checkpoint manuals.ckpt
+
+PDF, Markdown, HTML, CSV (one document per row) and text files are parsed and
+chunked in a process pool, then deduplicated by content hash, embedded in
+batches and stored. Files are logged to the checkpoint once stored, so an
+interrupted run picks up where it stopped and unchanged files are skipped.
+
+Run it where KB_INDEX_DIR is the API's index directory: the run writes a new
+index generation that API workers load directly. Elsewhere, pass --no-index
+and the workers pull the new rows from the database instead.
+"""
+import sys
+import os
+import asyncio
+import argparse
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import settings
+from src.core.database import async_engine
+from src.services.ingestion import Checkpoint, IngestionPipeline, IngestionReport
+from src.services.knowledge_base import knowledge_base
+from src.services.openai_service import get_openai_service, close_openai_service
+
+PROGRESS_INTERVAL = 2.0
+
+class ProgressPrinter:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.printed_at = 0.0
+
+    def __call__(self, report: IngestionReport):
+        now = time.monotonic()
+        if now - self.printed_at < PROGRESS_INTERVAL:
+            return
+        self.printed_at = now
+        elapsed = now - self.started
+        print(
+            f"[{elapsed:7.1f}s] files {report.finished_files + report.failed_files}"
+            f"/{report.files - report.skipped_files}  documents {report.documents} "
+            f"({report.created} new, {report.duplicates} duplicate)  chunks {report.chunks}  "
+            f"{report.documents / elapsed if elapsed else 0:.1f} docs/s",
+            flush=True
+        )
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingest files into the knowledge base")
+    parser.add_argument("paths", nargs="+", help="files or directories (searched recursively)")
+    parser.add_argument("--workers", type=int, default=settings.KB_INGEST_WORKERS, help="parser processes, 0 for one per CPU")
+    parser.add_argument("--batch-size", type=int, default=settings.KB_INGEST_BATCH, help="documents per embed/store batch")
+    parser.add_argument("--checkpoint", default="kb_ingest.checkpoint", help="file recording finished files")
+    parser.add_argument("--no-checkpoint", dest="use_checkpoint", action="store_false", help="process every file")
+    parser.add_argument("--no-index", dest="index", action="store_false", help="only write to the database")
+    return parser.parse_args()
+
+async def ingest(args) -> int:
+    checkpoint = Checkpoint(args.checkpoint) if args.use_checkpoint else None
+    try:
+        if args.index:
+            # Start from the current generation plus rows it lacks, so the one written here is complete
+            await knowledge_base.sync(lexical=False)
+        pipeline = IngestionPipeline(
+            knowledge_base, get_openai_service(),
+            workers=args.workers,
+            batch_documents=args.batch_size,
+            checkpoint=checkpoint,
+            add_to_index=args.index,
+            compact=args.index,
+            on_progress=ProgressPrinter(),
+        )
+        report = await pipeline.run(args.paths)
+        if args.index and knowledge_base.index.delta_size:
+            await knowledge_base.compact()
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+        await close_openai_service()
+        await async_engine.dispose()
+
+    print(f"\n{report.files} files ({report.skipped_files} unchanged, {report.failed_files} failed) "
+          f"in {report.seconds:.1f}s")
+    print(f"{report.documents} documents: {report.created} new, {report.duplicates} duplicate; "
+          f"{report.chunks} chunks embedded")
+    for error in report.errors:
+        print(f"  {error}")
+    return 1 if report.failed_files else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(ingest(parse_args())))
@@ -1,39 +1,41 @@
 import sys
 import os
+import asyncio
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.core.database import engine, SessionLocal, init_db
+from src.core.database import AsyncSessionLocal, async_engine, init_db
 from src.models.base import Base, User
 from src.repositories import UserRepository
 from src.api.utils.auth import get_password_hash
 from sqlalchemy.sql import text
 
-def test_connection():
+async def test_connection():
     """Test database connection and create test user"""
     try:
-        db = SessionLocal()
-        print("Successfully connected to database")
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
+            print("Successfully connected to database")
 
-        # Initialize database tables
-        init_db()
-        print("Database tables created")
+            # Initialize database tables
+            await init_db()
+            print("Database tables created")
 
-        # Create test user if not exists
-        user_repo = UserRepository(db)
-        test_user = user_repo.get_by_username("test")
-        if not test_user:
-            test_user = user_repo.create({
-                "username": "test",
-                "email": "test@example.com",
-                "password": get_password_hash("test123"),
-                "role": "admin",
-                "status": "active"
-            })
-            print("Created test user: test/test123")
-        else:
-            print("Test user already exists")
+            # Create test user if not exists
+            user_repo = UserRepository(db)
+            test_user = await user_repo.get_by_username("test")
+            if not test_user:
+                test_user = await user_repo.create({
+                    "username": "test",
+                    "email": "test@example.com",
+                    "password": get_password_hash("test123"),
+                    "role": "admin",
+                    "status": "active"
+                })
+                print("Created test user: test/test123")
+            else:
+                print("Test user already exists")
 
-        db.close()
+        await async_engine.dispose()
         print("Database connection test completed successfully")
 
     except Exception as e:
@@ -41,4 +43,4 @@ def test_connection():
         raise
 
 if __name__ == "__main__":
-    test_connection()
\ No newline at end of file
+    asyncio.run(test_connection())
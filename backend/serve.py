@@ -0,0 +1,196 @@
+"""Production entry point: several uvicorn workers behind one listening socket.
+
+    python serve.py                      # one worker per CPU, settings from .env
+    python serve.py --workers 4 --port 8080
+
+The schema is checked once here before any worker starts. Workers use uvloop and
+httptools when they are installed (uvicorn[standard]). On SIGTERM/SIGINT every
+worker stops accepting connections at once and lets in-flight requests,
+including streamed chat responses, finish for up to SERVER_GRACEFUL_TIMEOUT
+seconds. Workers that crash are replaced.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from typing import Optional
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+from uvicorn.subprocess import get_subprocess
+
+from src.config import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+APP = "src.api.main:app"
+
+# A worker exiting sooner than this after starting failed to boot; restarting
+# it would only loop
+MIN_WORKER_UPTIME = 10.0
+
+class GracefulServer(uvicorn.Server):
+    """uvicorn server whose shutdown drain is bounded by ``graceful_timeout``"""
+
+    def __init__(self, config: uvicorn.Config, graceful_timeout: float):
+        super().__init__(config)
+        self.graceful_timeout = graceful_timeout
+        self.drain_expired = False
+
+    def handle_exit(self, sig, frame):
+        # Ctrl+C reaches every process in the group; the supervisor relays it
+        # to workers as a single SIGTERM so the first signal is not taken as a
+        # request to force quit
+        if sig == signal.SIGINT and self.config.workers > 1:
+            return
+        if not self.should_exit and self.graceful_timeout > 0:
+            asyncio.get_event_loop().call_later(self.graceful_timeout, self._expire_drain)
+        super().handle_exit(sig, frame)
+
+    def _expire_drain(self):
+        if not (self.server_state.connections or self.server_state.tasks):
+            return
+        logger.warning(
+            "Graceful shutdown timed out after %.0fs, closing %d open connection(s)",
+            self.graceful_timeout, len(self.server_state.connections)
+        )
+        self.drain_expired = True
+        self.force_exit = True
+
+    async def shutdown(self, sockets=None):
+        await super().shutdown(sockets=sockets)
+        if self.drain_expired:
+            # uvicorn skips the lifespan shutdown when forced; statistics still need flushing
+            await self.lifespan.shutdown()
+
+class Supervisor(Multiprocess):
+    """
+    uvicorn's worker supervisor, changed to replace workers that die and to
+    stop all workers together, so they drain in parallel instead of one after
+    another while the rest keep accepting connections.
+    """
+
+    def __init__(self, config, target, sockets):
+        super().__init__(config, target, sockets)
+        self.started_at = []
+        self.failed = False
+
+    def _spawn(self):
+        process = get_subprocess(config=self.config, target=self.target, sockets=self.sockets)
+        process.start()
+        return process
+
+    def startup(self):
+        super().startup()
+        self.started_at = [time.monotonic()] * len(self.processes)
+
+    def run(self):
+        self.startup()
+        while not self.should_exit.wait(1.0):
+            self.replace_dead_workers()
+        self.shutdown()
+
+    def replace_dead_workers(self):
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+                from prometheus_client import multiprocess
+                multiprocess.mark_process_dead(process.pid)
+            if time.monotonic() - self.started_at[index] < MIN_WORKER_UPTIME:
+                logger.error("Worker [%s] exited with code %s while booting, stopping", process.pid, process.exitcode)
+                self.failed = True
+                self.should_exit.set()
+                return
+            logger.warning("Worker [%s] exited with code %s, starting a replacement", process.pid, process.exitcode)
+            self.processes[index] = self._spawn()
+            self.started_at[index] = time.monotonic()
+
+    def shutdown(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        logger.info("Stopping parent process [%s]", self.pid)
+
+async def check_schema():
+    """Create missing tables once, before workers start serving"""
+    from src.core.database import async_engine, init_db
+    try:
+        await init_db()
+    finally:
+        await async_engine.dispose()
+
+def prepare_metrics_dir() -> Optional[str]:
+    """
+    Point every worker at a shared, empty directory for prometheus_client's
+    multiprocess mode. Returns the directory if it was created here and should
+    be removed on exit.
+    """
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        path = os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="zhida-metrics-")
+        return path
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+    return None
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the API with several worker processes")
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS, help="0 for one per CPU")
+    parser.add_argument("--keepalive", type=int, default=settings.SERVER_KEEPALIVE, help="idle keep-alive seconds")
+    parser.add_argument("--backlog", type=int, default=settings.SERVER_BACKLOG)
+    parser.add_argument("--limit-concurrency", type=int, default=settings.SERVER_LIMIT_CONCURRENCY)
+    parser.add_argument("--graceful-timeout", type=float, default=settings.SERVER_GRACEFUL_TIMEOUT)
+    parser.add_argument("--access-log", action="store_true", default=settings.SERVER_ACCESS_LOG)
+    parser.add_argument("--skip-schema-check", action="store_true",
+                        help="leave the schema to migrations (alembic upgrade head)")
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args()
+
+def main() -> int:
+    args = parse_args()
+    workers = args.workers or os.cpu_count() or 1
+
+    if not args.skip_schema_check:
+        asyncio.run(check_schema())
+
+    config = uvicorn.Config(
+        APP,
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        loop="auto",
+        http="auto",
+        timeout_keep_alive=args.keepalive,
+        backlog=args.backlog,
+        limit_concurrency=args.limit_concurrency or None,
+        access_log=args.access_log,
+        log_level=args.log_level,
+    )
+    server = GracefulServer(config, args.graceful_timeout)
+
+    if workers == 1:
+        server.run()
+        return 0
+
+    owned_metrics_dir = prepare_metrics_dir()
+    try:
+        supervisor = Supervisor(config, target=server.run, sockets=[config.bind_socket()])
+        supervisor.run()
+        return 1 if supervisor.failed else 0
+    finally:
+        if owned_metrics_dir:
+            shutil.rmtree(owned_metrics_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,22 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import auth, chat
-from ..core.database import init_db
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from .routers import auth, chat, knowledge_base as knowledge_base_router
+from .middleware import MetricsMiddleware, ProfilingMiddleware, RateLimitMiddleware
+from ..config import settings
+from ..core.database import async_engine
+from ..core.metrics import LoopLagMonitor, pool_stats, register_stats, scrape_registry
+from ..core.cache import close_redis
+from ..services.openai_service import get_openai_service, close_openai_service
+from ..services.statistics_aggregator import stats_aggregator
+from ..services.password_hasher import password_hasher
+from ..services.summarizer import summarizer
+from ..services.response_cache import response_cache
+from ..services.single_flight import single_flight
+from ..services.knowledge_base import knowledge_base
+from ..services.message_search import message_search
+from ..services.session_cache import session_cache
+from ..services.ingestion import import_jobs
 
 app = FastAPI(
     title="知答 API",
@@ -9,6 +24,12 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Innermost, so a profile covers the routed request only
+app.add_middleware(ProfilingMiddleware)
+
+# Rate limiting sits inside CORS so rejected responses remain readable by browsers
+app.add_middleware(RateLimitMiddleware)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -16,17 +37,63 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Next-Cursor",
+        "RateLimit-Limit",
+        "RateLimit-Remaining",
+        "RateLimit-Reset",
+        "RateLimit-Policy",
+        "Retry-After",
+    ],
 )
 
+# Outermost, so rejected and CORS preflight requests are measured too
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
+app.include_router(knowledge_base_router.router, prefix="/api/kb", tags=["knowledge base"])
+
+# Existing in-process counters, exported as gauges on /metrics
+register_stats("openai", lambda: get_openai_service().stats())
+register_stats("password_hasher", password_hasher.stats)
+register_stats("response_cache", response_cache.stats)
+register_stats("single_flight", single_flight.stats)
+register_stats("knowledge_base", knowledge_base.stats)
+register_stats("message_search", message_search.stats)
+register_stats("session_cache", session_cache.stats)
+register_stats("db_pool", lambda: pool_stats(async_engine.pool))
+
+loop_lag_monitor = LoopLagMonitor(settings.METRICS_LOOP_LAG_INTERVAL)
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup"""
-    init_db()
+    """Start per-worker background services; the schema is checked once by the launcher"""
+    # Build the shared OpenAI client up front so no request pays for it
+    get_openai_service()
+    await stats_aggregator.start()
+    if settings.KB_ENABLED:
+        await knowledge_base.start()
+    loop_lag_monitor.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush buffered statistics and release pooled upstream connections"""
+    await loop_lag_monitor.stop()
+    await summarizer.stop()
+    await import_jobs.stop()
+    await knowledge_base.stop()
+    await stats_aggregator.stop()
+    await close_openai_service()
+    await close_redis()
+    password_hasher.shutdown()
 
 @app.get("/")
 async def root():
-    return {"message": "Welcome to 知答 API"}
\ No newline at end of file
+    return {"message": "Welcome to 知答 API"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(generate_latest(scrape_registry()), media_type=CONTENT_TYPE_LATEST)
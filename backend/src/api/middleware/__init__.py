@@ -0,0 +1,9 @@
+from .metrics import MetricsMiddleware
+from .profiling import ProfilingMiddleware
+from .rate_limit import RateLimitMiddleware
+
+__all__ = [
+    'MetricsMiddleware',
+    'ProfilingMiddleware',
+    'RateLimitMiddleware'
+]
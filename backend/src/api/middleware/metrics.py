@@ -0,0 +1,47 @@
+import time
+from starlette.routing import Match
+from ...core.metrics import HTTP_REQUEST_DURATION
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request latency per route template
+    (``/api/chat/sessions/{session_id}`` rather than each concrete path, to
+    keep label cardinality bounded). Streaming responses are timed until their
+    last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _route(scope) -> str:
+        app = scope.get("app")
+        partial = None
+        for route in getattr(app, "routes", []):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+            if match == Match.PARTIAL and partial is None:
+                partial = route.path
+        return partial or "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_DURATION.labels(scope["method"], self._route(scope), str(status)).observe(
+                time.perf_counter() - started
+            )
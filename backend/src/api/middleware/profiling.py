@@ -0,0 +1,91 @@
+import asyncio
+import cProfile
+import logging
+import os
+import random
+import re
+import time
+from ...config import settings
+from ..utils.auth import bearer_claims
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # optional; cProfile is used instead
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+class ProfilingMiddleware:
+    """
+    Profiles a sampled fraction of requests (PROFILE_SAMPLE_RATE), plus any
+    request from an admin token that carries the PROFILE_HEADER header, and
+    writes one profile per request to PROFILE_DIR.
+
+    With pyinstrument installed the profile follows the request's own task
+    across awaits and is saved as speedscope JSON (open it at speedscope.app).
+    Otherwise cProfile is used, which records everything the worker thread
+    runs meanwhile, and a ``.prof`` file is written for snakeviz/flameprof.
+    Only one request is profiled at a time.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.header = settings.PROFILE_HEADER.lower().encode("latin-1")
+        self._active = False
+
+    def _requested(self, scope) -> bool:
+        if not any(name == self.header for name, _ in scope["headers"]):
+            return False
+        claims = bearer_claims(scope["headers"])
+        return claims is not None and claims.get("role") == "admin"
+
+    def _should_profile(self, scope) -> bool:
+        if self._active:
+            return False
+        if self._requested(scope):
+            return True
+        return settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self._active = True
+        started = time.perf_counter()
+        if Profiler is not None:
+            profiler = Profiler(async_mode="enabled")
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if Profiler is not None:
+                profiler.stop()
+            else:
+                profiler.disable()
+            self._active = False
+            elapsed_ms = int((time.perf_counter() - started) * 1000)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{scope['method']}-{_UNSAFE.sub('_', scope['path']).strip('_')}-{elapsed_ms}ms"
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._save, profiler, name)
+
+    @staticmethod
+    def _save(profiler, name: str):
+        try:
+            os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+            if Profiler is not None:
+                path = os.path.join(settings.PROFILE_DIR, f"{name}.speedscope.json")
+                with open(path, "w") as f:
+                    f.write(profiler.output(SpeedscopeRenderer()))
+            else:
+                path = os.path.join(settings.PROFILE_DIR, f"{name}.prof")
+                profiler.dump_stats(path)
+            logger.info("Wrote request profile %s", path)
+        except Exception:
+            logger.exception("Failed to write request profile %s", name)
@@ -0,0 +1,148 @@
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from ...config import settings
+from ...core.metrics import RATE_LIMIT_DECISIONS
+from ...core.rate_limit import Decision, Limit, RateLimiter
+from ..utils.auth import bearer_claims
+
+logger = logging.getLogger(__name__)
+
+# Mirrors the limits documented in docs/api.md. A role mapped to None is exempt.
+DEFAULT_RULES = [
+    {"name": "login", "path": "/api/auth/token", "methods": ["POST"], "limit": 5, "period": 60, "key": "ip"},
+    {"name": "register", "path": "/api/auth/register", "methods": ["POST"], "limit": 5, "period": 60, "key": "ip"},
+    {"name": "chat", "path": "/api/chat/chat", "methods": ["POST"], "limit": 60, "period": 60, "key": "user",
+     "roles": {"admin": None}},
+    {"name": "chat_search", "path": "/api/chat/search", "methods": ["GET"], "limit": 60, "period": 60, "key": "user",
+     "roles": {"admin": None}},
+    {"name": "kb_search", "path": "/api/kb/search", "methods": ["POST"], "limit": 60, "period": 60, "key": "user",
+     "roles": {"admin": None}},
+    {"name": "api", "path": "/api/", "limit": 600, "period": 60, "key": "user", "roles": {"admin": None}},
+]
+
+@dataclass
+class RateLimitRule:
+    name: str
+    path: str
+    limit: int
+    period: float = 60.0
+    # "user" keys on the authenticated username (IP for anonymous requests), "ip" on the client address
+    key: str = "user"
+    methods: Optional[List[str]] = None
+    burst: Optional[int] = None
+    roles: Dict[str, Optional[int]] = field(default_factory=dict)
+
+    def matches(self, method: str, path: str) -> bool:
+        return path.startswith(self.path) and (not self.methods or method in self.methods)
+
+    def limit_for(self, role: Optional[str]) -> Optional[int]:
+        return self.roles[role] if role in self.roles else self.limit
+
+def load_rules() -> List[RateLimitRule]:
+    entries = json.loads(settings.RATE_LIMIT_RULES) if settings.RATE_LIMIT_RULES else DEFAULT_RULES
+    return [RateLimitRule(**entry) for entry in entries]
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI rate limiter. Every rule matching the request is checked in one
+    atomic call; the request is rejected with 429 if any of them is exhausted.
+    Responses carry RateLimit-Limit/-Remaining/-Reset headers for the most
+    constrained rule, plus Retry-After on rejection.
+
+    The caller's identity and role come from the bearer token's ``sub`` and
+    ``role`` claims, verified here without touching the database; invalid or
+    missing tokens are limited by client IP.
+    """
+
+    def __init__(self, app, rules: Optional[List[RateLimitRule]] = None, limiter: Optional[RateLimiter] = None):
+        self.app = app
+        self.rules = rules if rules is not None else load_rules()
+        self.limiter = limiter or RateLimiter()
+
+    @staticmethod
+    def _client_ip(scope) -> str:
+        if settings.RATE_LIMIT_TRUST_FORWARDED:
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    @staticmethod
+    def _identity(scope) -> Tuple[Optional[str], Optional[str]]:
+        claims = bearer_claims(scope["headers"])
+        if claims is None:
+            return None, None
+        # Tokens issued before the role claim existed count as regular users
+        return claims.get("sub"), claims.get("role", "user")
+
+    def _limits(self, scope) -> List[Tuple[RateLimitRule, Limit]]:
+        method, path = scope["method"], scope["path"]
+        matching = [rule for rule in self.rules if rule.matches(method, path)]
+        if not matching:
+            return []
+        username, role = self._identity(scope)
+        ip = self._client_ip(scope)
+        limits = []
+        for rule in matching:
+            limit = rule.limit_for(role)
+            if limit is None:
+                continue
+            identity = f"user:{username}" if rule.key == "user" and username else f"ip:{ip}"
+            limits.append((rule, Limit(f"{rule.name}:{identity}", limit, rule.period, rule.burst)))
+        return limits
+
+    @staticmethod
+    def _headers(rule: RateLimitRule, limit: Limit, decision: Decision) -> List[Tuple[bytes, bytes]]:
+        headers = [
+            (b"ratelimit-limit", str(limit.limit).encode()),
+            (b"ratelimit-remaining", str(max(decision.remaining, 0)).encode()),
+            (b"ratelimit-reset", str(max(0, int(decision.reset + 0.999))).encode()),
+            (b"ratelimit-policy", f"{limit.limit};w={int(rule.period)}".encode()),
+        ]
+        if not decision.allowed:
+            headers.append((b"retry-after", str(max(1, int(decision.retry_after + 0.999))).encode()))
+        return headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        limits = self._limits(scope)
+        if not limits:
+            await self.app(scope, receive, send)
+            return
+
+        decisions = await self.limiter.check([limit for _, limit in limits])
+        # Report the rule closest to rejecting the caller
+        index = min(
+            range(len(decisions)),
+            key=lambda i: (decisions[i].allowed, decisions[i].remaining, -decisions[i].retry_after)
+        )
+        headers = self._headers(limits[index][0], limits[index][1], decisions[index])
+
+        if not decisions[index].allowed:
+            RATE_LIMIT_DECISIONS.labels("limited").inc()
+            body = json.dumps({"detail": "Too many requests"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": headers + [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        RATE_LIMIT_DECISIONS.labels("allowed").inc()
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message.get("headers", [])) + headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
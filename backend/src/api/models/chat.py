@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -44,14 +44,24 @@ class Message(MessageBase):
     class Config:
         orm_mode = True
 
+class MessageSearchResult(BaseModel):
+    message: Message
+    session_title: str
+    snippet: str
+    # [start, end) character offsets of the matches within snippet
+    highlights: List[Tuple[int, int]]
+
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[int] = None
     system_prompt: Optional[str] = None
     temperature: Optional[float] = None
     max_tokens: Optional[int] = None
+    # Set to False to always call the model instead of the response cache
+    use_cache: bool = True
 
 class ChatResponse(BaseModel):
     session_id: int
     message: Message
-    total_tokens: Optional[int]
\ No newline at end of file
+    total_tokens: Optional[int]
+    cached: bool = False
\ No newline at end of file
@@ -0,0 +1,61 @@
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field
+from datetime import datetime
+
+class DocumentCreate(BaseModel):
+    title: str = Field(..., min_length=1, max_length=255)
+    content: str = Field(..., min_length=1)
+    source: Optional[str] = Field(None, max_length=1024)
+    meta: Optional[Dict[str, Any]] = None
+
+class DocumentBatch(BaseModel):
+    documents: List[DocumentCreate] = Field(..., min_items=1, max_items=100)
+
+class Document(BaseModel):
+    id: int
+    title: str
+    source: Optional[str]
+    status: str
+    chunk_count: int
+    token_count: int
+    created_by: Optional[int]
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        orm_mode = True
+
+class IngestedDocument(BaseModel):
+    document: Document
+    # False when the content matched a document already in the knowledge base
+    created: bool
+
+class SearchRequest(BaseModel):
+    query: str = Field(..., min_length=1)
+    top_k: Optional[int] = Field(None, ge=1, le=50)
+    mode: str = Field("hybrid", regex="^(hybrid|vector|lexical)$")
+
+class SearchResult(BaseModel):
+    chunk_id: int
+    document_id: int
+    title: str
+    source: Optional[str]
+    content: str
+    score: float
+    vector_score: Optional[float]
+    lexical_score: Optional[float]
+
+class ImportJob(BaseModel):
+    id: str
+    status: str
+    created_at: datetime
+    files: int
+    skipped_files: int
+    failed_files: int
+    finished_files: int
+    documents: int
+    created: int
+    duplicates: int
+    chunks: int
+    seconds: float
+    errors: List[str]
@@ -1,136 +1,385 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
-from typing import List
+import json
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Sequence, Tuple
 from datetime import datetime
-from ..models.chat import ChatRequest, ChatResponse, Session, Message
+from ..models.chat import ChatRequest, ChatResponse, Session, Message, MessageSearchResult
 from ..utils.auth import get_current_active_user
 from ...core.database import get_db
-from ...repositories import SessionRepository, MessageRepository, StatisticsRepository
-from ...services.openai_service import OpenAIService
+from ...repositories import SessionRepository, MessageRepository, UnitOfWork
+from ...repositories.pagination import InvalidCursor, decode_cursor
+from ...services.openai_service import OpenAIService, OpenAIServiceError, get_openai_service
+from ...services.statistics_aggregator import stats_aggregator
+from ...services.context_builder import ChatContext, context_builder
+from ...services.tokens import count_tokens
+from ...services.summarizer import summarizer
+from ...services.response_cache import response_cache, prompt_fingerprint
+from ...services.single_flight import single_flight
+from ...services.knowledge_base import knowledge_base, format_knowledge
+from ...services.message_search import message_search
+from ...services.session_cache import HotSession, session_cache
 from ...config import settings
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def _first_set(*values):
+    """Like ``a or b`` but keeps an explicit temperature of 0"""
+    return next((value for value in values if value is not None), None)
+
+async def _get_session(session_id: int, current_user, session_repo: SessionRepository,
+                       message_repo: MessageRepository):
+    """The user's session and, when the session cache is available, its newest messages"""
+    hot = await session_cache.get(session_id, session_repo, message_repo)
+    session = hot.session if hot else await session_repo.get(session_id)
+    if not session or session.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session, hot
+
+async def _get_or_create_session(chat_request: ChatRequest, current_user, session_repo: SessionRepository,
+                                 message_repo: MessageRepository):
+    if chat_request.session_id:
+        return await _get_session(chat_request.session_id, current_user, session_repo, message_repo)
+
+    # Create new session
+    session = await session_repo.create({
+        "user_id": current_user.id,
+        "title": chat_request.message[:50] + "...",
+        "system_prompt": chat_request.system_prompt,
+        "temperature": _first_set(chat_request.temperature, settings.TEMPERATURE),
+        "max_tokens": chat_request.max_tokens or settings.MAX_TOKENS
+    })
+    # Nothing to read back: it has no history yet
+    return session, HotSession(session, [], complete=True)
+
+async def _retrieve_knowledge(db: AsyncSession, openai_service: OpenAIService,
+                              query: str) -> Tuple[Optional[str], Optional[Sequence[float]]]:
+    """
+    Knowledge base passages for the prompt, and the query's embedding for the
+    semantic response cache to reuse; a failed lookup only costs the
+    grounding. Called before the request touches the database so no pooled
+    connection waits on the query embedding.
+    """
+    if not settings.KB_ENABLED:
+        return None, None
+    try:
+        passages = await knowledge_base.retrieve(db, openai_service, query)
+    except Exception as e:
+        logger.warning("Answering without knowledge base passages: %s", e)
+        return None, knowledge_base.query_vector(query)
+    return format_knowledge(passages, settings.KB_MAX_CONTEXT_TOKENS), knowledge_base.query_vector(query)
+
+async def _build_context(session, hot: Optional[HotSession], chat_request: ChatRequest,
+                         message_repo: MessageRepository, max_tokens: int,
+                         knowledge: Optional[str] = None) -> ChatContext:
+    # The new user message is not persisted until the turn completes
+    return await context_builder.build(
+        message_repo,
+        session.id,
+        chat_request.system_prompt or session.system_prompt,
+        chat_request.message,
+        completion_tokens=max_tokens,
+        summary=session.summary,
+        summary_tokens=session.summary_tokens,
+        summary_message_id=session.summary_message_id,
+        knowledge=knowledge,
+        cached=hot
+    )
+
+async def _record_turn(db: AsyncSession, request: Request, session, current_user, context: ChatContext,
+                       user_content: str, content: str, completion_tokens: int, total_tokens: int,
+                       start_time: datetime):
+    """Persist both messages and the session counters in one transaction"""
+    end_time = datetime.utcnow()
+    response_time = int((end_time - start_time).total_seconds() * 1000)
+
+    async with UnitOfWork(db) as uow:
+        await uow.messages.create_message(
+            session_id=session.id,
+            user_id=current_user.id,
+            role="user",
+            content=user_content,
+            tokens=context.user_tokens,
+            client_info=str(request.headers.get("user-agent")),
+            ip_address=request.client.host
+        )
+        assistant_message = await uow.messages.create_message(
+            session_id=session.id,
+            user_id=current_user.id,
+            role="assistant",
+            content=content,
+            tokens=completion_tokens,
+            response_time=response_time
+        )
+        await uow.messages.set_token_counts(context.uncounted)
+
+        # Update session
+        await uow.sessions.record_messages(session.id, 2, end_time)
+
+    # Compact older turns in the background once the history grows
+    summarizer.schedule(session.id, context)
+
+    # Update statistics off the request path
+    stats_aggregator.record(
+        current_user.id,
+        end_time.date(),
+        chat_count=1,
+        message_count=2,
+        response_time_sum=response_time,
+        response_count=1,
+        token_usage=total_tokens
+    )
+    return assistant_message
+
+async def _record_failed_turn(db: AsyncSession, request: Request, session, current_user,
+                              context: ChatContext, user_content: str):
+    """Keep the user's message and count the error when the upstream call fails"""
+    async with UnitOfWork(db) as uow:
+        await uow.messages.create_message(
+            session_id=session.id,
+            user_id=current_user.id,
+            role="user",
+            content=user_content,
+            tokens=context.user_tokens,
+            client_info=str(request.headers.get("user-agent")),
+            ip_address=request.client.host
+        )
+        await uow.sessions.record_messages(session.id, 1, datetime.utcnow())
+    stats_aggregator.record(current_user.id, datetime.utcnow().date(), error_count=1)
+
+def _flight_key(openai_service: OpenAIService, context: ChatContext, temperature: float,
+                max_tokens: int) -> Optional[str]:
+    """Identical deterministic requests in flight at the same time share one upstream call"""
+    if not single_flight.eligible(temperature):
+        return None
+    return prompt_fingerprint(openai_service.model, context.messages, temperature, max_tokens)
+
+async def _complete(openai_service: OpenAIService, context: ChatContext, temperature: float, max_tokens: int):
+    """Return ``(response, shared)``; a shared response was paid for by another request"""
+    def call():
+        return openai_service.create_chat_completion(
+            messages=context.messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    key = _flight_key(openai_service, context, temperature, max_tokens)
+    if key is None:
+        return await call(), False
+    return await single_flight.do(key, call)
+
+def _stream(openai_service: OpenAIService, context: ChatContext, temperature: float, max_tokens: int):
+    """Return ``(deltas, shared)``, fanning out one upstream stream to identical requests"""
+    def call():
+        return openai_service.create_streaming_chat_completion(
+            messages=context.messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    key = _flight_key(openai_service, context, temperature, max_tokens)
+    if key is None:
+        return call(), False
+    return single_flight.stream(key, call)
+
+def _bypass_cache(request: Request, chat_request: ChatRequest) -> bool:
+    cache_control = request.headers.get("cache-control", "").lower()
+    return not chat_request.use_cache or "no-cache" in cache_control or "no-store" in cache_control
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(
     request: Request,
     chat_request: ChatRequest,
     current_user = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    openai_service: OpenAIService = Depends(get_openai_service)
 ):
     session_repo = SessionRepository(db)
     message_repo = MessageRepository(db)
-    stats_repo = StatisticsRepository(db)
+    knowledge, query_embedding = await _retrieve_knowledge(db, openai_service, chat_request.message)
     
     # Get or create session
-    session = None
-    if chat_request.session_id:
-        session = session_repo.get(chat_request.session_id)
-        if not session or session.user_id != current_user.id:
-            raise HTTPException(status_code=404, detail="Session not found")
+    session, hot = await _get_or_create_session(chat_request, current_user, session_repo, message_repo)
     
-    if not session:
-        # Create new session
-        session = session_repo.create({
-            "user_id": current_user.id,
-            "title": chat_request.message[:50] + "...",
-            "system_prompt": chat_request.system_prompt,
-            "temperature": chat_request.temperature or settings.TEMPERATURE,
-            "max_tokens": chat_request.max_tokens or settings.MAX_TOKENS
-        })
+    temperature = _first_set(chat_request.temperature, session.temperature, settings.TEMPERATURE)
+    max_tokens = chat_request.max_tokens or session.max_tokens or settings.MAX_TOKENS
+    context = await _build_context(session, hot, chat_request, message_repo, max_tokens, knowledge)
+
+    # End the read transaction so the pooled connection is not held while
+    # waiting on the upstream model
+    await db.commit()
     
-    # Create user message
     start_time = datetime.utcnow()
-    user_message = message_repo.create_message(
-        session_id=session.id,
-        user_id=current_user.id,
-        role="user",
-        content=chat_request.message,
-        client_info=str(request.headers.get("user-agent")),
-        ip_address=request.client.host
+    lookup = await response_cache.lookup(
+        openai_service, context.messages, temperature, max_tokens,
+        bypass=_bypass_cache(request, chat_request), embedding=query_embedding
+    )
+    shared = False
+    if lookup and lookup.response:
+        response = lookup.response
+    else:
+        # Get chat completion from OpenAI
+        try:
+            response, shared = await _complete(openai_service, context, temperature, max_tokens)
+        except Exception as e:
+            # Update statistics for error
+            await _record_failed_turn(db, request, session, current_user, context, chat_request.message)
+            if isinstance(e, OpenAIServiceError):
+                raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
+            raise HTTPException(status_code=500, detail=str(e))
+        if lookup and not shared:
+            await response_cache.store(lookup, response)
+
+    # Cached and shared replies spend no upstream tokens of their own
+    cached = response.get("cached", False)
+    usage = response["tokens"]
+    total_tokens = 0 if cached or shared else usage["total_tokens"]
+    assistant_message = await _record_turn(
+        db, request, session, current_user, context, chat_request.message,
+        response["content"], usage["completion_tokens"], total_tokens, start_time
     )
     
-    # Get chat completion from OpenAI
-    openai_service = OpenAIService()
-    system_prompt = chat_request.system_prompt or session.system_prompt
-    temperature = chat_request.temperature or session.temperature or settings.TEMPERATURE
+    return ChatResponse(
+        session_id=session.id,
+        message=assistant_message,
+        total_tokens=total_tokens,
+        cached=cached
+    )
+
+def _sse_event(data: dict) -> str:
+    return f"data: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(
+    request: Request,
+    chat_request: ChatRequest,
+    current_user = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+    openai_service: OpenAIService = Depends(get_openai_service)
+):
+    """
+    Server-sent events variant of /chat.
+
+    Emits ``{"type": "session"}`` first, one ``{"type": "delta"}`` event per
+    token chunk, then ``{"type": "done"}`` carrying the persisted assistant
+    message (or ``{"type": "error"}`` if the upstream call fails).
+    """
+    session_repo = SessionRepository(db)
+    message_repo = MessageRepository(db)
+    knowledge, query_embedding = await _retrieve_knowledge(db, openai_service, chat_request.message)
+
+    session, hot = await _get_or_create_session(chat_request, current_user, session_repo, message_repo)
+
+    temperature = _first_set(chat_request.temperature, session.temperature, settings.TEMPERATURE)
     max_tokens = chat_request.max_tokens or session.max_tokens or settings.MAX_TOKENS
-    
-    # Get chat history
-    history = message_repo.get_session_messages(session.id)
-    messages = [{"role": msg.role, "content": msg.content} for msg in history[-5:]]
-    if system_prompt:
-        messages.insert(0, {"role": "system", "content": system_prompt})
-    
-    try:
-        response = await openai_service.get_chat_completion(
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens
+    context = await _build_context(session, hot, chat_request, message_repo, max_tokens, knowledge)
+    await db.commit()
+    bypass = _bypass_cache(request, chat_request)
+
+    async def event_stream():
+        yield _sse_event({"type": "session", "session_id": session.id})
+
+        start_time = datetime.utcnow()
+        lookup = await response_cache.lookup(
+            openai_service, context.messages, temperature, max_tokens, bypass=bypass, embedding=query_embedding
         )
-        
-        # Create assistant message
-        end_time = datetime.utcnow()
-        response_time = int((end_time - start_time).total_seconds() * 1000)
-        
-        assistant_message = message_repo.create_message(
-            session_id=session.id,
-            user_id=current_user.id,
-            role="assistant",
-            content=response.content,
-            tokens=response.total_tokens,
-            response_time=response_time
+        if lookup and lookup.response:
+            # Replay a cached reply as a single delta
+            content = lookup.response["content"]
+            yield _sse_event({"type": "delta", "content": content})
+            assistant_message = await _record_turn(
+                db, request, session, current_user, context, chat_request.message,
+                content, lookup.response["tokens"]["completion_tokens"], 0, start_time
+            )
+            yield _sse_event({
+                "type": "done",
+                "session_id": session.id,
+                "message": Message.from_orm(assistant_message),
+                "total_tokens": 0,
+                "cached": True
+            })
+            return
+
+        chunks = []
+        deltas, shared = _stream(openai_service, context, temperature, max_tokens)
+        try:
+            async for delta in deltas:
+                chunks.append(delta)
+                yield _sse_event({"type": "delta", "content": delta})
+        except Exception as e:
+            await _record_failed_turn(db, request, session, current_user, context, chat_request.message)
+            status = e.status_code if isinstance(e, OpenAIServiceError) else 500
+            retry_after = e.retry_after if isinstance(e, OpenAIServiceError) else None
+            yield _sse_event({"type": "error", "error": str(e), "status": status, "retry_after": retry_after})
+            return
+
+        # The stream API does not report usage, so count the reply locally
+        content = "".join(chunks)
+        completion_tokens = count_tokens(content)
+        total_tokens = 0 if shared else context.prompt_tokens + completion_tokens
+        if lookup and not shared:
+            await response_cache.store(lookup, {
+                "content": content,
+                "role": "assistant",
+                "tokens": {
+                    "prompt_tokens": context.prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": context.prompt_tokens + completion_tokens
+                }
+            })
+        assistant_message = await _record_turn(
+            db, request, session, current_user, context, chat_request.message,
+            content, completion_tokens, total_tokens, start_time
         )
-        
-        # Update session
-        session_repo.update(session.id, {
-            "message_count": session.message_count + 2,
-            "last_message_time": end_time
+        yield _sse_event({
+            "type": "done",
+            "session_id": session.id,
+            "message": Message.from_orm(assistant_message),
+            "total_tokens": total_tokens,
+            "cached": False
         })
-        
-        # Update statistics
-        stats_repo.update_daily_stats(
-            user_id=current_user.id,
-            stats_date=datetime.utcnow().date(),
-            chat_count=1,
-            message_count=2,
-            avg_response_time=response_time,
-            token_usage=response.total_tokens
-        )
-        
-        return ChatResponse(
-            session_id=session.id,
-            message=assistant_message,
-            total_tokens=response.total_tokens
-        )
-        
-    except Exception as e:
-        # Update statistics for error
-        stats_repo.update_daily_stats(
-            user_id=current_user.id,
-            stats_date=datetime.utcnow().date(),
-            error_count=1
-        )
-        raise HTTPException(status_code=500, detail=str(e))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _set_next_cursor(response: Response, items: list, limit: int, cursor_for):
+    """A full page may have more after it; hand the client a cursor for it"""
+    if items and len(items) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_for(items[-1])
 
 @router.get("/sessions", response_model=List[Session])
 async def list_sessions(
+    response: Response,
     skip: int = 0,
     limit: int = 20,
+    cursor: Optional[str] = None,
     current_user = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
+    """Pass the X-Next-Cursor header of a page as ``cursor`` to fetch the next one"""
     session_repo = SessionRepository(db)
-    return session_repo.get_user_sessions(current_user.id, skip, limit)
+    try:
+        sessions = await session_repo.get_user_sessions(current_user.id, skip, limit, cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    _set_next_cursor(response, sessions, limit, session_repo.cursor_for)
+    return sessions
 
 @router.get("/sessions/{session_id}", response_model=Session)
 async def get_session(
     session_id: int,
     current_user = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     session_repo = SessionRepository(db)
-    session = session_repo.get(session_id)
+    session = await session_repo.get(session_id)
     if not session or session.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Session not found")
     return session
@@ -138,30 +387,61 @@ async def get_session(
 @router.get("/sessions/{session_id}/messages", response_model=List[Message])
 async def list_session_messages(
     session_id: int,
+    response: Response,
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = None,
     current_user = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
+    """Pass the X-Next-Cursor header of a page as ``cursor`` to fetch the next one"""
     session_repo = SessionRepository(db)
     message_repo = MessageRepository(db)
-    
-    session = session_repo.get(session_id)
-    if not session or session.user_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Session not found")
-        
-    return message_repo.get_session_messages(session_id, skip, limit)
+    _, hot = await _get_session(session_id, current_user, session_repo, message_repo)
+
+    try:
+        # Recent pages of an active session come from the session cache
+        messages = hot.page(skip, limit, decode_cursor(cursor) if cursor else None) if hot else None
+        if messages is None:
+            messages = await message_repo.get_session_messages(session_id, skip, limit, cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    _set_next_cursor(response, messages, limit, message_repo.cursor_for)
+    return messages
+
+@router.get("/search", response_model=List[MessageSearchResult])
+async def search_messages(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    session_id: Optional[int] = None,
+    current_user = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    The user's messages containing every word of ``q``, newest first, with a
+    highlighted snippet. Pass the X-Next-Cursor header of a page as
+    ``cursor`` to fetch the next one.
+    """
+    try:
+        hits = await message_search.search(db, current_user.id, q, limit, cursor, session_id)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    _set_next_cursor(response, hits, limit, lambda hit: MessageRepository.cursor_for(hit.message))
+    return [MessageSearchResult(message=Message.from_orm(hit.message), session_title=hit.session_title,
+                                snippet=hit.snippet, highlights=hit.highlights) for hit in hits]
 
 @router.post("/sessions/{session_id}/archive")
 async def archive_session(
     session_id: int,
     current_user = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     session_repo = SessionRepository(db)
-    session = session_repo.get(session_id)
+    session = await session_repo.get(session_id)
     if not session or session.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Session not found")
         
-    session_repo.archive_session(session_id)
+    await session_repo.archive_session(session_id)
     return {"status": "success"}
\ No newline at end of file
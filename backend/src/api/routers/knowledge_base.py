@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import List
+from ..models.knowledge_base import (
+    DocumentBatch, Document, IngestedDocument, ImportJob, SearchRequest, SearchResult
+)
+from ..utils.auth import get_current_active_user, get_current_admin_user
+from ...core.database import get_db
+from ...repositories import KnowledgeDocumentRepository
+from ...services.openai_service import OpenAIService, OpenAIServiceError, get_openai_service
+from ...services.knowledge_base import knowledge_base
+from ...services.document_parsers import is_supported
+from ...services.ingestion import import_jobs
+
+router = APIRouter()
+
+@router.post("/documents", response_model=List[IngestedDocument])
+async def ingest_documents(
+    batch: DocumentBatch,
+    current_user = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db),
+    openai_service: OpenAIService = Depends(get_openai_service)
+):
+    """Chunk, embed and index a batch of documents; results are in request order"""
+    try:
+        results = await knowledge_base.ingest(
+            db, openai_service, [document.dict() for document in batch.documents], user_id=current_user.id
+        )
+    except OpenAIServiceError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
+    return [IngestedDocument(document=Document.from_orm(r.document), created=r.created) for r in results]
+
+def _save_upload(upload: UploadFile, path: str):
+    with open(path, "wb") as f:
+        shutil.copyfileobj(upload.file, f, 1024 * 1024)
+
+@router.post("/imports", response_model=ImportJob, status_code=202)
+async def import_files(
+    files: List[UploadFile] = File(...),
+    current_user = Depends(get_current_admin_user),
+    openai_service: OpenAIService = Depends(get_openai_service)
+):
+    """
+    Ingest uploaded PDF, Markdown, HTML, CSV or text files in the background.
+    Poll GET /imports/{id} for progress.
+    """
+    names = [os.path.basename(upload.filename or "") for upload in files]
+    unsupported = [name for name in names if not is_supported(name)]
+    if unsupported:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {', '.join(unsupported)}")
+
+    directory = tempfile.mkdtemp(prefix="zhida-kb-import-")
+    sources = {}
+    try:
+        for number, (upload, name) in enumerate(zip(files, names)):
+            # Numbered so uploads sharing a name do not overwrite each other
+            path = os.path.join(directory, f"{number:05d}-{name}")
+            await run_in_threadpool(_save_upload, upload, path)
+            sources[path] = name
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return await import_jobs.start(knowledge_base, openai_service, directory, sources, current_user.id)
+
+@router.get("/imports/{job_id}", response_model=ImportJob)
+async def get_import(job_id: str, current_user = Depends(get_current_admin_user)):
+    job = await import_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return job
+
+@router.get("/documents", response_model=List[Document])
+async def list_documents(
+    skip: int = 0,
+    limit: int = 50,
+    current_user = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    return await KnowledgeDocumentRepository(db).list_live(skip, limit)
+
+@router.delete("/documents/{document_id}")
+async def delete_document(
+    document_id: int,
+    current_user = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if not await knowledge_base.delete(db, document_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"status": "success"}
+
+@router.post("/search", response_model=List[SearchResult])
+async def search(
+    search_request: SearchRequest,
+    current_user = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+    openai_service: OpenAIService = Depends(get_openai_service)
+):
+    """The passages chat would be grounded on for this query (in hybrid mode), best first"""
+    try:
+        passages = await knowledge_base.retrieve(
+            db, openai_service, search_request.query, search_request.top_k, mode=search_request.mode
+        )
+    except OpenAIServiceError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
+    return [SearchResult(**vars(passage)) for passage in passages]
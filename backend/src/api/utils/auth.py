@@ -1,16 +1,16 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from ...repositories import UserRepository
+from ...services.user_cache import user_cache
+from ...services.password_hasher import pwd_context, password_hasher, PasswordHasherBusy
 from ...core.database import get_db
 from ...config import settings
 from ..models.auth import TokenData
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 def get_password_hash(password: str) -> str:
@@ -19,6 +19,30 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+def _hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many concurrent authentication requests",
+        headers={"Retry-After": "1"},
+    )
+
+async def hash_password_async(password: str) -> str:
+    """get_password_hash on the password worker pool"""
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    verify_password on the password worker pool. Also returns a replacement
+    hash when the stored one was made with outdated parameters.
+    """
+    try:
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -29,7 +53,23 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def bearer_claims(headers) -> Optional[dict]:
+    """
+    Verified claims of the bearer token in raw ASGI ``headers``, or None.
+    For middleware, which runs before dependencies and must not touch the DB.
+    """
+    for name, value in headers:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            except JWTError:
+                return None
+    return None
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -44,13 +84,20 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
 
-    user_repository = UserRepository(db)
-    user = user_repository.get_by_username(username=token_data.username)
+    user = await user_cache.get(token_data.username)
     if user is None:
-        raise credentials_exception
+        user_repository = UserRepository(db)
+        user = await user_repository.get_by_username(username=token_data.username)
+        if user is None:
+            raise credentials_exception
+        await user_cache.set(user)
     return user
 
 async def get_current_active_user(current_user = Depends(get_current_user)):
     if current_user.status != 'active':
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user
\ No newline at end of file
+    return current_user
+async def get_current_admin_user(current_user = Depends(get_current_active_user)):
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+    return current_user
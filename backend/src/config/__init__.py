@@ -8,25 +8,174 @@ class Settings(BaseSettings):
     DB_USER: str = "root"
     DB_PASSWORD: str = ""
     DB_NAME: str = "c2"
+    # Full async SQLAlchemy URL overriding the DB_* settings above,
+    # e.g. sqlite+aiosqlite:///./bench.db for benchmarks
+    DATABASE_URL: Optional[str] = None
     DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    # Log statements slower than this (0 disables)
+    SLOW_QUERY_THRESHOLD_MS: float = 200.0
+
+    # Statistics aggregation
+    STATS_FLUSH_INTERVAL: float = 5.0
+    STATS_FLUSH_MAX_PENDING: int = 500
+    # Rows kept across failed flushes before further ones are dropped
+    STATS_MAX_BUFFERED: int = 50000
 
     # Redis settings
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
     REDIS_PASSWORD: Optional[str] = None
+    REDIS_ENABLED: bool = True
+    REDIS_SOCKET_TIMEOUT: float = 0.5
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_RETRY_INTERVAL: float = 30.0
+
+    # Production server (serve.py)
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    # 0 starts one worker per CPU
+    SERVER_WORKERS: int = 0
+    SERVER_KEEPALIVE: int = 5
+    SERVER_BACKLOG: int = 2048
+    # Per-worker cap on concurrent connections before answering 503 (0 disables)
+    SERVER_LIMIT_CONCURRENCY: int = 0
+    # Seconds to let in-flight requests and streams finish after SIGTERM
+    SERVER_GRACEFUL_TIMEOUT: float = 30.0
+    SERVER_ACCESS_LOG: bool = False
+
+    # Metrics
+    METRICS_LOOP_LAG_INTERVAL: float = 0.5
+
+    # Request profiling: a sampled fraction of requests, plus admin requests sending PROFILE_HEADER
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_HEADER: str = "X-Profile"
+    PROFILE_DIR: str = "profiles"
+
+    # API rate limiting
+    RATE_LIMIT_ENABLED: bool = True
+    # JSON list of rules; empty uses the defaults in api/middleware/rate_limit.py
+    RATE_LIMIT_RULES: str = ""
+    # Take the client address from X-Forwarded-For (only behind a trusted proxy)
+    RATE_LIMIT_TRUST_FORWARDED: bool = False
 
     # JWT settings
     SECRET_KEY: str = "your-secret-key"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # Password hashing
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+
+    # Authenticated user cache
+    USER_CACHE_TTL: int = 60
+    USER_CACHE_MAXSIZE: int = 10000
+
     # OpenAI settings
     OPENAI_API_KEY: str
+    OPENAI_API_BASE: str = "https://api.openai.com/v1"
     OPENAI_MODEL: str = "gpt-3.5-turbo"
+    OPENAI_EMBEDDING_MODEL: str = "text-embedding-3-small"
+    OPENAI_TIMEOUT: float = 60.0
+    OPENAI_CONNECT_TIMEOUT: float = 5.0
+    OPENAI_MAX_CONNECTIONS: int = 100
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    OPENAI_KEEPALIVE_EXPIRY: float = 30.0
+    OPENAI_MAX_CONCURRENCY: int = 50
+    # Provider budgets per minute (0 disables the limit)
+    OPENAI_RPM_LIMIT: int = 3500
+    OPENAI_TPM_LIMIT: int = 90000
+    # Longest a call may wait for budget or a free slot before being rejected
+    OPENAI_ADMISSION_TIMEOUT: float = 10.0
+    OPENAI_MAX_RETRIES: int = 3
+    OPENAI_RETRY_BASE_DELAY: float = 0.5
+    OPENAI_RETRY_MAX_DELAY: float = 8.0
+    OPENAI_BREAKER_FAILURE_THRESHOLD: int = 5
+    OPENAI_BREAKER_RESET_TIMEOUT: float = 30.0
+    # JSON list of OpenAI-compatible endpoints, e.g.
+    # [{"name": "primary", "base_url": "...", "api_key": "...", "model": "...", "weight": 2}]
+    # Empty means a single provider built from the OPENAI_* settings above
+    OPENAI_PROVIDERS: str = ""
+    OPENAI_LATENCY_EWMA_ALPHA: float = 0.2
+    OPENAI_LATENCY_WINDOW: int = 200
+    # Send a backup request to another provider when one is slower than its p95
+    OPENAI_HEDGE_ENABLED: bool = True
+    OPENAI_HEDGE_QUANTILE: float = 0.95
+    OPENAI_HEDGE_MIN_DELAY: float = 2.0
+    OPENAI_HEDGE_MIN_SAMPLES: int = 20
     MAX_TOKENS: int = 2000
     TEMPERATURE: float = 0.7
 
+    # Prompt assembly
+    CONTEXT_WINDOW: int = 16385
+    CONTEXT_MAX_TOKENS: int = 3000
+    CONTEXT_MAX_MESSAGES: int = 50
+    CONTEXT_FETCH_BATCH: int = 10
+
+    # Rolling session summaries
+    SUMMARY_ENABLED: bool = True
+    SUMMARY_TRIGGER_MESSAGES: int = 20
+    SUMMARY_KEEP_RECENT: int = 6
+    SUMMARY_MIN_BATCH: int = 4
+    SUMMARY_MAX_BATCH: int = 40
+    SUMMARY_MAX_TOKENS: int = 500
+
+    # Hot-session cache: newest messages and prompt settings of active sessions
+    # in Redis, so chat turns and history reads skip the database
+    SESSION_CACHE_ENABLED: bool = True
+    SESSION_CACHE_MESSAGES: int = 50
+    SESSION_CACHE_TTL: int = 1800
+
+    # Response cache
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL: int = 3600
+    RESPONSE_CACHE_MAXSIZE: int = 10000
+    RESPONSE_CACHE_SEMANTIC_ENABLED: bool = False
+    RESPONSE_CACHE_SEMANTIC_MAXSIZE: int = 5000
+    RESPONSE_CACHE_SIMILARITY: float = 0.95
+
+    # Coalescing of identical in-flight completions
+    COALESCE_ENABLED: bool = True
+    COALESCE_MAX_TEMPERATURE: float = 0.0
+
+    # Message history search: "fulltext" (MySQL ngram index), "memory" (in-process
+    # index, for SQLite) or "auto" to pick by database
+    MESSAGE_SEARCH_BACKEND: str = "auto"
+
+    # Knowledge base retrieval for chat grounding
+    KB_ENABLED: bool = False
+    KB_INDEX_DIR: str = "kb_index"
+    KB_CHUNK_TOKENS: int = 300
+    KB_CHUNK_OVERLAP: int = 40
+    KB_EMBED_BATCH: int = 64
+    KB_EMBED_CONCURRENCY: int = 4
+    KB_TOP_K: int = 4
+    KB_MIN_SCORE: float = 0.3
+    KB_MAX_CONTEXT_TOKENS: int = 1200
+    KB_NPROBE: int = 8
+    KB_SYNC_INTERVAL: float = 5.0
+    KB_COMPACT_THRESHOLD: int = 20000
+    # Lexical (BM25) retrieval fused with the vector results. The tokenizer segments
+    # Chinese with jieba when installed ("auto"), or forces "jieba" or "bigram"
+    KB_LEXICAL_ENABLED: bool = True
+    KB_TOKENIZER: str = "auto"
+    # Optional jieba user dictionary of product names and other domain terms
+    KB_JIEBA_USER_DICT: str = ""
+    # Share of the query's term weight (idf) a chunk must contain to count as a lexical match
+    KB_LEXICAL_MIN_MATCH: float = 0.5
+    # Hits taken from each retriever for reciprocal rank fusion, and its rank constant
+    KB_FUSION_CANDIDATES: int = 20
+    KB_RRF_K: int = 60
+    # Bulk ingestion: parser processes (0 for one per CPU) and documents per embed/store batch
+    KB_INGEST_WORKERS: int = 0
+    KB_INGEST_BATCH: int = 256
+    # Parser processes per /api/kb/imports job; every API worker may run one, so keep it small
+    KB_IMPORT_WORKERS: int = 1
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -0,0 +1,253 @@
+import math
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Postings are appended uncompressed and encoded this many at a time
+BLOCK_SIZE = 128
+# Terms in more than this share of rows are skipped when the query has rarer
+# ones: their weight is close to zero and their postings are the longest
+MAX_DF_RATIO = 0.5
+
+def vbyte_encode(values: np.ndarray) -> bytes:
+    """Variable-byte code of non-negative integers: 7 bits per byte, low bits first, high bit set on all but the last"""
+    values = np.asarray(values, dtype=np.int64)
+    if not len(values):
+        return b""
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> 7
+    while rest.any():
+        lengths += rest > 0
+        rest >>= 7
+    if (lengths == 1).all():
+        return values.astype(np.uint8).tobytes()
+    starts = np.cumsum(lengths) - lengths
+    encoded = np.empty(int(lengths.sum()), dtype=np.uint8)
+    rest = values.copy()
+    for i in range(int(lengths.max())):
+        active = lengths > i
+        more = (lengths[active] > i + 1).astype(np.uint8) << 7
+        encoded[starts[active] + i] = (rest[active] & 0x7F).astype(np.uint8) | more
+        rest >>= 7
+    return encoded.tobytes()
+
+def vbyte_decode(data) -> np.ndarray:
+    raw = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(raw < 0x80)
+    if len(ends) == len(raw):
+        return raw.astype(np.int64)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    byte_starts = np.repeat(starts, ends - starts + 1)
+    parts = (raw & 0x7F).astype(np.int64) << ((np.arange(len(raw)) - byte_starts) * 7)
+    return np.add.reduceat(parts, starts)
+
+class _Postings:
+    """Rows containing one term, in ascending order, with the term's frequency in each"""
+
+    __slots__ = ("gaps", "tfs", "sealed", "last_sealed", "tail_rows", "tail_tfs")
+
+    def __init__(self):
+        # Sealed blocks: vbyte-coded gaps between rows and vbyte-coded frequencies
+        self.gaps = bytearray()
+        self.tfs = bytearray()
+        self.sealed = 0
+        self.last_sealed = 0
+        self.tail_rows: List[int] = []
+        self.tail_tfs: List[int] = []
+
+    def __len__(self) -> int:
+        return self.sealed + len(self.tail_rows)
+
+    def append(self, row: int, tf: int) -> int:
+        """Add a row above every row already present; returns the bytes newly encoded"""
+        self.tail_rows.append(row)
+        self.tail_tfs.append(tf)
+        if len(self.tail_rows) < BLOCK_SIZE:
+            return 0
+        rows = np.asarray(self.tail_rows, dtype=np.int64)
+        gaps = vbyte_encode(np.diff(rows, prepend=self.last_sealed))
+        tfs = vbyte_encode(np.asarray(self.tail_tfs, dtype=np.int64))
+        self.gaps += gaps
+        self.tfs += tfs
+        self.sealed += len(rows)
+        self.last_sealed = self.tail_rows[-1]
+        self.tail_rows, self.tail_tfs = [], []
+        return len(gaps) + len(tfs)
+
+    def decode(self) -> Tuple[np.ndarray, np.ndarray]:
+        rows = np.cumsum(vbyte_decode(self.gaps)) if self.sealed else np.zeros(0, dtype=np.int64)
+        tfs = vbyte_decode(self.tfs) if self.sealed else np.zeros(0, dtype=np.int64)
+        if self.tail_rows:
+            rows = np.concatenate([rows, np.asarray(self.tail_rows, dtype=np.int64)])
+            tfs = np.concatenate([tfs, np.asarray(self.tail_tfs, dtype=np.int64)])
+        return rows, tfs
+
+class BM25Index:
+    """
+    In-memory BM25 inverted index over short texts keyed by integer id, each
+    belonging to a document that can be deleted as a whole.
+
+    Rows get consecutive internal numbers as they are added, so every
+    posting list only ever grows at its end: new postings collect in a small
+    uncompressed tail and are sealed BLOCK_SIZE at a time as vbyte-coded row
+    gaps and frequencies (about two bytes per posting). Queries decode the
+    lists of their terms with NumPy and score in bulk. Deletes are
+    document-level tombstones applied at query time; the rows stay in memory
+    until the index is rebuilt, which suits collections where deletes are
+    rare.
+    """
+
+    def __init__(self, tokenize: Callable[[str], List[str]], k1: float = 1.2, b: float = 0.75):
+        self.tokenize = tokenize
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._postings: Dict[str, _Postings] = {}
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._doc_ids = np.zeros(0, dtype=np.int64)
+        self._lengths = np.zeros(0, dtype=np.int32)
+        self._size = 0
+        self._total_length = 0
+        # Rows are usually added in id order, which keeps _ids searchable as it is
+        self._ids_sorted = True
+        self._sorted_ids: Optional[np.ndarray] = None
+        self._deleted = np.zeros(0, dtype=np.int64)
+        self._deleted_rows = 0
+        self._deleted_length = 0
+        self._encoded_bytes = 0
+
+    def __len__(self) -> int:
+        return self._size - self._deleted_rows
+
+    def _contains(self, ids: np.ndarray) -> np.ndarray:
+        if not self._size or not len(ids):
+            return np.zeros(len(ids), dtype=bool)
+        if self._ids_sorted:
+            known = self._ids[:self._size]
+        else:
+            if self._sorted_ids is None:
+                self._sorted_ids = np.sort(self._ids[:self._size])
+            known = self._sorted_ids
+        positions = np.minimum(np.searchsorted(known, ids), len(known) - 1)
+        return known[positions] == ids
+
+    def contains(self, ids: Sequence[int]) -> np.ndarray:
+        with self._lock:
+            return self._contains(np.asarray(ids, dtype=np.int64))
+
+    def _is_deleted(self, doc_ids: np.ndarray) -> np.ndarray:
+        deleted = self._deleted
+        if not len(deleted) or not len(doc_ids):
+            return np.zeros(len(doc_ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(deleted, doc_ids), len(deleted) - 1)
+        return deleted[positions] == doc_ids
+
+    def add(self, ids: Sequence[int], doc_ids: Sequence[int], texts: Sequence[str]) -> int:
+        """Index texts whose ids are not present yet; returns how many were added"""
+        ids = np.asarray(ids, dtype=np.int64)
+        new = np.flatnonzero(~self.contains(ids))
+        # Tokenising is the expensive part and needs no lock
+        counted = [Counter(self.tokenize(texts[i])) for i in new]
+
+        with self._lock:
+            # Another thread may have added some of them meanwhile
+            fresh = ~self._contains(ids[new])
+            new_ids = ids[new][fresh]
+            new_doc_ids = np.asarray(doc_ids, dtype=np.int64)[new][fresh]
+            counted = [terms for terms, keep in zip(counted, fresh) if keep]
+            lengths = np.asarray([sum(terms.values()) for terms in counted], dtype=np.int32)
+
+            size = self._size
+            needed = size + len(new_ids)
+            if needed > len(self._ids):
+                capacity = max(1024, needed, 2 * len(self._ids))
+                self._ids = np.resize(self._ids, capacity)
+                self._doc_ids = np.resize(self._doc_ids, capacity)
+                self._lengths = np.resize(self._lengths, capacity)
+            if len(new_ids) and ((size and new_ids[0] <= self._ids[size - 1]) or (np.diff(new_ids) <= 0).any()):
+                self._ids_sorted = False
+            self._ids[size:needed] = new_ids
+            self._doc_ids[size:needed] = new_doc_ids
+            self._lengths[size:needed] = lengths
+            self._sorted_ids = None
+
+            postings = self._postings
+            for row, terms in enumerate(counted, size):
+                for term, tf in terms.items():
+                    term_postings = postings.get(term)
+                    if term_postings is None:
+                        term_postings = postings[term] = _Postings()
+                    self._encoded_bytes += term_postings.append(row, tf)
+            self._size = needed
+            self._total_length += int(lengths.sum())
+            dead = self._is_deleted(new_doc_ids)
+            if dead.any():
+                self._deleted_rows += int(dead.sum())
+                self._deleted_length += int(lengths[dead].sum())
+        return len(new_ids)
+
+    def delete_documents(self, doc_ids: Sequence[int]):
+        doc_ids = np.setdiff1d(np.asarray(doc_ids, dtype=np.int64), self._deleted)
+        if not len(doc_ids):
+            return
+        with self._lock:
+            self._deleted = np.union1d(self._deleted, doc_ids)
+            hit = np.isin(self._doc_ids[:self._size], doc_ids)
+            self._deleted_rows += int(hit.sum())
+            self._deleted_length += int(self._lengths[:self._size][hit].sum())
+
+    def search(self, query: str, k: int, min_match: float = 0.0) -> List[Tuple[int, int, float]]:
+        """
+        Up to ``k`` ``(id, document_id, score)`` tuples, best first, of rows
+        holding at least ``min_match`` of the query's term weight (idf,
+        counting only terms that occur in the index).
+        """
+        query_terms = Counter(self.tokenize(query))
+        if not query_terms:
+            return []
+        with self._lock:
+            rows_live = self._size - self._deleted_rows
+            if not rows_live:
+                return []
+            average_length = max(1.0, (self._total_length - self._deleted_length) / rows_live)
+            found = [(len(self._postings[term]), count, self._postings[term])
+                     for term, count in query_terms.items() if term in self._postings]
+            if not found:
+                return []
+            rare = [entry for entry in found if entry[0] <= MAX_DF_RATIO * rows_live]
+            weights = [(count * math.log(1 + (rows_live - df + 0.5) / (df + 0.5)), postings.decode())
+                       for df, count, postings in (rare or found)]
+            lengths, doc_ids, ids = self._lengths, self._doc_ids, self._ids
+
+        total_weight = sum(weight for weight, _ in weights)
+        all_rows = np.concatenate([rows for _, (rows, _) in weights])
+        rows, inverse = np.unique(all_rows, return_inverse=True)
+        norms = self.k1 * (1 - self.b + self.b * lengths[rows] / average_length)
+        contributions, matched = [], []
+        start = 0
+        for weight, (term_rows, tfs) in weights:
+            end = start + len(term_rows)
+            tfs = tfs.astype(np.float64)
+            contributions.append(weight * tfs * (self.k1 + 1) / (tfs + norms[inverse[start:end]]))
+            matched.append(np.full(len(term_rows), weight))
+            start = end
+        scores = np.bincount(inverse, np.concatenate(contributions), minlength=len(rows))
+        keep = ~self._is_deleted(doc_ids[rows])
+        if min_match > 0:
+            keep &= np.bincount(inverse, np.concatenate(matched), minlength=len(rows)) >= min_match * total_weight
+        rows, scores = rows[keep], scores[keep]
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[rows[i]]), int(doc_ids[rows[i]]), float(scores[i])) for i in top]
+
+    def stats(self) -> dict:
+        return {
+            "rows": len(self),
+            "deleted_rows": self._deleted_rows,
+            "terms": len(self._postings),
+            "encoded_bytes": self._encoded_bytes,
+        }
@@ -0,0 +1,132 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from ..config import settings
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # redis-py < 4.2 has no asyncio client
+    aioredis = None
+    RedisError = Exception
+
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """In-process LRU cache with a per-entry TTL (not shared between workers)"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (value, time.monotonic() + (ttl if ttl is not None else self.ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+_redis = None
+# When Redis errors we stop trying for a while instead of paying a timeout per call
+_redis_retry_at = 0.0
+
+def get_redis():
+    """Return the shared Redis client, or None if Redis is disabled or recently failed"""
+    global _redis
+    if not settings.REDIS_ENABLED or aioredis is None:
+        return None
+    if time.monotonic() < _redis_retry_at:
+        return None
+    if _redis is None:
+        _redis = aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            password=settings.REDIS_PASSWORD,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            max_connections=settings.REDIS_MAX_CONNECTIONS
+        )
+    return _redis
+
+def mark_redis_failed(error: Exception):
+    global _redis_retry_at
+    logger.warning("Redis unavailable, using in-process fallback: %s", error)
+    _redis_retry_at = time.monotonic() + settings.REDIS_RETRY_INTERVAL
+
+async def close_redis():
+    global _redis
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
+
+class Cache:
+    """
+    Namespaced JSON cache stored in Redis so every worker sees the same
+    entries and invalidations. Falls back to an in-process LRUCache when
+    Redis is disabled or unreachable.
+    """
+
+    def __init__(self, namespace: str, ttl: int, maxsize: int = 10000):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def _key(self, key: str) -> str:
+        return f"zhida:{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        redis = get_redis()
+        if redis is not None:
+            try:
+                raw = await redis.get(self._key(key))
+                return json.loads(raw) if raw is not None else None
+            except RedisError as e:
+                mark_redis_failed(e)
+        # Stored serialised so callers can never mutate a cached value in place
+        raw = self.local.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        raw = json.dumps(value, default=str)
+        redis = get_redis()
+        if redis is not None:
+            try:
+                await redis.set(self._key(key), raw, ex=ttl or self.ttl)
+                return
+            except RedisError as e:
+                mark_redis_failed(e)
+        self.local.set(key, raw, ttl)
+
+    async def delete(self, *keys: str):
+        # Always clear the local copy too, in case it was filled during an outage
+        for key in keys:
+            self.local.delete(key)
+        redis = get_redis()
+        if redis is not None and keys:
+            try:
+                await redis.delete(*[self._key(key) for key in keys])
+            except RedisError as e:
+                mark_redis_failed(e)
@@ -1,31 +1,90 @@
-from sqlalchemy import create_engine
+import logging
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from ..config import settings
+from .metrics import DB_SLOW_QUERIES, current_repository_method, instrumented_pool
 
-SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{settings.DB_USER}:{settings.DB_PASSWORD}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
+logger = logging.getLogger(__name__)
 
+# Sync driver to pair with each supported async driver
+SYNC_DRIVERS = {"aiomysql": "pymysql", "aiosqlite": "pysqlite"}
+
+def sync_url(async_url: str) -> str:
+    scheme, sep, rest = async_url.partition("://")
+    dialect, _, driver = scheme.partition("+")
+    return f"{dialect}+{SYNC_DRIVERS.get(driver, driver)}{sep}{rest}" if driver else async_url
+
+if settings.DATABASE_URL:
+    ASYNC_SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
+    SQLALCHEMY_DATABASE_URL = sync_url(settings.DATABASE_URL)
+else:
+    SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{settings.DB_USER}:{settings.DB_PASSWORD}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
+    ASYNC_SQLALCHEMY_DATABASE_URL = f"mysql+aiomysql://{settings.DB_USER}:{settings.DB_PASSWORD}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
+
+# Synchronous engine for scripts and tooling that run outside the event loop
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     pool_pre_ping=True,
     pool_recycle=3600,
     pool_size=5,
     max_overflow=10,
-    echo=settings.DB_ECHO
+    echo=settings.DB_ECHO,
+    poolclass=instrumented_pool(QueuePool, "sync")
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine used by the API so DB round-trips never block the event loop
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    echo=settings.DB_ECHO,
+    poolclass=instrumented_pool(AsyncAdaptedQueuePool, "async")
+)
+
+# expire_on_commit=False keeps loaded attributes usable after commit without
+# an implicit (and, under asyncio, illegal) lazy refresh
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def log_slow_queries(engine: Engine, threshold_ms: float):
+    """Log statements slower than ``threshold_ms`` with the repository method that ran them"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _check_duration(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - context._query_started) * 1000
+        if elapsed_ms < threshold_ms:
+            return
+        method = current_repository_method.get() or "unknown"
+        DB_SLOW_QUERIES.labels(method).inc()
+        logger.warning(
+            "Slow query (%.1f ms) in %s%s: %s",
+            elapsed_ms, method, " [executemany]" if executemany else "", " ".join(statement.split())[:2000]
+        )
+
+if settings.SLOW_QUERY_THRESHOLD_MS > 0:
+    log_slow_queries(engine, settings.SLOW_QUERY_THRESHOLD_MS)
+    log_slow_queries(async_engine.sync_engine, settings.SLOW_QUERY_THRESHOLD_MS)
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 async def init_db():
     """Initialize database with required tables"""
     from src.models.base import Base
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
@@ -0,0 +1,414 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: compaction is then only safe from a single process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".lock"
+# Rows per batch when assigning, gathering and writing during compaction
+BATCH_ROWS = 16384
+# Below this many rows one list (an exact scan) is faster than clustering
+MIN_ROWS_PER_LIST = 4096
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+
+def normalise_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def choose_nlist(rows: int) -> int:
+    if rows < MIN_ROWS_PER_LIST:
+        return 1
+    return int(min(65536, max(2, round(np.sqrt(rows)))))
+
+def assign_lists(rows: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    if len(centroids) == 1:
+        return np.zeros(len(rows), dtype=np.int32)
+    assignments = np.empty(len(rows), dtype=np.int32)
+    for start in range(0, len(rows), BATCH_ROWS):
+        block = rows[start:start + BATCH_ROWS]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+def train_centroids(sample: np.ndarray, nlist: int, iterations: int = KMEANS_ITERATIONS,
+                    seed: int = 0) -> np.ndarray:
+    """Spherical k-means: centroids are unit vectors and rows join the most similar one"""
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(sample))
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_lists(sample, centroids)
+        order = np.argsort(assignments, kind="stable")
+        lists, starts = np.unique(assignments[order], return_index=True)
+        sums = np.zeros_like(centroids)
+        sums[lists] = np.add.reduceat(sample[order], starts, axis=0)
+        empty = np.setdiff1d(np.arange(nlist), lists)
+        if empty.size:
+            # Restart empty lists from random rows rather than losing them
+            sums[empty] = sample[rng.choice(len(sample), empty.size, replace=False)]
+        centroids = normalise_rows(sums)
+    return centroids
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if len(scores) <= k:
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+class Segment:
+    """
+    An immutable, memory-mapped generation of the index. Rows are stored
+    grouped by inverted list, so probing a list reads one contiguous slice of
+    vectors.npy; pages are shared between worker processes through the OS page
+    cache.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.path = path
+        self.generation: int = meta["generation"]
+        self.dim: int = meta["dim"]
+        self.count: int = meta["count"]
+        self.last_id: int = meta["last_id"]
+        self.trained_rows: int = meta["trained_rows"]
+        self.centroids = np.load(os.path.join(path, "centroids.npy"))
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        self.doc_ids = np.load(os.path.join(path, "doc_ids.npy"), mmap_mode="r")
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self._sorted_ids: Optional[np.ndarray] = None
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        if self._sorted_ids is None:
+            self._sorted_ids = np.sort(self.ids)
+        if not len(self._sorted_ids):
+            return np.zeros(len(ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(self._sorted_ids, ids), len(self._sorted_ids) - 1)
+        return self._sorted_ids[positions] == ids
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """``(ids, doc_ids, scores)`` of every row in the ``nprobe`` lists closest to the query"""
+        if not self.count:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.float32)
+        probes = _top_k(self.centroids @ query, min(nprobe, self.nlist))
+        ids, doc_ids, scores = [], [], []
+        for probe in np.sort(probes):
+            start, end = int(self.offsets[probe]), int(self.offsets[probe + 1])
+            if start == end:
+                continue
+            scores.append(self.vectors[start:end] @ query)
+            ids.append(self.ids[start:end])
+            doc_ids.append(self.doc_ids[start:end])
+        if not scores:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.float32)
+        return np.concatenate(ids), np.concatenate(doc_ids), np.concatenate(scores)
+
+class IVFIndex:
+    """
+    Cosine-similarity index over float32 vectors keyed by chunk id, for
+    collections up to millions of rows.
+
+    Searches probe the ``nprobe`` closest inverted lists of the current
+    memory-mapped Segment and scan the in-memory delta of rows added since it
+    was written. Deletes are document-level tombstones applied at query time.
+    compact() folds the delta and tombstones into a new generation on disk
+    (retraining the k-means centroids when the collection has doubled) and
+    atomically points CURRENT at it; other processes sharing the directory
+    pick it up on their next load().
+    """
+
+    def __init__(self, path: str, nprobe: int = 8):
+        self.path = path
+        self.nprobe = nprobe
+        self.segment: Optional[Segment] = None
+        self.dim: Optional[int] = None
+        self._lock = threading.Lock()
+        self._delta_vectors = np.zeros((0, 0), dtype=np.float32)
+        self._delta_ids = np.zeros(0, dtype=np.int64)
+        self._delta_doc_ids = np.zeros(0, dtype=np.int64)
+        self._delta_size = 0
+        self._deleted = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return (self.segment.count if self.segment else 0) + self._delta_size
+
+    @property
+    def delta_size(self) -> int:
+        return self._delta_size
+
+    @property
+    def last_id(self) -> int:
+        last = self.segment.last_id if self.segment else 0
+        if self._delta_size:
+            last = max(last, int(self._delta_ids[:self._delta_size].max()))
+        return last
+
+    def load(self) -> bool:
+        """Switch to the newest generation on disk; returns whether it changed"""
+        try:
+            with open(os.path.join(self.path, CURRENT_FILE)) as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return False
+        if self.segment is not None and os.path.basename(self.segment.path) == name:
+            return False
+        segment = Segment(os.path.join(self.path, name))
+        if self.dim is not None and segment.dim != self.dim:
+            raise ValueError(f"Index generation {name} has dimension {segment.dim}, expected {self.dim}")
+        with self._lock:
+            # Drop delta rows the new generation already holds, or left out as deleted
+            size = self._delta_size
+            keep = ~segment.contains(self._delta_ids[:size]) & ~self._is_deleted(self._delta_doc_ids[:size])
+            kept = int(keep.sum())
+            if kept < size:
+                self._delta_vectors[:kept] = self._delta_vectors[:size][keep]
+                self._delta_ids[:kept] = self._delta_ids[:size][keep]
+                self._delta_doc_ids[:kept] = self._delta_doc_ids[:size][keep]
+            self._delta_size = kept
+            self.segment = segment
+            self.dim = segment.dim
+        logger.info("Loaded vector index generation %s (%d rows, %d lists)", name, segment.count, segment.nlist)
+        return True
+
+    def contains(self, ids: Sequence[int]) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        found = np.isin(ids, self._delta_ids[:self._delta_size])
+        if self.segment is not None:
+            found |= self.segment.contains(ids)
+        return found
+
+    def add(self, ids: Sequence[int], doc_ids: Sequence[int], vectors) -> int:
+        """Add rows to the delta, skipping ids already indexed; returns how many were added"""
+        vectors = normalise_rows(np.atleast_2d(vectors))
+        if not len(vectors):
+            return 0
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}")
+        ids = np.asarray(ids, dtype=np.int64)
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        new = ~self.contains(ids)
+        ids, doc_ids, vectors = ids[new], doc_ids[new], vectors[new]
+
+        with self._lock:
+            size = self._delta_size
+            needed = size + len(ids)
+            if needed > len(self._delta_ids) or self._delta_vectors.shape[1] != self.dim:
+                # Grow into fresh arrays so concurrent searches keep a consistent view
+                capacity = max(1024, needed, 2 * len(self._delta_ids))
+                grown_vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+                grown_ids = np.zeros(capacity, dtype=np.int64)
+                grown_doc_ids = np.zeros(capacity, dtype=np.int64)
+                if size:
+                    grown_vectors[:size] = self._delta_vectors[:size]
+                    grown_ids[:size] = self._delta_ids[:size]
+                    grown_doc_ids[:size] = self._delta_doc_ids[:size]
+                self._delta_vectors, self._delta_ids, self._delta_doc_ids = grown_vectors, grown_ids, grown_doc_ids
+            self._delta_vectors[size:needed] = vectors
+            self._delta_ids[size:needed] = ids
+            self._delta_doc_ids[size:needed] = doc_ids
+            self._delta_size = needed
+        return len(ids)
+
+    def delete_documents(self, doc_ids: Sequence[int]):
+        if len(doc_ids):
+            self._deleted = np.union1d(self._deleted, np.asarray(doc_ids, dtype=np.int64))
+
+    def _is_deleted(self, doc_ids: np.ndarray) -> np.ndarray:
+        deleted = self._deleted
+        if not len(deleted) or not len(doc_ids):
+            return np.zeros(len(doc_ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(deleted, doc_ids), len(deleted) - 1)
+        return deleted[positions] == doc_ids
+
+    def search(self, vector, k: int, nprobe: Optional[int] = None) -> List[Tuple[int, int, float]]:
+        """Up to ``k`` ``(chunk_id, document_id, similarity)`` tuples, most similar first"""
+        if self.dim is None:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        if query.shape[0] != self.dim:
+            return []
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        with self._lock:
+            segment, size = self.segment, self._delta_size
+            delta_vectors, delta_ids, delta_doc_ids = self._delta_vectors, self._delta_ids, self._delta_doc_ids
+
+        parts = []
+        if segment is not None:
+            parts.append(segment.candidates(query, nprobe or self.nprobe))
+        if size:
+            parts.append((delta_ids[:size], delta_doc_ids[:size], delta_vectors[:size] @ query))
+        if not parts:
+            return []
+        ids = np.concatenate([p[0] for p in parts])
+        doc_ids = np.concatenate([p[1] for p in parts])
+        scores = np.concatenate([p[2] for p in parts])
+        live = ~self._is_deleted(doc_ids)
+        ids, doc_ids, scores = ids[live], doc_ids[live], scores[live]
+        return [(int(ids[i]), int(doc_ids[i]), float(scores[i])) for i in _top_k(scores, k)]
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[bool]:
+        """Cross-process compaction lock; yields False if another process holds it"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOCK_FILE), "a") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+            try:
+                yield True
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def compact(self) -> bool:
+        """Write delta and tombstones into a new generation; returns False if nothing was written"""
+        with self._exclusive() as acquired:
+            if not acquired:
+                return False
+            # Another process may have compacted since this one last looked
+            self.load()
+            if self.dim is None:
+                return False
+            started = time.monotonic()
+            name = self._write_generation()
+            self.load()
+        self._remove_old_generations(name)
+        logger.info("Compacted vector index into %s in %.1fs", name, time.monotonic() - started)
+        return True
+
+    def _write_generation(self) -> str:
+        with self._lock:
+            segment, size = self.segment, self._delta_size
+            delta_vectors = self._delta_vectors[:size]
+            delta_ids = self._delta_ids[:size]
+            delta_doc_ids = self._delta_doc_ids[:size]
+
+        main_rows = np.zeros(0, dtype=np.int64)
+        if segment is not None:
+            main_rows = np.flatnonzero(~self._is_deleted(np.asarray(segment.doc_ids)))
+        delta_rows = np.flatnonzero(~self._is_deleted(delta_doc_ids))
+        n_main, total = len(main_rows), len(main_rows) + len(delta_rows)
+
+        def gather(positions: np.ndarray) -> np.ndarray:
+            """Rows by position in the concatenation of kept main rows then kept delta rows"""
+            rows = np.empty((len(positions), self.dim), dtype=np.float32)
+            from_main = positions < n_main
+            if from_main.any():
+                rows[from_main] = segment.vectors[main_rows[positions[from_main]]]
+            if (~from_main).any():
+                rows[~from_main] = delta_vectors[delta_rows[positions[~from_main] - n_main]]
+            return rows
+
+        nlist = choose_nlist(total)
+        # Keep the existing clustering until the collection has doubled
+        reuse = segment is not None and (
+            nlist == segment.nlist == 1
+            or (nlist > 1 and segment.nlist > 1 and total <= 2 * segment.trained_rows)
+        )
+        if reuse:
+            centroids, trained_rows = segment.centroids, segment.trained_rows
+        elif nlist == 1:
+            centroids, trained_rows = np.zeros((1, self.dim), dtype=np.float32), total
+        else:
+            sample_size = min(total, nlist * KMEANS_SAMPLE_PER_LIST)
+            sample = np.sort(np.random.default_rng(0).choice(total, sample_size, replace=False))
+            centroids, trained_rows = train_centroids(gather(sample), nlist), total
+
+        assignments = np.empty(total, dtype=np.int32)
+        for start in range(0, total, BATCH_ROWS):
+            positions = np.arange(start, min(start + BATCH_ROWS, total))
+            assignments[start:start + len(positions)] = assign_lists(gather(positions), centroids)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=len(centroids)))])
+
+        all_ids = np.concatenate([np.asarray(segment.ids)[main_rows] if segment is not None else delta_ids[:0],
+                                  delta_ids[delta_rows]])
+        all_doc_ids = np.concatenate([np.asarray(segment.doc_ids)[main_rows] if segment is not None
+                                      else delta_doc_ids[:0], delta_doc_ids[delta_rows]])
+
+        generation = (segment.generation if segment is not None else 0) + 1
+        name = f"gen-{generation:06d}"
+        tmp_path = os.path.join(self.path, f"{name}.tmp-{os.getpid()}")
+        os.makedirs(tmp_path)
+        vectors = np.lib.format.open_memmap(
+            os.path.join(tmp_path, "vectors.npy"), mode="w+", dtype=np.float32, shape=(total, self.dim)
+        )
+        for start in range(0, total, BATCH_ROWS):
+            block = order[start:start + BATCH_ROWS]
+            # Read sources in ascending order, then put rows back into list order
+            ascending = np.argsort(block)
+            rows = np.empty((len(block), self.dim), dtype=np.float32)
+            rows[ascending] = gather(block[ascending])
+            vectors[start:start + len(block)] = rows
+        vectors.flush()
+        del vectors
+        np.save(os.path.join(tmp_path, "ids.npy"), all_ids[order])
+        np.save(os.path.join(tmp_path, "doc_ids.npy"), all_doc_ids[order])
+        np.save(os.path.join(tmp_path, "centroids.npy"), centroids)
+        np.save(os.path.join(tmp_path, "offsets.npy"), offsets.astype(np.int64))
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({
+                "generation": generation,
+                "dim": self.dim,
+                "count": int(total),
+                "last_id": int(max(all_ids.max() if total else 0, segment.last_id if segment is not None else 0)),
+                "trained_rows": int(trained_rows),
+                "created_at": time.time(),
+            }, f)
+
+        final_path = os.path.join(self.path, name)
+        if os.path.exists(final_path):
+            shutil.rmtree(final_path)
+        os.rename(tmp_path, final_path)
+        current_tmp = os.path.join(self.path, f"{CURRENT_FILE}.tmp-{os.getpid()}")
+        with open(current_tmp, "w") as f:
+            f.write(name)
+        os.replace(current_tmp, os.path.join(self.path, CURRENT_FILE))
+        return name
+
+    def _remove_old_generations(self, current: str):
+        # Open memory maps stay valid after unlinking, so other processes
+        # still on an older generation keep working until they reload
+        for entry in os.listdir(self.path):
+            if entry.startswith("gen-") and entry != current and ".tmp-" not in entry:
+                shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
+
+    def stats(self) -> dict:
+        segment = self.segment
+        return {
+            "rows": len(self),
+            "segment_rows": segment.count if segment else 0,
+            "delta_rows": self._delta_size,
+            "lists": segment.nlist if segment else 0,
+            "generation": segment.generation if segment else 0,
+            "deleted_documents": len(self._deleted),
+        }
@@ -0,0 +1,206 @@
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import time
+from contextvars import ContextVar
+from numbers import Number
+from typing import Callable, Dict, Iterator, Optional
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "zhida_http_request_duration_seconds",
+    "Time from request start until the response body is complete",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+DB_QUERY_DURATION = Histogram(
+    "zhida_db_repository_call_duration_seconds",
+    "Duration of repository method calls, including the queries they run",
+    ["method"],
+    buckets=FAST_BUCKETS
+)
+DB_SLOW_QUERIES = Counter(
+    "zhida_db_slow_queries",
+    "Statements slower than SLOW_QUERY_THRESHOLD_MS",
+    ["method"]
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "zhida_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled database connection",
+    ["pool"],
+    buckets=FAST_BUCKETS
+)
+OPENAI_REQUEST_DURATION = Histogram(
+    "zhida_openai_request_duration_seconds",
+    "Upstream request latency per attempt (until response headers for streams)",
+    ["provider", "kind", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+OPENAI_TIME_TO_FIRST_TOKEN = Histogram(
+    "zhida_openai_time_to_first_token_seconds",
+    "Time from calling the service until the first streamed token",
+    ["provider"],
+    buckets=LATENCY_BUCKETS
+)
+OPENAI_TOKENS_PER_SECOND = Histogram(
+    "zhida_openai_tokens_per_second",
+    "Completion tokens generated per second",
+    ["provider", "kind"],
+    buckets=(1, 5, 10, 20, 30, 40, 60, 80, 100, 150, 200, 400)
+)
+OPENAI_TOKENS = Counter(
+    "zhida_openai_tokens",
+    "Tokens consumed upstream",
+    ["provider", "type"]
+)
+EVENT_LOOP_LAG = Histogram(
+    "zhida_event_loop_lag_seconds",
+    "How late the event loop woke a sleeping monitor task",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+RATE_LIMIT_DECISIONS = Counter(
+    "zhida_rate_limit_decisions",
+    "API rate limiter decisions",
+    ["outcome"]
+)
+
+# Repository method currently running in this task, e.g. "UserRepository.get_by_username"
+current_repository_method: ContextVar[Optional[str]] = ContextVar("current_repository_method", default=None)
+
+def timed_repository_method(fn):
+    @functools.wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        label = f"{type(self).__name__}.{fn.__name__}"
+        # An override calling super() is one logical call; time it once
+        if current_repository_method.get() == label:
+            return await fn(self, *args, **kwargs)
+        token = current_repository_method.set(label)
+        started = time.perf_counter()
+        try:
+            return await fn(self, *args, **kwargs)
+        finally:
+            DB_QUERY_DURATION.labels(label).observe(time.perf_counter() - started)
+            current_repository_method.reset(token)
+    wrapper.__timed__ = True
+    return wrapper
+
+def instrument_methods(cls):
+    """Time every public coroutine method defined directly on ``cls``"""
+    for name, attr in list(vars(cls).items()):
+        if not name.startswith("_") and inspect.iscoroutinefunction(attr) and not getattr(attr, "__timed__", False):
+            setattr(cls, name, timed_repository_method(attr))
+    return cls
+
+def instrumented_pool(pool_cls, name: str):
+    """Subclass a SQLAlchemy pool class to record how long checkouts wait"""
+    class InstrumentedPool(pool_cls):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                DB_POOL_CHECKOUT_WAIT.labels(name).observe(time.perf_counter() - started)
+
+    InstrumentedPool.__name__ = f"Instrumented{pool_cls.__name__}"
+    return InstrumentedPool
+
+def pool_stats(pool) -> dict:
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow()
+    }
+
+class LoopLagMonitor:
+    """Sleeps for ``interval`` in a loop and records how much later than asked it wakes up"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG.observe(max(0.0, loop.time() - started - self.interval))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+_stats_sources: Dict[str, Callable[[], dict]] = {}
+
+def register_stats(name: str, source: Callable[[], dict]):
+    """Export the numbers returned by ``source()`` as ``zhida_<name>_<key>`` gauges"""
+    _stats_sources[name] = source
+
+def _families(prefix: str, stats: dict) -> Iterator[GaugeMetricFamily]:
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, bool) or isinstance(value, Number):
+            yield GaugeMetricFamily(name, key, value=float(value))
+        elif isinstance(value, str):
+            family = GaugeMetricFamily(name, key, labels=[key])
+            family.add_metric([value], 1.0)
+            yield family
+        elif isinstance(value, dict):
+            yield from _families(name, value)
+        elif isinstance(value, list) and all(isinstance(item, dict) and "name" in item for item in value):
+            # Per-instance stats, e.g. one entry per upstream provider
+            families: Dict[str, GaugeMetricFamily] = {}
+            for item in value:
+                for item_key, item_value in item.items():
+                    if item_key == "name" or isinstance(item_value, bool) or not isinstance(item_value, (Number, str)):
+                        continue
+                    if isinstance(item_value, str):
+                        family = families.setdefault(
+                            item_key, GaugeMetricFamily(f"{name}_{item_key}", item_key, labels=["name", item_key])
+                        )
+                        family.add_metric([item["name"], item_value], 1.0)
+                    else:
+                        family = families.setdefault(
+                            item_key, GaugeMetricFamily(f"{name}_{item_key}", item_key, labels=["name"])
+                        )
+                        family.add_metric([item["name"]], float(item_value))
+            yield from families.values()
+
+class StatsCollector:
+    def collect(self):
+        for name, source in list(_stats_sources.items()):
+            try:
+                stats = source()
+            except Exception:
+                logger.exception("Failed to collect %s stats", name)
+                continue
+            yield from _families(f"zhida_{name}", stats)
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+def scrape_registry():
+    """
+    Registry to expose on /metrics. Under several workers (PROMETHEUS_MULTIPROC_DIR
+    set) histograms and counters are merged from every worker's files, while the
+    in-process stats gauges describe the worker that answered the scrape.
+    """
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(stats_collector)
+    return registry
@@ -0,0 +1,141 @@
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+from .cache import LRUCache, RedisError, get_redis, mark_redis_failed
+
+logger = logging.getLogger(__name__)
+
+# GCRA over several keys at once, all or nothing: either every key admits the
+# request and all their TATs advance, or nothing is stored. Times are in ms and
+# taken from the Redis clock so workers with skewed clocks agree.
+# ARGV holds (emission interval, tolerance) pairs, one per key.
+GCRA_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local results = {}
+local new_tats = {}
+local allowed = 1
+for i, key in ipairs(KEYS) do
+    local interval = tonumber(ARGV[2 * i - 1])
+    local tolerance = tonumber(ARGV[2 * i])
+    local tat = tonumber(redis.call('GET', key) or now)
+    if tat < now then tat = now end
+    local new_tat = tat + interval
+    local allow_at = new_tat - tolerance
+    if now < allow_at then
+        allowed = 0
+        table.insert(results, {0, 0, allow_at - now, tat - now})
+    else
+        new_tats[i] = new_tat
+        table.insert(results, {1, math.floor((now - allow_at) / interval), 0, new_tat - now})
+    end
+end
+if allowed == 1 then
+    for i, key in ipairs(KEYS) do
+        redis.call('SET', key, new_tats[i], 'PX', math.max(1, math.ceil(new_tats[i] - now)))
+    end
+else
+    for i, result in ipairs(results) do
+        if result[1] == 1 then
+            result[2] = result[2] + 1
+            result[4] = result[4] - tonumber(ARGV[2 * i - 1])
+        end
+    end
+end
+return results
+"""
+
+@dataclass
+class Limit:
+    """``limit`` requests per ``period`` seconds, allowing bursts of up to ``burst`` requests"""
+    key: str
+    limit: int
+    period: float
+    burst: Optional[int] = None
+
+    @property
+    def interval(self) -> float:
+        return self.period / self.limit
+
+    @property
+    def tolerance(self) -> float:
+        return self.interval * (self.burst or self.limit)
+
+@dataclass
+class Decision:
+    allowed: bool
+    remaining: int
+    # Seconds until a rejected request may be retried
+    retry_after: float
+    # Seconds until the limit is fully replenished
+    reset: float
+
+class RateLimiter:
+    """
+    Generic cell rate algorithm (GCRA) limiter. Each key stores only its
+    theoretical arrival time, which makes a check one atomic Redis script call
+    regardless of the window size. Falls back to an in-process table (per
+    worker, so limits are effectively multiplied by the worker count) when
+    Redis is unavailable.
+    """
+
+    def __init__(self, namespace: str = "ratelimit", maxsize: int = 100000):
+        self.namespace = namespace
+        self.local = LRUCache(maxsize=maxsize)
+        self._script = None
+        self._script_client = None
+
+    def _redis_key(self, key: str) -> str:
+        return f"zhida:{self.namespace}:{key}"
+
+    async def check(self, limits: Sequence[Limit]) -> List[Decision]:
+        """Admit the request only if every limit allows it; returns one decision per limit"""
+        if not limits:
+            return []
+        redis = get_redis()
+        if redis is not None:
+            try:
+                return await self._check_redis(redis, limits)
+            except RedisError as e:
+                mark_redis_failed(e)
+        return self._check_local(limits)
+
+    async def _check_redis(self, redis, limits: Sequence[Limit]) -> List[Decision]:
+        if self._script_client is not redis:
+            self._script = redis.register_script(GCRA_SCRIPT)
+            self._script_client = redis
+        args = []
+        for limit in limits:
+            args += [math.ceil(limit.interval * 1000), math.ceil(limit.tolerance * 1000)]
+        results = await self._script(keys=[self._redis_key(limit.key) for limit in limits], args=args)
+        return [
+            Decision(bool(allowed), int(remaining), retry_ms / 1000, reset_ms / 1000)
+            for allowed, remaining, retry_ms, reset_ms in results
+        ]
+
+    def _check_local(self, limits: Sequence[Limit]) -> List[Decision]:
+        now = time.time()
+        pending: List[Tuple[Limit, float]] = []
+        decisions = []
+        for limit in limits:
+            tat = max(self.local.get(limit.key) or now, now)
+            new_tat = tat + limit.interval
+            allow_at = new_tat - limit.tolerance
+            if now < allow_at:
+                decisions.append(Decision(False, 0, allow_at - now, tat - now))
+            else:
+                pending.append((limit, new_tat))
+                decisions.append(Decision(True, int((now - allow_at) / limit.interval), 0.0, new_tat - now))
+
+        if all(decision.allowed for decision in decisions):
+            for limit, new_tat in pending:
+                self.local.set(limit.key, new_tat, ttl=new_tat - now)
+        else:
+            # Nothing was consumed, so report the state before this request
+            for limit, decision in zip(limits, decisions):
+                if decision.allowed:
+                    decision.remaining += 1
+                    decision.reset -= limit.interval
+        return decisions
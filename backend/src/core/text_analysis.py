@@ -0,0 +1,80 @@
+import logging
+import re
+import threading
+import unicodedata
+from typing import List, Optional
+
+try:
+    import jieba
+except ImportError:  # CJK text is then split into overlapping character bigrams
+    jieba = None
+
+logger = logging.getLogger(__name__)
+
+# Kana, CJK ideographs (with extension A and compatibility forms) and hangul
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKENS = re.compile(f"[{_CJK}]+|[0-9a-z]+(?:[-_./][0-9a-z]+)*")
+_CODE_SEPARATORS = re.compile(r"[-_./]")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were with
+的 了 是 在 和 与 及 或 也 就 都 而 吗 呢 吧 啊 呀 么 之 其 这 那 我 你 他 她 它 们
+""".split())
+
+class TextAnalyzer:
+    """
+    Splits text into search terms for lexical retrieval.
+
+    Text is NFKC-normalised (folding full-width letters and digits) and lower
+    cased. Latin words and numbers become terms as they are; codes such as
+    "ZD-2000X" are kept whole and also indexed joined ("zd2000x") and by part,
+    so a query matches however the code is written. Runs of CJK text are
+    segmented with jieba when it is installed, or else split into overlapping
+    character bigrams, which need no dictionary and still match product names
+    jieba does not know.
+    """
+
+    SEGMENTERS = ("auto", "jieba", "bigram")
+
+    def __init__(self, segmenter: str = "auto", user_dict: Optional[str] = None):
+        if segmenter not in self.SEGMENTERS:
+            raise ValueError(f"Unknown segmenter {segmenter!r}, expected one of {', '.join(self.SEGMENTERS)}")
+        if segmenter == "jieba" and jieba is None:
+            logger.warning("jieba is not installed, segmenting CJK text into bigrams")
+        self.segmenter = "jieba" if segmenter != "bigram" and jieba is not None else "bigram"
+        self.user_dict = user_dict
+        self._jieba_lock = threading.Lock()
+        self._jieba_ready = False
+
+    def _load_jieba(self):
+        # Loading the dictionary takes about a second, so it waits for the first text
+        with self._jieba_lock:
+            if not self._jieba_ready:
+                jieba.setLogLevel(logging.WARNING)
+                jieba.initialize()
+                if self.user_dict:
+                    jieba.load_userdict(self.user_dict)
+                self._jieba_ready = True
+
+    def _segment(self, run: str) -> List[str]:
+        if self.segmenter == "jieba":
+            if not self._jieba_ready:
+                self._load_jieba()
+            return [word for word in jieba.lcut_for_search(run, HMM=False) if word not in STOPWORDS]
+        if len(run) == 1:
+            return [] if run in STOPWORDS else [run]
+        return [run[i:i + 2] for i in range(len(run) - 1)]
+
+    def __call__(self, text: str) -> List[str]:
+        terms: List[str] = []
+        for match in _TOKENS.finditer(unicodedata.normalize("NFKC", text).lower()):
+            token = match.group()
+            if token[0] > "\x7f":
+                terms.extend(self._segment(token))
+            elif token not in STOPWORDS:
+                terms.append(token)
+                parts = _CODE_SEPARATORS.split(token)
+                if len(parts) > 1:
+                    terms.append("".join(parts))
+                    terms.extend(part for part in parts if part not in STOPWORDS)
+        return terms
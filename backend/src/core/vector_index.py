@@ -0,0 +1,86 @@
+import time
+from typing import Any, Optional, Tuple
+import numpy as np
+
+class VectorIndex:
+    """
+    Brute-force cosine-similarity index over a preallocated NumPy matrix.
+
+    Vectors are L2-normalised on insert so a search is one matrix-vector
+    product. Each entry carries a scope (only entries of the query's scope can
+    match), a payload and an expiry; when the index is full the expired or
+    least recently used slot is overwritten. Sized for thousands of entries,
+    where a flat scan is faster than maintaining clusters.
+    """
+
+    def __init__(self, maxsize: int = 5000, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.dim: Optional[int] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._scopes = [None] * maxsize
+        self._payloads = [None] * maxsize
+        self._expires_at = np.zeros(maxsize, dtype=np.float64)
+        self._last_used = np.zeros(maxsize, dtype=np.float64)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _normalise(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _slot(self, now: float) -> int:
+        if self._size < self.maxsize:
+            self._size += 1
+            return self._size - 1
+        expired = np.flatnonzero(self._expires_at < now)
+        if expired.size:
+            return int(expired[0])
+        return int(np.argmin(self._last_used))
+
+    def add(self, vector, scope: str, payload: Any, ttl: Optional[float] = None):
+        vector = self._normalise(vector)
+        if self._vectors is None:
+            self.dim = vector.shape[0]
+            self._vectors = np.zeros((self.maxsize, self.dim), dtype=np.float32)
+        elif vector.shape[0] != self.dim:
+            raise ValueError(f"Expected a vector of dimension {self.dim}, got {vector.shape[0]}")
+
+        now = time.monotonic()
+        slot = self._slot(now)
+        self._vectors[slot] = vector
+        self._scopes[slot] = scope
+        self._payloads[slot] = payload
+        self._expires_at[slot] = now + (ttl if ttl is not None else self.ttl)
+        self._last_used[slot] = now
+
+    def search(self, vector, scope: str, threshold: float) -> Optional[Tuple[Any, float]]:
+        """Return ``(payload, similarity)`` of the closest live entry in scope, if above threshold"""
+        if not self._size:
+            return None
+        vector = self._normalise(vector)
+        if vector.shape[0] != self.dim:
+            return None
+
+        now = time.monotonic()
+        scores = self._vectors[:self._size] @ vector
+        live = self._expires_at[:self._size] >= now
+        in_scope = np.fromiter((s == scope for s in self._scopes[:self._size]), dtype=bool, count=self._size)
+        scores = np.where(live & in_scope, scores, -np.inf)
+
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        self._last_used[best] = now
+        return self._payloads[best], float(scores[best])
+
+    def clear(self):
+        self._scopes = [None] * self.maxsize
+        self._payloads = [None] * self.maxsize
+        self._expires_at[:] = 0
+        self._last_used[:] = 0
+        self._size = 0
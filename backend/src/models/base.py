@@ -1,9 +1,14 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, JSON, Enum, ForeignKey, Text, Float
+from sqlalchemy import Column, Integer, String, DateTime, Date, JSON, Enum, ForeignKey, Text, Float, LargeBinary, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
 
+def utcnow_seconds() -> datetime:
+    # MySQL DATETIME keeps whole seconds (rounding, not truncating), so a value with
+    # microseconds would differ from the stored one in cursors built from the object
+    return datetime.utcnow().replace(microsecond=0)
+
 class User(Base):
     __tablename__ = "users"
 
@@ -25,24 +30,35 @@ class User(Base):
 
 class Session(Base):
     __tablename__ = "sessions"
+    __table_args__ = (Index('idx_sessions_user_last_message', 'user_id', 'last_message_time', 'id'),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     title = Column(String(255), nullable=False)
     status = Column(Enum('active', 'archived', name='session_status'), default='active', nullable=False)
     message_count = Column(Integer, default=0)
-    last_message_time = Column(DateTime)
+    # Set at creation so keyset pagination never has to deal with NULLs
+    last_message_time = Column(DateTime, default=datetime.utcnow, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     system_prompt = Column(Text)
     temperature = Column(Float(2))
     max_tokens = Column(Integer)
+    # Rolling summary of every message up to and including summary_message_id
+    summary = Column(Text)
+    summary_message_id = Column(Integer)
+    summary_tokens = Column(Integer)
 
     user = relationship("User", back_populates="sessions")
     messages = relationship("Message", back_populates="session", cascade="all, delete-orphan")
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index('idx_messages_session_created', 'session_id', 'created_at', 'id'),
+        # History search; elsewhere the in-process index in services/message_search.py is used
+        Index('ft_messages_content', 'content', mysql_prefix='FULLTEXT', mysql_with_parser='ngram').ddl_if(dialect='mysql'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey('sessions.id', ondelete='CASCADE'), nullable=False)
@@ -51,7 +67,8 @@ class Message(Base):
     content = Column(Text, nullable=False)
     tokens = Column(Integer)
     status = Column(Enum('sent', 'delivered', 'error', name='message_status'), default='sent', nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Whole seconds, so the copy in the session cache matches the database row
+    created_at = Column(DateTime, default=utcnow_seconds, nullable=False)
     response_time = Column(Integer)
     client_info = Column(String(255))
     ip_address = Column(String(45))
@@ -61,15 +78,60 @@ class Message(Base):
 
 class Statistics(Base):
     __tablename__ = "statistics"
+    __table_args__ = (UniqueConstraint('user_id', 'date', name='unique_user_date'),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
-    date = Column(DateTime, nullable=False)
+    date = Column(Date, nullable=False)
     chat_count = Column(Integer, default=0)
     message_count = Column(Integer, default=0)
     avg_response_time = Column(Float)
+    # Running mean inputs; avg_response_time is always response_time_sum / response_count
+    response_time_sum = Column(Integer, default=0, nullable=False)
+    response_count = Column(Integer, default=0, nullable=False)
     token_usage = Column(Integer, default=0)
     error_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
-    user = relationship("User", back_populates="statistics")
\ No newline at end of file
+    user = relationship("User", back_populates="statistics")
+
+class KnowledgeDocument(Base):
+    """
+    A source document of the knowledge base. Documents are immutable: changed
+    content is stored as a new document and the old one marked deleted, so
+    in-process indexes only ever need document-level tombstones.
+    """
+    __tablename__ = "kb_documents"
+    __table_args__ = (
+        Index('idx_kb_documents_content_hash', 'content_hash'),
+        Index('idx_kb_documents_status_updated', 'status', 'updated_at'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String(255), nullable=False)
+    source = Column(String(1024))
+    # sha256 of the normalised text, used to skip re-ingesting unchanged content
+    content_hash = Column(String(64), nullable=False)
+    status = Column(Enum('indexed', 'deleted', name='kb_document_status'), default='indexed', nullable=False)
+    chunk_count = Column(Integer, default=0, nullable=False)
+    token_count = Column(Integer, default=0, nullable=False)
+    created_by = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'))
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    meta = Column(JSON)
+
+    chunks = relationship("KnowledgeChunk", back_populates="document", cascade="all, delete-orphan")
+
+class KnowledgeChunk(Base):
+    __tablename__ = "kb_chunks"
+    __table_args__ = (Index('idx_kb_chunks_document_position', 'document_id', 'position'),)
+
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey('kb_documents.id', ondelete='CASCADE'), nullable=False)
+    position = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    tokens = Column(Integer, nullable=False)
+    # float32 little-endian bytes; the source of truth the in-process index is rebuilt from
+    embedding = Column(LargeBinary, nullable=False)
+
+    document = relationship("KnowledgeDocument", back_populates="chunks")
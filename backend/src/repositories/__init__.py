@@ -2,10 +2,15 @@ from .user import UserRepository
 from .session import SessionRepository
 from .message import MessageRepository
 from .statistics import StatisticsRepository
+from .knowledge_base import KnowledgeDocumentRepository, KnowledgeChunkRepository
+from .unit_of_work import UnitOfWork
 
 __all__ = [
     'UserRepository',
     'SessionRepository',
     'MessageRepository',
-    'StatisticsRepository'
+    'StatisticsRepository',
+    'KnowledgeDocumentRepository',
+    'KnowledgeChunkRepository',
+    'UnitOfWork'
 ]
\ No newline at end of file
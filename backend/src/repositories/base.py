@@ -1,48 +1,99 @@
-from typing import Generic, TypeVar, Type, Optional, List, Union, Dict, Any
-from sqlalchemy.orm import Session
-from sqlalchemy import select, update, delete
+from typing import Generic, TypeVar, Type, Optional, List, Union, Dict, Any, Awaitable, Callable
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, delete, func
 from ..models.base import Base
+from ..core.metrics import instrument_methods
 
 ModelType = TypeVar("ModelType", bound=Base)
 
+# Key in AsyncSession.info of callbacks waiting for the transaction to commit
+AFTER_COMMIT = "after_commit"
+
+def after_commit(db: AsyncSession, callback: Callable[[], Awaitable[Any]]):
+    """Run ``callback`` once the session's current transaction commits, e.g. to update a cache"""
+    db.info.setdefault(AFTER_COMMIT, []).append(callback)
+
+async def run_after_commit(db: AsyncSession):
+    for callback in db.info.pop(AFTER_COMMIT, []):
+        await callback()
+
+def discard_after_commit(db: AsyncSession):
+    db.info.pop(AFTER_COMMIT, None)
+
 class BaseRepository(Generic[ModelType]):
-    def __init__(self, model: Type[ModelType], db: Session):
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Every public repository method is timed and labelled for query metrics
+        instrument_methods(cls)
+
+    def __init__(self, model: Type[ModelType], db: AsyncSession, autocommit: bool = True):
         self.model = model
         self.db = db
+        # With autocommit off, writes are only flushed and the caller (usually
+        # a UnitOfWork) decides when the transaction commits
+        self.autocommit = autocommit
+
+    async def _commit(self):
+        if self.autocommit:
+            await self.db.commit()
+            await run_after_commit(self.db)
 
-    def get(self, id: int) -> Optional[ModelType]:
-        return self.db.get(self.model, id)
+    async def get(self, id: int) -> Optional[ModelType]:
+        return await self.db.get(self.model, id)
 
-    def get_by(self, **kwargs) -> Optional[ModelType]:
+    async def get_by(self, **kwargs) -> Optional[ModelType]:
         stmt = select(self.model).filter_by(**kwargs)
-        return self.db.execute(stmt).scalar_one_or_none()
+        result = await self.db.execute(stmt)
+        return result.scalar_one_or_none()
 
-    def list(self, skip: int = 0, limit: int = 100, **filters) -> List[ModelType]:
+    async def list(self, skip: int = 0, limit: int = 100, **filters) -> List[ModelType]:
         stmt = select(self.model).filter_by(**filters).offset(skip).limit(limit)
-        return list(self.db.execute(stmt).scalars().all())
+        result = await self.db.execute(stmt)
+        return list(result.scalars().all())
 
-    def create(self, obj_in: Union[Dict[str, Any], ModelType]) -> ModelType:
+    async def create(self, obj_in: Union[Dict[str, Any], ModelType]) -> ModelType:
         if isinstance(obj_in, dict):
             obj = self.model(**obj_in)
         else:
             obj = obj_in
         self.db.add(obj)
-        self.db.commit()
-        self.db.refresh(obj)
+        # Column defaults are generated client-side, so the flushed object is
+        # already complete and needs no refresh round-trip
+        await self.db.flush()
+        await self._commit()
         return obj
 
-    def update(self, id: int, obj_in: Dict[str, Any]) -> Optional[ModelType]:
+    async def update(self, id: int, obj_in: Dict[str, Any], refresh: bool = True) -> Optional[ModelType]:
+        """
+        Update a row by id. With refresh=False nothing is read back and None is
+        returned; otherwise the row is returned via UPDATE ... RETURNING where
+        the dialect supports it, or a single re-select elsewhere (MySQL).
+        """
         stmt = update(self.model).where(self.model.id == id).values(**obj_in)
-        self.db.execute(stmt)
-        self.db.commit()
-        return self.get(id)
+        if refresh and self.db.get_bind().dialect.update_returning:
+            result = await self.db.execute(
+                stmt.returning(self.model),
+                execution_options={"populate_existing": True}
+            )
+            obj = result.scalar_one_or_none()
+            await self._commit()
+            return obj
 
-    def delete(self, id: int) -> bool:
+        await self.db.execute(stmt)
+        await self._commit()
+        if not refresh:
+            return None
+        return await self.db.get(self.model, id, populate_existing=True)
+
+    async def delete(self, id: int) -> bool:
         stmt = delete(self.model).where(self.model.id == id)
-        self.db.execute(stmt)
-        self.db.commit()
+        await self.db.execute(stmt)
+        await self._commit()
         return True
 
-    def count(self, **filters) -> int:
-        stmt = select(self.model).filter_by(**filters)
-        return len(list(self.db.execute(stmt).scalars().all()))
\ No newline at end of file
+    async def count(self, **filters) -> int:
+        stmt = select(func.count()).select_from(self.model).filter_by(**filters)
+        result = await self.db.execute(stmt)
+        return result.scalar_one()
+
+instrument_methods(BaseRepository)
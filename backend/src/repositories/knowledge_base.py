@@ -0,0 +1,112 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert, update, delete
+from .base import BaseRepository
+from ..models.base import KnowledgeDocument, KnowledgeChunk
+
+class KnowledgeDocumentRepository(BaseRepository[KnowledgeDocument]):
+    def __init__(self, db: AsyncSession, autocommit: bool = True):
+        super().__init__(KnowledgeDocument, db, autocommit)
+
+    async def get_live_by_hashes(self, content_hashes: Sequence[str]) -> Dict[str, KnowledgeDocument]:
+        if not content_hashes:
+            return {}
+        stmt = select(self.model).where(self.model.content_hash.in_(content_hashes), self.model.status == 'indexed')
+        result = await self.db.execute(stmt)
+        return {document.content_hash: document for document in result.scalars().all()}
+
+    async def list_live(self, skip: int = 0, limit: int = 50) -> List[KnowledgeDocument]:
+        """Newest first"""
+        stmt = (
+            select(self.model)
+            .filter_by(status='indexed')
+            .order_by(self.model.id.desc())
+            .offset(skip)
+            .limit(limit)
+        )
+        result = await self.db.execute(stmt)
+        return list(result.scalars().all())
+
+    async def mark_deleted(self, document_id: int) -> bool:
+        """Tombstone a live document; its chunks are removed with it"""
+        stmt = (
+            update(self.model)
+            .where(self.model.id == document_id, self.model.status == 'indexed')
+            .values(status='deleted', updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.db.execute(stmt)
+        if result.rowcount:
+            await self.db.execute(delete(KnowledgeChunk).where(KnowledgeChunk.document_id == document_id))
+        await self._commit()
+        return result.rowcount == 1
+
+    async def deleted_since(self, since: Optional[datetime] = None) -> List[int]:
+        stmt = select(self.model.id).filter_by(status='deleted')
+        if since is not None:
+            stmt = stmt.where(self.model.updated_at >= since)
+        result = await self.db.execute(stmt)
+        return list(result.scalars().all())
+
+class KnowledgeChunkRepository(BaseRepository[KnowledgeChunk]):
+    def __init__(self, db: AsyncSession, autocommit: bool = True):
+        super().__init__(KnowledgeChunk, db, autocommit)
+
+    async def add_chunks(self, document_id: int, chunks: Sequence[Dict]) -> List[int]:
+        """
+        Insert a document's chunks in one executemany and return their ids in
+        position order. Each chunk dict carries position, content, tokens and
+        embedding (float32 bytes).
+        """
+        if not chunks:
+            return []
+        await self.db.execute(insert(self.model), [dict(chunk, document_id=document_id) for chunk in chunks])
+        result = await self.db.execute(
+            select(self.model.id).filter_by(document_id=document_id).order_by(self.model.position)
+        )
+        ids = list(result.scalars().all())
+        await self._commit()
+        return ids
+
+    async def ids_after(self, last_id: int, limit: int) -> List[int]:
+        stmt = select(self.model.id).where(self.model.id > last_id).order_by(self.model.id).limit(limit)
+        result = await self.db.execute(stmt)
+        return list(result.scalars().all())
+
+    async def get_embeddings(self, ids: Sequence[int]) -> List[Tuple[int, int, bytes]]:
+        """``(chunk_id, document_id, embedding)`` for the given chunk ids"""
+        if not ids:
+            return []
+        stmt = (
+            select(self.model.id, self.model.document_id, self.model.embedding)
+            .where(self.model.id.in_(ids))
+            .order_by(self.model.id)
+        )
+        result = await self.db.execute(stmt)
+        return [tuple(row) for row in result.all()]
+
+    async def get_texts(self, ids: Sequence[int]) -> List[Tuple[int, int, str, str]]:
+        """``(chunk_id, document_id, title, content)`` for the given chunk ids of live documents"""
+        if not ids:
+            return []
+        stmt = (
+            select(self.model.id, self.model.document_id, KnowledgeDocument.title, self.model.content)
+            .join(KnowledgeDocument, KnowledgeDocument.id == self.model.document_id)
+            .where(self.model.id.in_(ids), KnowledgeDocument.status == 'indexed')
+            .order_by(self.model.id)
+        )
+        result = await self.db.execute(stmt)
+        return [tuple(row) for row in result.all()]
+
+    async def get_passages(self, ids: Sequence[int]) -> List[Tuple[KnowledgeChunk, str, Optional[str]]]:
+        """Chunks of live documents with their document title and source, in no particular order"""
+        if not ids:
+            return []
+        stmt = (
+            select(self.model, KnowledgeDocument.title, KnowledgeDocument.source)
+            .join(KnowledgeDocument, KnowledgeDocument.id == self.model.document_id)
+            .where(self.model.id.in_(ids), KnowledgeDocument.status == 'indexed')
+        )
+        result = await self.db.execute(stmt)
+        return [tuple(row) for row in result.all()]
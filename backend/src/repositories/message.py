@@ -1,24 +1,54 @@
-from typing import List, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import select, desc
-from .base import BaseRepository
-from ..models.base import Message
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, desc, update
+from sqlalchemy.dialects.mysql import match
+from .base import BaseRepository, after_commit
+from .pagination import encode_cursor, keyset_before
+from ..models.base import Message, Session as ChatSession
+from ..services.session_cache import session_cache
 
 class MessageRepository(BaseRepository[Message]):
-    def __init__(self, db: Session):
-        super().__init__(Message, db)
+    def __init__(self, db: AsyncSession, autocommit: bool = True):
+        super().__init__(Message, db, autocommit)
 
-    def get_session_messages(self, session_id: int, skip: int = 0, limit: int = 50) -> List[Message]:
+    async def get_session_messages(self, session_id: int, skip: int = 0, limit: int = 50,
+                                   cursor: Optional[str] = None, after_id: Optional[int] = None) -> List[Message]:
+        """
+        Newest first. Pass a cursor from cursor_for() instead of skip for
+        constant-cost deep pages; after_id limits the listing to newer messages.
+        """
         stmt = (
             select(self.model)
             .filter_by(session_id=session_id)
-            .order_by(desc(self.model.created_at))
-            .offset(skip)
+            .order_by(desc(self.model.created_at), desc(self.model.id))
             .limit(limit)
         )
-        return list(self.db.execute(stmt).scalars().all())
+        if after_id:
+            stmt = stmt.where(self.model.id > after_id)
+        if cursor:
+            stmt = stmt.where(keyset_before(self.model.created_at, self.model.id, cursor))
+        else:
+            stmt = stmt.offset(skip)
+        result = await self.db.execute(stmt)
+        return list(result.scalars().all())
 
-    def get_user_messages(self, user_id: int, skip: int = 0, limit: int = 50) -> List[Message]:
+    async def get_messages_after(self, session_id: int, after_id: Optional[int], limit: int) -> List[Message]:
+        """Oldest first, starting after the given message id"""
+        stmt = (
+            select(self.model)
+            .filter_by(session_id=session_id)
+            .where(self.model.id > (after_id or 0))
+            .order_by(self.model.id)
+            .limit(limit)
+        )
+        result = await self.db.execute(stmt)
+        return list(result.scalars().all())
+
+    @staticmethod
+    def cursor_for(message: Message) -> str:
+        return encode_cursor(message.created_at, message.id)
+
+    async def get_user_messages(self, user_id: int, skip: int = 0, limit: int = 50) -> List[Message]:
         stmt = (
             select(self.model)
             .filter_by(user_id=user_id)
@@ -26,11 +56,59 @@ class MessageRepository(BaseRepository[Message]):
             .offset(skip)
             .limit(limit)
         )
-        return list(self.db.execute(stmt).scalars().all())
+        result = await self.db.execute(stmt)
+        return list(result.scalars().all())
+
+    def _search_page(self, user_id: int, limit: int, cursor: Optional[str], session_id: Optional[int]):
+        """The user's messages with their session titles, newest first"""
+        stmt = (
+            select(self.model, ChatSession.title)
+            .join(ChatSession, ChatSession.id == self.model.session_id)
+            .where(self.model.user_id == user_id)
+            .order_by(desc(self.model.created_at), desc(self.model.id))
+            .limit(limit)
+        )
+        if session_id:
+            stmt = stmt.where(self.model.session_id == session_id)
+        if cursor:
+            stmt = stmt.where(keyset_before(self.model.created_at, self.model.id, cursor))
+        return stmt
+
+    async def search_fulltext(self, user_id: int, boolean_query: str, limit: int, cursor: Optional[str] = None,
+                              session_id: Optional[int] = None) -> List[Tuple[Message, str]]:
+        """
+        ``(message, session title)`` of the user's messages matching a MySQL
+        boolean-mode query against the ngram FULLTEXT index, newest first
+        """
+        stmt = self._search_page(user_id, limit, cursor, session_id).where(
+            match(self.model.content, against=boolean_query).in_boolean_mode()
+        )
+        result = await self.db.execute(stmt)
+        return [tuple(row) for row in result.all()]
+
+    async def search_by_ids(self, user_id: int, ids: Sequence[int], limit: int, cursor: Optional[str] = None,
+                            session_id: Optional[int] = None) -> List[Tuple[Message, str]]:
+        """Like search_fulltext() over candidate message ids found elsewhere"""
+        if not ids:
+            return []
+        stmt = self._search_page(user_id, limit, cursor, session_id).where(self.model.id.in_(ids))
+        result = await self.db.execute(stmt)
+        return [tuple(row) for row in result.all()]
 
-    def create_message(self, session_id: int, user_id: int, role: str, content: str, 
+    async def get_contents_after(self, last_id: int, limit: int) -> List[Tuple[int, int, str]]:
+        """``(id, user_id, content)`` of messages after ``last_id``, oldest first"""
+        stmt = (
+            select(self.model.id, self.model.user_id, self.model.content)
+            .where(self.model.id > last_id)
+            .order_by(self.model.id)
+            .limit(limit)
+        )
+        result = await self.db.execute(stmt)
+        return [tuple(row) for row in result.all()]
+
+    async def create_message(self, session_id: int, user_id: int, role: str, content: str, 
                       tokens: Optional[int] = None, client_info: Optional[str] = None,
-                      ip_address: Optional[str] = None) -> Message:
+                      ip_address: Optional[str] = None, response_time: Optional[int] = None) -> Message:
         message_data = {
             "session_id": session_id,
             "user_id": user_id,
@@ -38,6 +116,20 @@ class MessageRepository(BaseRepository[Message]):
             "content": content,
             "tokens": tokens,
             "client_info": client_info,
-            "ip_address": ip_address
+            "ip_address": ip_address,
+            "response_time": response_time
         }
-        return self.create(message_data)
\ No newline at end of file
+        message = self.model(**message_data)
+        # Appended to the hot-session cache only once committed, never when rolled back
+        after_commit(self.db, lambda: session_cache.add_messages(session_id, [message]))
+        return await self.create(message)
+
+    async def set_token_counts(self, counts: Dict[int, int]):
+        """Store per-message token counts, keyed by message id, in one executemany"""
+        if not counts:
+            return
+        await self.db.execute(
+            update(self.model),
+            [{"id": id, "tokens": tokens} for id, tokens in counts.items()]
+        )
+        await self._commit()
\ No newline at end of file
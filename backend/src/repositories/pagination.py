@@ -0,0 +1,35 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Tuple
+from sqlalchemy import and_, or_
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(sort_value: Any, id: int) -> str:
+    """Opaque cursor pointing just past the row with this (sort_value, id)"""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, id = json.loads(raw)
+        return datetime.fromisoformat(sort_value), int(id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+def keyset_before(sort_column, id_column, cursor: str):
+    """
+    WHERE clause for the next page of a (sort_column DESC, id DESC) listing.
+    Written as an OR of ranges rather than a row comparison so MySQL can
+    seek on the matching composite index.
+    """
+    sort_value, id = decode_cursor(cursor)
+    return or_(
+        sort_column < sort_value,
+        and_(sort_column == sort_value, id_column < id)
+    )
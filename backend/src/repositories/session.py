@@ -1,25 +1,75 @@
-from typing import List, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import select, desc
-from .base import BaseRepository
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, desc, update
+from .base import BaseRepository, after_commit
+from .pagination import encode_cursor, keyset_before
 from ..models.base import Session as ChatSession
+from ..services.session_cache import session_cache
 
 class SessionRepository(BaseRepository[ChatSession]):
-    def __init__(self, db: Session):
-        super().__init__(ChatSession, db)
+    def __init__(self, db: AsyncSession, autocommit: bool = True):
+        super().__init__(ChatSession, db, autocommit)
 
-    def get_user_sessions(self, user_id: int, skip: int = 0, limit: int = 20) -> List[ChatSession]:
+    async def create(self, obj_in: Union[Dict[str, Any], ChatSession]) -> ChatSession:
+        session = self.model(**obj_in) if isinstance(obj_in, dict) else obj_in
+        # A new session is about to be chatted in, so cache it right away
+        after_commit(self.db, lambda: session_cache.store_new(session))
+        return await super().create(session)
+
+    async def get_user_sessions(self, user_id: int, skip: int = 0, limit: int = 20,
+                                cursor: Optional[str] = None) -> List[ChatSession]:
+        """Newest first. Pass a cursor from cursor_for() instead of skip for constant-cost deep pages."""
         stmt = (
             select(self.model)
             .filter_by(user_id=user_id)
-            .order_by(desc(self.model.last_message_time))
-            .offset(skip)
+            .order_by(desc(self.model.last_message_time), desc(self.model.id))
             .limit(limit)
         )
-        return list(self.db.execute(stmt).scalars().all())
+        if cursor:
+            stmt = stmt.where(keyset_before(self.model.last_message_time, self.model.id, cursor))
+        else:
+            stmt = stmt.offset(skip)
+        result = await self.db.execute(stmt)
+        return list(result.scalars().all())
+
+    @staticmethod
+    def cursor_for(session: ChatSession) -> str:
+        return encode_cursor(session.last_message_time, session.id)
+
+    async def get_active_sessions(self, user_id: int) -> List[ChatSession]:
+        return await self.list(user_id=user_id, status='active')
+
+    async def archive_session(self, session_id: int) -> Optional[ChatSession]:
+        after_commit(self.db, lambda: session_cache.invalidate(session_id))
+        return await self.update(session_id, {"status": "archived"})
 
-    def get_active_sessions(self, user_id: int) -> List[ChatSession]:
-        return self.list(user_id=user_id, status='active')
+    async def record_messages(self, session_id: int, count: int, last_message_time: datetime):
+        """Bump message_count in SQL so concurrent turns cannot lose updates"""
+        await self.update(session_id, {
+            "message_count": self.model.message_count + count,
+            "last_message_time": last_message_time
+        }, refresh=False)
 
-    def archive_session(self, session_id: int) -> Optional[ChatSession]:
-        return self.update(session_id, {"status": "archived"})
\ No newline at end of file
+
+    async def save_summary(self, session_id: int, summary: str, summary_tokens: int,
+                           through_message_id: int, previous_message_id: Optional[int]) -> bool:
+        """
+        Store a new rolling summary unless another worker already advanced it
+        past previous_message_id. Returns whether the summary was saved.
+        """
+        if previous_message_id is None:
+            current = self.model.summary_message_id.is_(None)
+        else:
+            current = self.model.summary_message_id == previous_message_id
+        stmt = (
+            update(self.model)
+            .where(self.model.id == session_id, current)
+            .values(summary=summary, summary_tokens=summary_tokens, summary_message_id=through_message_id)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.db.execute(stmt)
+        if result.rowcount == 1:
+            after_commit(self.db, lambda: session_cache.invalidate(session_id))
+        await self._commit()
+        return result.rowcount == 1
\ No newline at end of file
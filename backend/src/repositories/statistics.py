@@ -1,15 +1,31 @@
 from datetime import date
-from typing import List, Optional
-from sqlalchemy.orm import Session
+from typing import Any, Dict, List
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from .base import BaseRepository
 from ..models.base import Statistics
 
+# Columns that accumulate by addition on every upsert
+COUNTER_COLUMNS = (
+    "chat_count",
+    "message_count",
+    "response_time_sum",
+    "response_count",
+    "token_usage",
+    "error_count",
+)
+
+class UnsupportedDatabaseError(RuntimeError):
+    """The configured database has no upsert the statistics can be written with"""
+
 class StatisticsRepository(BaseRepository[Statistics]):
-    def __init__(self, db: Session):
-        super().__init__(Statistics, db)
+    def __init__(self, db: AsyncSession, autocommit: bool = True):
+        super().__init__(Statistics, db, autocommit)
 
-    def get_user_daily_stats(self, user_id: int, start_date: date, end_date: date) -> List[Statistics]:
+    async def get_user_daily_stats(self, user_id: int, start_date: date, end_date: date) -> List[Statistics]:
         stmt = (
             select(self.model)
             .filter(
@@ -19,50 +35,102 @@ class StatisticsRepository(BaseRepository[Statistics]):
             )
             .order_by(self.model.date)
         )
-        return list(self.db.execute(stmt).scalars().all())
+        result = await self.db.execute(stmt)
+        return list(result.scalars().all())
 
-    def update_daily_stats(self, user_id: int, stats_date: date, 
+    async def update_daily_stats(self, user_id: int, stats_date: date,
                           chat_count: int = 0, message_count: int = 0,
-                          avg_response_time: float = 0.0, token_usage: int = 0,
-                          error_count: int = 0) -> Statistics:
-        stats = self.get_by(user_id=user_id, date=stats_date)
-        if not stats:
-            stats_data = {
-                "user_id": user_id,
-                "date": stats_date,
-                "chat_count": chat_count,
-                "message_count": message_count,
-                "avg_response_time": avg_response_time,
-                "token_usage": token_usage,
-                "error_count": error_count
-            }
-            return self.create(stats_data)
-        else:
-            stats_data = {
-                "chat_count": stats.chat_count + chat_count,
-                "message_count": stats.message_count + message_count,
-                "avg_response_time": (stats.avg_response_time + avg_response_time) / 2 if stats.avg_response_time else avg_response_time,
-                "token_usage": stats.token_usage + token_usage,
-                "error_count": stats.error_count + error_count
-            }
-            return self.update(stats.id, stats_data)
+                          response_time_sum: int = 0, response_count: int = 0,
+                          token_usage: int = 0, error_count: int = 0) -> None:
+        """
+        Add counters to the (user_id, stats_date) row in one atomic upsert.
+        response_time_sum/response_count are the total and number of response
+        times being added; avg_response_time is derived from them.
+        """
+        await self.bulk_update_daily_stats([{
+            "user_id": user_id,
+            "date": stats_date,
+            "chat_count": chat_count,
+            "message_count": message_count,
+            "response_time_sum": response_time_sum,
+            "response_count": response_count,
+            "token_usage": token_usage,
+            "error_count": error_count
+        }])
+
+    async def bulk_update_daily_stats(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Apply many counter increments with a single multi-row upsert. Each row
+        holds user_id, date and any of COUNTER_COLUMNS; (user_id, date) pairs
+        must be unique within one call.
+        """
+        if not rows:
+            return
+        values = []
+        for row in rows:
+            value = {name: row.get(name, 0) for name in COUNTER_COLUMNS}
+            value["user_id"] = row["user_id"]
+            value["date"] = row["date"]
+            value["avg_response_time"] = (
+                value["response_time_sum"] / value["response_count"] if value["response_count"] else None
+            )
+            values.append(value)
+        await self.db.execute(self._upsert_statement(values))
+        await self._commit()
+
+    def _upsert_statement(self, values):
+        table = self.model.__table__
+        dialect = self.db.get_bind().dialect.name
+
+        if dialect in ("mysql", "mariadb"):
+            stmt = mysql_insert(table).values(values)
+            new = stmt.inserted
+            # MySQL applies ON DUPLICATE KEY UPDATE assignments left to right, so
+            # the mean must be computed before the sum/count columns are bumped
+            assignments = [("avg_response_time", self._mean(table.c, new))]
+            assignments += [(name, table.c[name] + new[name]) for name in COUNTER_COLUMNS]
+            return stmt.on_duplicate_key_update(assignments)
+
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+            stmt = insert(table).values(values)
+            new = stmt.excluded
+            set_ = {name: table.c[name] + new[name] for name in COUNTER_COLUMNS}
+            set_["avg_response_time"] = self._mean(table.c, new)
+            return stmt.on_conflict_do_update(index_elements=["user_id", "date"], set_=set_)
+
+        raise UnsupportedDatabaseError(
+            f"Statistics need MySQL, MariaDB, PostgreSQL or SQLite; DATABASE_URL uses {dialect}"
+        )
+
+    @staticmethod
+    def _mean(current, new):
+        # Multiplying by 1.0 avoids integer division on SQLite without a CAST,
+        # which MySQL does not support for FLOAT
+        return (
+            (current.response_time_sum + new.response_time_sum) * 1.0
+            / func.nullif(current.response_count + new.response_count, 0)
+        )
 
-    def get_total_stats(self, user_id: int) -> dict:
+    async def get_total_stats(self, user_id: int) -> dict:
         stmt = (
             select(
                 func.sum(self.model.chat_count).label("total_chats"),
                 func.sum(self.model.message_count).label("total_messages"),
-                func.avg(self.model.avg_response_time).label("avg_response_time"),
+                (
+                    func.sum(self.model.response_time_sum) * 1.0
+                    / func.nullif(func.sum(self.model.response_count), 0)
+                ).label("avg_response_time"),
                 func.sum(self.model.token_usage).label("total_tokens"),
                 func.sum(self.model.error_count).label("total_errors")
             )
             .filter(self.model.user_id == user_id)
         )
-        result = self.db.execute(stmt).first()
+        result = (await self.db.execute(stmt)).first()
         return {
             "total_chats": result.total_chats or 0,
             "total_messages": result.total_messages or 0,
             "avg_response_time": float(result.avg_response_time or 0),
             "total_tokens": result.total_tokens or 0,
             "total_errors": result.total_errors or 0
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,47 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from .base import run_after_commit, discard_after_commit
+from .user import UserRepository
+from .session import SessionRepository
+from .message import MessageRepository
+from .statistics import StatisticsRepository
+from .knowledge_base import KnowledgeDocumentRepository, KnowledgeChunkRepository
+
+class UnitOfWork:
+    """
+    Groups writes from several repositories into one transaction.
+
+    Repositories handed out here flush instead of committing; the transaction
+    commits once when the ``async with`` block exits cleanly and rolls back if
+    it raises. Cache updates the repositories register with after_commit()
+    run only once the commit succeeds::
+
+        async with UnitOfWork(db) as uow:
+            await uow.messages.create_message(...)
+            await uow.sessions.record_messages(...)
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.users = UserRepository(db, autocommit=False)
+        self.sessions = SessionRepository(db, autocommit=False)
+        self.messages = MessageRepository(db, autocommit=False)
+        self.statistics = StatisticsRepository(db, autocommit=False)
+        self.kb_documents = KnowledgeDocumentRepository(db, autocommit=False)
+        self.kb_chunks = KnowledgeChunkRepository(db, autocommit=False)
+
+    async def __aenter__(self) -> "UnitOfWork":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.commit()
+        else:
+            await self.rollback()
+
+    async def commit(self):
+        await self.db.commit()
+        await run_after_commit(self.db)
+
+    async def rollback(self):
+        await self.db.rollback()
+        discard_after_commit(self.db)
@@ -1,19 +1,34 @@
-from typing import Optional
-from sqlalchemy.orm import Session
+from typing import Any, Dict, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from .base import BaseRepository
+from .base import BaseRepository, after_commit
 from ..models.base import User
+from ..services.user_cache import user_cache
 
 class UserRepository(BaseRepository[User]):
-    def __init__(self, db: Session):
-        super().__init__(User, db)
+    def __init__(self, db: AsyncSession, autocommit: bool = True):
+        super().__init__(User, db, autocommit)
 
-    def get_by_email(self, email: str) -> Optional[User]:
-        return self.get_by(email=email)
+    async def get_by_email(self, email: str) -> Optional[User]:
+        return await self.get_by(email=email)
 
-    def get_by_username(self, username: str) -> Optional[User]:
-        return self.get_by(username=username)
+    async def get_by_username(self, username: str) -> Optional[User]:
+        return await self.get_by(username=username)
 
-    def is_admin(self, user_id: int) -> bool:
-        user = self.get(user_id)
-        return user is not None and user.role == 'admin'
\ No newline at end of file
+    async def is_admin(self, user_id: int) -> bool:
+        user = await self.get(user_id)
+        return user is not None and user.role == 'admin'
+
+    async def update(self, id: int, obj_in: Dict[str, Any], refresh: bool = True) -> Optional[User]:
+        # Look up the current username first so a rename also evicts the old key
+        # (read it now: the update refreshes the same identity-mapped instance)
+        user = await self.get(id)
+        old_username = user.username if user else None
+        # Evicted once committed: evicting earlier would let a concurrent
+        # request cache the old row again until the TTL expires
+        after_commit(self.db, lambda: user_cache.invalidate(old_username, obj_in.get("username")))
+        return await super().update(id, obj_in, refresh)
+
+    async def set_status(self, user_id: int, status: str) -> Optional[User]:
+        """Enable or disable a user; the cached principal is evicted so it applies immediately"""
+        return await self.update(user_id, {"status": status})
\ No newline at end of file
@@ -0,0 +1,182 @@
+import asyncio
+import time
+from typing import Optional
+
+class AdmissionRejected(Exception):
+    """Raised when a call cannot be admitted in time; ``retry_after`` is in seconds"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitOpen(AdmissionRejected):
+    pass
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at ``rate_per_minute``.
+
+    acquire() reserves its tokens up front, letting the balance go negative,
+    and sleeps until the debt is repaid, so waiters are served in arrival order
+    without a separate queue.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay_for(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def reserve(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Give back (positive) or charge (negative) tokens once the real cost is known"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive upstream failures and fails
+    fast for ``reset_timeout`` seconds, then lets a single probe through
+    (half-open); the probe's outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open":
+            raise CircuitOpen(
+                "Upstream circuit is open",
+                retry_after=self.reset_timeout - (time.monotonic() - self.opened_at)
+            )
+        if state == "half_open":
+            if self.probing:
+                raise CircuitOpen("Upstream circuit is half-open", retry_after=1.0)
+            self.probing = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def release(self):
+        """End a call whose outcome says nothing about upstream health"""
+        self.probing = False
+
+class AdmissionController:
+    """
+    Admits upstream calls under a concurrency cap and requests/tokens per
+    minute budgets (either limit may be 0 to disable it). Callers wait in turn
+    for budget and a free slot for at most ``max_wait`` seconds, after which
+    they are rejected with a hint of when to retry.
+    """
+
+    def __init__(self, max_concurrency: int, requests_per_minute: int, tokens_per_minute: int,
+                 max_wait: float):
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_wait = max_wait
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+            "wait_seconds_avg": self.wait_seconds_total / self.admitted if self.admitted else 0.0
+        }
+
+    def _budget_delay(self, estimated_tokens: int) -> float:
+        delay = 0.0
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay_for(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.delay_for(estimated_tokens))
+        return delay
+
+    async def acquire(self, estimated_tokens: int):
+        started = time.monotonic()
+        delay = self._budget_delay(estimated_tokens)
+        if delay > self.max_wait:
+            self.rejected += 1
+            raise AdmissionRejected("Upstream rate limit budget exhausted", retry_after=delay)
+        if self.requests is not None:
+            self.requests.reserve(1)
+        if self.tokens is not None:
+            self.tokens.reserve(estimated_tokens)
+
+        self.waiting += 1
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            remaining = self.max_wait - (time.monotonic() - started)
+            await asyncio.wait_for(self.semaphore.acquire(), max(remaining, 0.001))
+        except BaseException as e:
+            # Not admitted (timed out or the caller went away): hand the budget back
+            if self.requests is not None:
+                self.requests.adjust(1)
+            self.adjust_tokens(estimated_tokens)
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise AdmissionRejected("Too many concurrent upstream requests", retry_after=1.0)
+            raise
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started
+        self.admitted += 1
+        self.in_flight += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def release(self):
+        self.in_flight -= 1
+        self.semaphore.release()
+
+    def adjust_tokens(self, unused: int):
+        """Return the difference between the estimated and actual token cost"""
+        if self.tokens is not None and unused:
+            self.tokens.adjust(unused)
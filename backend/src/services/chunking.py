@@ -0,0 +1,72 @@
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+from .tokens import count_tokens
+
+# A sentence runs up to CJK or ASCII end punctuation (plus any closing quotes),
+# a full stop followed by whitespace, or a line break
+_SENTENCE = re.compile(r"[^\n]*?(?:[。！？；!?;…]+[”’」』\"')）]*|\.(?=\s)|\n+|$)")
+
+@dataclass
+class Chunk:
+    position: int
+    content: str
+    tokens: int
+
+def split_sentences(text: str) -> List[Tuple[int, int]]:
+    """``(start, end)`` offsets of the sentences in ``text``, skipping blank ones"""
+    spans = []
+    for match in _SENTENCE.finditer(text):
+        if match.group().strip():
+            spans.append(match.span())
+    return spans
+
+def _hard_split(text: str, start: int, end: int, tokens: int, max_tokens: int) -> List[Tuple[int, int]]:
+    """Cut a sentence with no usable punctuation into pieces of about ``max_tokens``"""
+    pieces = -(-tokens // max_tokens)
+    step = -(-(end - start) // pieces)
+    return [(offset, min(offset + step, end)) for offset in range(start, end, step)]
+
+def chunk_text(text: str, max_tokens: int, overlap_tokens: int = 0) -> List[Chunk]:
+    """
+    Split ``text`` into chunks of at most about ``max_tokens`` tokens along
+    sentence boundaries. Consecutive chunks repeat up to ``overlap_tokens`` of
+    trailing sentences so a fact straddling a boundary stays retrievable.
+    Chunks are slices of the original text, whitespace and all.
+    """
+    units: List[Tuple[int, int, int]] = []
+    for start, end in split_sentences(text):
+        tokens = count_tokens(text[start:end])
+        if tokens <= max_tokens:
+            units.append((start, end, tokens))
+            continue
+        for piece_start, piece_end in _hard_split(text, start, end, tokens, max_tokens):
+            units.append((piece_start, piece_end, count_tokens(text[piece_start:piece_end])))
+
+    chunks: List[Chunk] = []
+    window: List[Tuple[int, int, int]] = []
+    window_tokens = 0
+    fresh = False  # whether the window holds anything beyond the carried-over overlap
+
+    def flush():
+        content = text[window[0][0]:window[-1][1]].strip()
+        chunks.append(Chunk(position=len(chunks), content=content, tokens=count_tokens(content)))
+
+    for unit in units:
+        if window and window_tokens + unit[2] > max_tokens:
+            if fresh:
+                flush()
+            carried, carried_tokens = [], 0
+            for previous in reversed(window):
+                if carried_tokens + previous[2] > overlap_tokens or carried_tokens + previous[2] + unit[2] > max_tokens:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous[2]
+            window, window_tokens, fresh = carried, carried_tokens, False
+        window.append(unit)
+        window_tokens += unit[2]
+        fresh = True
+
+    if window and fresh:
+        flush()
+    return chunks
@@ -0,0 +1,130 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from ..config import settings
+from ..repositories import MessageRepository
+from .session_cache import HotSession
+from .tokens import count_tokens, TOKENS_PER_MESSAGE, REPLY_PRIMING_TOKENS
+
+SUMMARY_PREFIX = "以下是本次对话较早内容的摘要：\n"
+
+@dataclass
+class ChatContext:
+    messages: List[Dict[str, str]]
+    prompt_tokens: int
+    user_tokens: int
+    # Token counts computed for stored messages whose tokens column was empty
+    uncounted: Dict[int, int] = field(default_factory=dict)
+    # Unsummarised history messages that were read, and whether the budget cut some off
+    history_count: int = 0
+    truncated: bool = False
+
+class ContextBuilder:
+    """
+    Assembles the prompt for a chat turn: system prompt, the session's rolling
+    summary if it has one, knowledge base passages retrieved for the turn,
+    then as much recent history after the summary as fits the token budget,
+    then the new user message.
+
+    History is read newest-first in small keyset pages and stops as soon as
+    the budget is spent, so long sessions cost no more than short ones. With
+    ``cached`` messages from the session cache, pages are only read past
+    their end.
+    Per-message counts come from Message.tokens; messages without one are
+    counted here and reported in ChatContext.uncounted so the caller can
+    store them.
+    """
+
+    def __init__(self, max_tokens: int, context_window: int, max_messages: int, batch_size: int):
+        self.max_tokens = max_tokens
+        self.context_window = context_window
+        self.max_messages = max_messages
+        self.batch_size = batch_size
+
+    def budget_for(self, completion_tokens: Optional[int]) -> int:
+        """Prompt budget that still leaves room in the window for the reply"""
+        return min(self.max_tokens, self.context_window - (completion_tokens or 0))
+
+    async def build(self, message_repo: MessageRepository, session_id: Optional[int],
+                    system_prompt: Optional[str], user_message: str,
+                    completion_tokens: Optional[int] = None, summary: Optional[str] = None,
+                    summary_tokens: Optional[int] = None,
+                    summary_message_id: Optional[int] = None,
+                    knowledge: Optional[str] = None,
+                    cached: Optional[HotSession] = None) -> ChatContext:
+        user_tokens = count_tokens(user_message)
+        used = REPLY_PRIMING_TOKENS + TOKENS_PER_MESSAGE + user_tokens
+        if system_prompt:
+            used += TOKENS_PER_MESSAGE + count_tokens(system_prompt)
+        summary_message = None
+        if summary:
+            summary_message = {"role": "system", "content": SUMMARY_PREFIX + summary}
+            used += TOKENS_PER_MESSAGE + (summary_tokens or count_tokens(summary)) + count_tokens(SUMMARY_PREFIX)
+        if knowledge:
+            used += TOKENS_PER_MESSAGE + count_tokens(knowledge)
+        budget = self.budget_for(completion_tokens)
+
+        history = []
+        uncounted = {}
+        full = False
+
+        def add(message) -> bool:
+            nonlocal used, full
+            tokens = message.tokens
+            if tokens is None:
+                tokens = uncounted[message.id] = count_tokens(message.content)
+            if used + TOKENS_PER_MESSAGE + tokens > budget:
+                full = True
+                return False
+            used += TOKENS_PER_MESSAGE + tokens
+            history.append(message)
+            return True
+
+        cursor = None
+        more = bool(session_id)
+        if cached is not None:
+            # The database is only read for history older than the cached messages
+            for message in cached.messages:
+                if (len(history) >= self.max_messages or (summary_message_id and message.id <= summary_message_id)
+                        or not add(message)):
+                    more = False
+                    break
+            else:
+                more = not cached.complete
+            if cached.messages:
+                cursor = message_repo.cursor_for(cached.messages[-1])
+        while more and not full and len(history) < self.max_messages:
+            limit = min(self.batch_size, self.max_messages - len(history))
+            page = await message_repo.get_session_messages(
+                session_id, limit=limit, cursor=cursor, after_id=summary_message_id
+            )
+            for message in page:
+                if not add(message):
+                    break
+            if len(page) < limit:
+                break
+            cursor = message_repo.cursor_for(page[-1])
+
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        if summary_message:
+            messages.append(summary_message)
+        if knowledge:
+            messages.append({"role": "system", "content": knowledge})
+        messages.extend({"role": m.role, "content": m.content} for m in reversed(history))
+        messages.append({"role": "user", "content": user_message})
+        return ChatContext(
+            messages=messages,
+            prompt_tokens=used,
+            user_tokens=user_tokens,
+            uncounted=uncounted,
+            history_count=len(history),
+            truncated=full
+        )
+
+context_builder = ContextBuilder(
+    max_tokens=settings.CONTEXT_MAX_TOKENS,
+    context_window=settings.CONTEXT_WINDOW,
+    max_messages=settings.CONTEXT_MAX_MESSAGES,
+    batch_size=settings.CONTEXT_FETCH_BATCH
+)
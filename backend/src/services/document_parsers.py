@@ -0,0 +1,191 @@
+import csv
+import os
+import re
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # PDF ingestion is optional
+    PdfReader = None
+
+# Columns used for a CSV row's title, body and source, checked in order;
+# rows of other CSVs become "column: value" lines titled by their row number
+CSV_TITLE_COLUMNS = ("title", "question", "subject", "name", "标题", "问题")
+CSV_CONTENT_COLUMNS = ("content", "answer", "body", "text", "内容", "答案")
+CSV_SOURCE_COLUMNS = ("source", "url", "link", "来源")
+
+_BLANK_LINES = re.compile(r"\n\s*\n\s*")
+_SPACES = re.compile(r"[ \t\r\f\v]+")
+_MARKDOWN_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$", re.MULTILINE)
+_FRONT_MATTER = re.compile(r"\A---\n.*?\n---\n", re.DOTALL)
+
+class UnsupportedDocument(Exception):
+    pass
+
+@dataclass
+class ParsedDocument:
+    title: str
+    content: str
+    source: str
+    meta: Optional[dict] = None
+
+def _read_text(path: str) -> str:
+    # utf-8-sig drops the byte order mark editors on Windows like to add
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        return f.read()
+
+def _tidy(text: str) -> str:
+    lines = (_SPACES.sub(" ", line).strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+def _stem(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+def parse_text(path: str, source: str) -> List[ParsedDocument]:
+    return [ParsedDocument(_stem(path), _tidy(_read_text(path)), source)]
+
+def parse_markdown(path: str, source: str) -> List[ParsedDocument]:
+    text = _FRONT_MATTER.sub("", _read_text(path))
+    heading = _MARKDOWN_HEADING.search(text)
+    return [ParsedDocument(heading.group(1) if heading else _stem(path), _tidy(text), source)]
+
+class _HTMLText(HTMLParser):
+    SKIP = {"script", "style", "noscript", "template", "svg"}
+    BLOCKS = {"p", "div", "br", "li", "tr", "section", "article", "header", "footer", "blockquote", "pre",
+              "h1", "h2", "h3", "h4", "h5", "h6", "table", "ul", "ol", "dt", "dd"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.title = ""
+        self.heading = ""
+        self._skipping = 0
+        self._in = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+        elif tag in ("title", "h1"):
+            self._in = tag
+        if tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag == self._in:
+            self._in = None
+        if tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if self._skipping:
+            return
+        if self._in == "title":
+            self.title += data
+            return
+        if self._in == "h1" and not self.heading:
+            self.heading = data
+        self.parts.append(data)
+
+def parse_html(path: str, source: str) -> List[ParsedDocument]:
+    parser = _HTMLText()
+    parser.feed(_read_text(path))
+    parser.close()
+    title = _tidy(parser.title) or _tidy(parser.heading) or _stem(path)
+    return [ParsedDocument(title, _tidy("".join(parser.parts)), source)]
+
+def parse_pdf(path: str, source: str) -> List[ParsedDocument]:
+    if PdfReader is None:
+        raise UnsupportedDocument("PDF ingestion requires the pypdf package")
+    reader = PdfReader(path)
+    pages = [page.extract_text() or "" for page in reader.pages]
+    title = (reader.metadata.title if reader.metadata else None) or _stem(path)
+    return [ParsedDocument(title.strip(), _tidy("\n\n".join(pages)), source, {"pages": len(pages)})]
+
+def _pick(columns: Dict[str, str], candidates) -> Optional[str]:
+    return next((columns[name] for name in candidates if name in columns), None)
+
+def iter_csv(path: str, source: str, batch_size: int) -> Iterator[List[ParsedDocument]]:
+    """One document per row, read as a stream and yielded ``batch_size`` rows at a time"""
+    batch = []
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as f:
+        reader = csv.DictReader(f)
+        if not reader.fieldnames:
+            return
+        columns = {name.strip().lower(): name for name in reader.fieldnames if name}
+        title_column = _pick(columns, CSV_TITLE_COLUMNS)
+        content_column = _pick(columns, CSV_CONTENT_COLUMNS)
+        source_column = _pick(columns, CSV_SOURCE_COLUMNS)
+        for number, row in enumerate(reader, 1):
+            if content_column:
+                content = row.get(content_column) or ""
+            else:
+                content = "\n".join(f"{name}: {value}" for name, value in row.items() if name and value)
+            if not content.strip():
+                continue
+            title = (row.get(title_column) or "").strip() if title_column else ""
+            row_source = (row.get(source_column) or "").strip() if source_column else ""
+            batch.append(ParsedDocument(
+                title[:255] or f"{_stem(path)} #{number}",
+                _tidy(content),
+                row_source[:1024] or f"{source}#{number}",
+                {"row": number},
+            ))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def parse_csv(path: str, source: str) -> List[ParsedDocument]:
+    """Every row at once; use iter_csv() for files too large to hold in memory"""
+    return [document for batch in iter_csv(path, source, 1000) for document in batch]
+
+PARSERS: Dict[str, Callable[[str, str], List[ParsedDocument]]] = {
+    ".txt": parse_text,
+    ".md": parse_markdown,
+    ".markdown": parse_markdown,
+    ".html": parse_html,
+    ".htm": parse_html,
+    ".pdf": parse_pdf,
+    ".csv": parse_csv,
+}
+
+# Formats that can be read a batch of documents at a time
+STREAMING_PARSERS: Dict[str, Callable[[str, str, int], Iterator[List[ParsedDocument]]]] = {
+    ".csv": iter_csv,
+}
+
+def is_supported(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in PARSERS
+
+def parse_file(path: str, source: Optional[str] = None) -> List[ParsedDocument]:
+    """
+    Documents in the file at ``path``, chosen by extension. ``source`` is
+    recorded with them (default: the path itself); CSV rows get ``#<row>``
+    appended unless the file has a source column.
+    """
+    parser = PARSERS.get(os.path.splitext(path)[1].lower())
+    if parser is None:
+        raise UnsupportedDocument(f"Unsupported file type: {os.path.basename(path)}")
+    return [document for document in parser(path, source or path) if document.content]
+
+def iter_file(path: str, source: Optional[str] = None, batch_size: int = 1000) -> Iterator[List[ParsedDocument]]:
+    """
+    parse_file() in batches of at most ``batch_size`` documents. Formats in
+    STREAMING_PARSERS are read incrementally, so memory stays bounded however
+    large the file; the rest are parsed whole.
+    """
+    parser = STREAMING_PARSERS.get(os.path.splitext(path)[1].lower())
+    if parser is None:
+        documents = parse_file(path, source)
+        for start in range(0, len(documents), batch_size):
+            yield documents[start:start + batch_size]
+        return
+    for batch in parser(path, source or path, batch_size):
+        documents = [document for document in batch if document.content]
+        if documents:
+            yield documents
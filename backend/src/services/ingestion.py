@@ -0,0 +1,383 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+from ..config import settings
+from ..core.cache import Cache
+from ..core.database import AsyncSessionLocal
+from .document_parsers import STREAMING_PARSERS, ParsedDocument, is_supported, iter_file, parse_file
+from .knowledge_base import KnowledgeBase, PreparedDocument, prepare_document
+
+logger = logging.getLogger(__name__)
+
+# Keeps the parse stage this many tasks (files or CSV row batches) ahead of each worker process
+FILES_IN_FLIGHT_PER_WORKER = 2
+# Documents per pool task for formats read as a stream, such as CSV rows
+STREAM_BATCH_DOCUMENTS = 1000
+
+def prepare_documents(documents: List[ParsedDocument]) -> List[PreparedDocument]:
+    """Hash and chunk parsed documents; runs in a pool worker process"""
+    return [
+        prepare_document(document.title[:255], document.content, document.source, document.meta)
+        for document in documents
+    ]
+
+def prepare_file(path: str, source: str) -> List[PreparedDocument]:
+    """Parse, hash and chunk one file; runs in a pool worker process"""
+    return prepare_documents(parse_file(path, source))
+
+def iter_files(paths: Sequence[str]) -> Iterator[str]:
+    """Supported files under ``paths`` (files or directories), in a stable order"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                for name in sorted(names):
+                    if is_supported(name) and not name.startswith("."):
+                        yield os.path.join(root, name)
+        elif is_supported(path):
+            yield path
+
+class Checkpoint:
+    """
+    Append-only JSON-lines log of files whose documents are all stored,
+    keyed by path, size and modification time. A rerun skips files that are
+    unchanged since they were logged, so an interrupted run resumes where it
+    stopped and re-ingesting an unchanged tree does no work at all.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._done: Dict[str, Tuple[int, int]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A run killed mid-write leaves a partial last line
+                        continue
+                    self._done[entry["path"]] = (entry["size"], entry["mtime_ns"])
+        self._file = open(path, "a", encoding="utf-8")
+
+    @staticmethod
+    def _key(path: str) -> Tuple[str, Tuple[int, int]]:
+        stat = os.stat(path)
+        return os.path.abspath(path), (stat.st_size, stat.st_mtime_ns)
+
+    def is_done(self, path: str) -> bool:
+        key, version = self._key(path)
+        return self._done.get(key) == version
+
+    def record(self, path: str, documents: int):
+        key, (size, mtime_ns) = self._key(path)
+        self._done[key] = (size, mtime_ns)
+        self._file.write(json.dumps({
+            "path": key, "size": size, "mtime_ns": mtime_ns, "documents": documents, "at": time.time()
+        }, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+@dataclass
+class IngestionReport:
+    files: int = 0
+    # Unchanged since a checkpointed run
+    skipped_files: int = 0
+    failed_files: int = 0
+    finished_files: int = 0
+    documents: int = 0
+    created: int = 0
+    duplicates: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+class IngestionPipeline:
+    """
+    Bulk loader for the knowledge base: parse → chunk → dedupe → embed → store.
+
+    Files are parsed and chunked in a process pool, a bounded number ahead of
+    the consumer. Formats in STREAMING_PARSERS (CSV) are instead read in a
+    thread and handed to the pool STREAM_BATCH_DOCUMENTS rows at a time, so a
+    multi-gigabyte CSV is neither held in memory nor tied to one worker. The
+    documents are gathered into batches of
+    ``batch_documents``; each batch is checked against the content hashes
+    already stored, embedded in concurrent KB_EMBED_BATCH sized requests and
+    written in one transaction while the pool keeps parsing. A file is logged
+    to the checkpoint once all its documents are stored.
+
+    Outside the API server, where no sync task maintains the index, pass
+    ``add_to_index`` and ``compact`` to build the shared index generation as
+    the run goes.
+    """
+
+    def __init__(self, knowledge_base: KnowledgeBase, openai_service, workers: int = 0,
+                 batch_documents: int = 256, checkpoint: Optional[Checkpoint] = None,
+                 user_id: Optional[int] = None, add_to_index: Optional[bool] = None, compact: bool = False,
+                 on_progress: Optional[Callable[[IngestionReport], None]] = None):
+        self.knowledge_base = knowledge_base
+        self.openai_service = openai_service
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_documents = batch_documents
+        self.checkpoint = checkpoint
+        self.user_id = user_id
+        self.add_to_index = add_to_index
+        self.compact = compact
+        self.on_progress = on_progress
+        self.report = IngestionReport()
+        # [documents waiting in a batch, total documents, all parts parsed] of unfinished files
+        self._remaining: Dict[str, list] = {}
+        self._failed: Set[str] = set()
+        self._sources: Dict[str, str] = {}
+
+    async def run(self, paths: Sequence[str], sources: Optional[Dict[str, str]] = None) -> IngestionReport:
+        """Ingest every supported file under ``paths``; ``sources`` overrides the recorded source per path"""
+        started = time.monotonic()
+        files = list(iter_files(paths))
+        todo = [path for path in files if not (self.checkpoint and self.checkpoint.is_done(path))]
+        self.report.files = len(files)
+        self.report.skipped_files = len(files) - len(todo)
+        self._sources = sources or {}
+        self._progress()
+
+        parsed: asyncio.Queue = asyncio.Queue(maxsize=self.workers * FILES_IN_FLIGHT_PER_WORKER)
+        # spawn rather than fork: the caller may be an event loop with threads and open connections
+        pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        stages = [
+            asyncio.ensure_future(self._parse(pool, todo, parsed)),
+            asyncio.ensure_future(self._consume(parsed)),
+        ]
+        try:
+            # Either stage failing (say, a broken pool or the embedding API) ends the run
+            done, _ = await asyncio.wait(stages, return_when=asyncio.FIRST_EXCEPTION)
+            for stage in done:
+                stage.result()
+        finally:
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            # Waiting for workers here would block the event loop
+            pool.shutdown(wait=False, cancel_futures=True)
+        self.report.seconds = round(time.monotonic() - started, 3)
+        self._progress()
+        return self.report
+
+    def _tasks(self, paths: List[str]) -> Iterator[Tuple[str, Optional[Callable], tuple]]:
+        """
+        ``(path, function, args)`` pool tasks, the parts of a file consecutive.
+        A streamed file that cannot be read yields ``(path, None, error)``.
+        """
+        for path in paths:
+            source = self._sources.get(path, path)
+            if os.path.splitext(path)[1].lower() not in STREAMING_PARSERS:
+                yield path, prepare_file, (path, source)
+                continue
+            parts = 0
+            try:
+                for documents in iter_file(path, source, STREAM_BATCH_DOCUMENTS):
+                    parts += 1
+                    yield path, prepare_documents, (documents,)
+            except Exception as e:
+                yield path, None, e
+                continue
+            if not parts:
+                yield path, prepare_documents, ([],)
+
+    async def _parse(self, pool, paths: List[str], parsed: asyncio.Queue):
+        """Queue ``(path, documents or error, last)``; ``last`` marks a file's final part"""
+        loop = asyncio.get_running_loop()
+        tasks = self._tasks(paths)
+        running: Dict[asyncio.Future, str] = {}
+        # Parts submitted but not yet queued, per file
+        unfinished: Dict[str, int] = {}
+        reading: Optional[str] = None
+        exhausted = False
+
+        async def submit():
+            nonlocal reading, exhausted
+            task = None
+            if not exhausted:
+                # Reading the next CSV batch is file I/O, kept off the event loop
+                task = await loop.run_in_executor(None, next, tasks, None)
+            previous = reading
+            if task is None:
+                exhausted, reading = True, None
+            else:
+                path, function, args = task
+                reading = path
+                unfinished[path] = unfinished.get(path, 0) + 1
+                if function is None:
+                    future = loop.create_future()
+                    future.set_exception(args)
+                else:
+                    future = loop.run_in_executor(pool, function, *args)
+                running[future] = path
+            # Moving past a file whose parts are all queued already
+            if previous is not None and previous != reading and unfinished.get(previous) == 0:
+                del unfinished[previous]
+                await parsed.put((previous, [], True))
+
+        for _ in range(self.workers * FILES_IN_FLIGHT_PER_WORKER):
+            await submit()
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                path = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = e
+                unfinished[path] -= 1
+                last = path != reading and not unfinished[path]
+                if last:
+                    del unfinished[path]
+                await parsed.put((path, result, last))
+                await submit()
+        await parsed.put(None)
+
+    async def _consume(self, parsed: asyncio.Queue):
+        batch: List[Tuple[str, PreparedDocument]] = []
+        while True:
+            item = await parsed.get()
+            if item is None:
+                break
+            path, result, last = item
+            state = self._remaining.setdefault(path, [0, 0, False])
+            if isinstance(result, Exception):
+                logger.warning("Skipping %s: %s", path, result)
+                if path not in self._failed:
+                    self._failed.add(path)
+                    self.report.failed_files += 1
+                    self.report.errors.append(f"{self._sources.get(path, path)}: {result}")
+                    self._progress()
+            elif path not in self._failed:
+                state[0] += len(result)
+                state[1] += len(result)
+                batch.extend((path, document) for document in result)
+            if last:
+                state[2] = True
+                self._finish_file(path)
+            while len(batch) >= self.batch_documents:
+                await self._store(batch[:self.batch_documents])
+                del batch[:self.batch_documents]
+        if batch:
+            await self._store(batch)
+
+    def _finish_file(self, path: str):
+        """Checkpoint a file once every part is parsed and every document stored"""
+        waiting, total, parsed = self._remaining[path]
+        if parsed and not waiting:
+            del self._remaining[path]
+            if path not in self._failed:
+                self._file_stored(path, total)
+
+    async def _store(self, batch: List[Tuple[str, PreparedDocument]]):
+        documents = [document for _, document in batch]
+        async with AsyncSessionLocal() as db:
+            results = await self.knowledge_base.ingest_prepared(
+                db, self.openai_service, documents, self.user_id, self.add_to_index
+            )
+        created = [document for document, result in zip(documents, results) if result.created]
+        self.report.documents += len(documents)
+        self.report.created += len(created)
+        self.report.duplicates += len(documents) - len(created)
+        self.report.chunks += sum(len(document.chunks) for document in created)
+
+        counts: Dict[str, int] = {}
+        for path, _ in batch:
+            counts[path] = counts.get(path, 0) + 1
+        for path, count in counts.items():
+            self._remaining[path][0] -= count
+            self._finish_file(path)
+        self._progress()
+
+        index = self.knowledge_base.index
+        # Compacting once the delta matches the segment keeps the total rewrite cost linear
+        if self.compact and index.delta_size >= max(settings.KB_COMPACT_THRESHOLD, len(index) // 2):
+            await self.knowledge_base.compact()
+
+    def _file_stored(self, path: str, documents: int):
+        self.report.finished_files += 1
+        if self.checkpoint is not None:
+            self.checkpoint.record(path, documents)
+
+    def _progress(self):
+        if self.on_progress is not None:
+            self.on_progress(self.report)
+
+class ImportJobs:
+    """
+    Ingestion runs started from the admin API. Uploaded files are staged in a
+    temporary directory and ingested by a background task, one run at a time
+    per worker process; progress is kept in the shared cache so a status
+    request can land on any worker.
+    """
+
+    def __init__(self, ttl: int):
+        self.cache = Cache("kb_import", ttl=ttl, maxsize=1000)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.cache.get(job_id)
+
+    async def start(self, knowledge_base: KnowledgeBase, openai_service, directory: str,
+                    sources: Dict[str, str], user_id: Optional[int]) -> dict:
+        """Ingest the files staged in ``directory`` (removed afterwards) in the background"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        job = {"id": uuid.uuid4().hex, "status": "queued", "user_id": user_id, "created_at": time.time(),
+               **asdict(IngestionReport(files=len(sources)))}
+        await self.cache.set(job["id"], job)
+        task = asyncio.create_task(self._run(job, knowledge_base, openai_service, directory, sources))
+        self._tasks[job["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job["id"], None))
+        return job
+
+    async def _run(self, job: dict, knowledge_base: KnowledgeBase, openai_service, directory: str,
+                   sources: Dict[str, str]):
+        pipeline = IngestionPipeline(
+            knowledge_base, openai_service,
+            workers=settings.KB_IMPORT_WORKERS,
+            batch_documents=settings.KB_INGEST_BATCH,
+            user_id=job["user_id"],
+        )
+        try:
+            async with self._lock:
+                job["status"] = "running"
+                await self.cache.set(job["id"], job)
+                run = asyncio.ensure_future(pipeline.run([directory], sources))
+                try:
+                    while not run.done():
+                        await asyncio.wait([run], timeout=1.0)
+                        job.update(asdict(pipeline.report))
+                        await self.cache.set(job["id"], job)
+                finally:
+                    run.cancel()
+                job.update(asdict(run.result()), status="finished")
+        except asyncio.CancelledError:
+            job["status"] = "cancelled"
+            raise
+        except Exception as e:
+            logger.exception("Knowledge base import %s failed", job["id"])
+            job.update(asdict(pipeline.report), status="failed")
+            job["errors"] = job["errors"] + [str(e)]
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+            await self.cache.set(job["id"], job)
+
+    async def stop(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+import_jobs = ImportJobs(ttl=86400)
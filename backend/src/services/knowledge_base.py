@@ -0,0 +1,467 @@
+import asyncio
+import hashlib
+import logging
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from ..config import settings
+from ..core.bm25_index import BM25Index
+from ..core.cache import LRUCache
+from ..core.database import AsyncSessionLocal
+from ..core.ivf_index import IVFIndex
+from ..core.text_analysis import TextAnalyzer
+from ..models.base import KnowledgeDocument
+from ..repositories import KnowledgeDocumentRepository, KnowledgeChunkRepository, UnitOfWork
+from .chunking import Chunk, chunk_text
+from .llm_providers import OpenAIServiceError
+from .response_cache import normalise_text
+from .tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_PREFIX = "以下是知识库中与用户问题相关的资料，回答时优先依据这些资料；资料不足以回答时请如实说明：\n"
+
+# Chunk ids are assigned when a transaction inserts, not when it commits, so
+# each sync re-reads this many ids below the newest one it has seen
+SYNC_LOOKBACK = 10000
+SYNC_ID_BATCH = 10000
+SYNC_EMBEDDING_BATCH = 1000
+SYNC_TEXT_BATCH = 1000
+# Each worker builds its lexical index from kb_chunks after starting; a sync
+# adds at most this many rows to it so picking up new vectors is not held up
+LEXICAL_ROWS_PER_SYNC = 20000
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+# Tolerance for clock skew between workers when polling for deleted documents
+DELETE_SLACK = timedelta(minutes=1)
+
+@dataclass
+class Passage:
+    chunk_id: int
+    document_id: int
+    title: str
+    source: Optional[str]
+    content: str
+    # Fused rank score in hybrid retrieval, otherwise that of the one retriever used
+    score: float
+    vector_score: Optional[float] = None
+    lexical_score: Optional[float] = None
+
+@dataclass
+class IngestResult:
+    document: KnowledgeDocument
+    # False when an identical live document already existed
+    created: bool
+
+@dataclass
+class PreparedDocument:
+    title: str
+    content_hash: str
+    chunks: List[Chunk]
+    source: Optional[str] = None
+    meta: Optional[dict] = None
+
+def content_hash(text: str) -> str:
+    """Identity of a document's text, ignoring width variants and whitespace"""
+    return hashlib.sha256(unicodedata.normalize("NFKC", " ".join(text.split())).encode("utf-8")).hexdigest()
+
+def prepare_document(title: str, content: str, source: Optional[str] = None,
+                     meta: Optional[dict] = None) -> PreparedDocument:
+    """Hash and chunk a document; CPU only, so it can run in a worker process"""
+    chunks = chunk_text(content, settings.KB_CHUNK_TOKENS, settings.KB_CHUNK_OVERLAP)
+    return PreparedDocument(title, content_hash(content), chunks, source, meta)
+
+def to_blob(vector) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Tuple[int, int, float]]],
+                           k: int = 60) -> List[Tuple[int, int, float]]:
+    """
+    Merge rankings of ``(chunk_id, document_id, score)`` hits: a hit scores
+    the sum of 1 / (k + rank) over the rankings that hold it. Only ranks
+    count, so retrievers with incomparable scores combine without tuning.
+    """
+    fused: Dict[int, List] = {}
+    for ranking in rankings:
+        for rank, (chunk_id, document_id, _) in enumerate(ranking, 1):
+            entry = fused.setdefault(chunk_id, [document_id, 0.0])
+            entry[1] += 1.0 / (k + rank)
+    return sorted(((chunk_id, document_id, score) for chunk_id, (document_id, score) in fused.items()),
+                  key=lambda hit: -hit[2])
+
+class KnowledgeBase:
+    """
+    Document store and retrieval for grounding chat answers.
+
+    Documents are split into overlapping chunks, embedded in batches through
+    OpenAIService and stored in kb_chunks together with their float32
+    vectors; the database is the source of truth. Each worker serves queries
+    from an IVFIndex in KB_INDEX_DIR, memory-mapped and shared through the
+    page cache, and a background task keeps it current: rows another worker
+    inserted are pulled from kb_chunks, deleted documents become tombstones,
+    and once the in-memory delta passes KB_COMPACT_THRESHOLD one worker
+    writes a new generation that the others reload.
+
+    With an ``analyzer``, each worker also keeps a BM25Index over the chunk
+    texts, built from kb_chunks in the background after it starts and kept
+    current by the same task, and retrieval fuses both rankings so exact
+    terms such as product codes are found even when embeddings miss them.
+    """
+
+    def __init__(self, index_dir: str, nprobe: int, analyzer: Optional[TextAnalyzer] = None):
+        self.index = IVFIndex(index_dir, nprobe)
+        self.lexical = BM25Index(analyzer) if analyzer is not None else None
+        self._query_vectors = LRUCache(maxsize=1000, ttl=600)
+        # Chunk text never changes, only whether its document is live
+        self._passages = LRUCache(maxsize=20000, ttl=3600)
+        self._task: Optional[asyncio.Task] = None
+        self._compaction: Optional[asyncio.Future] = None
+        self._synced_at: Optional[datetime] = None
+        # Newest chunk id this process has read from the database. Generations
+        # written elsewhere may lack older rows, so the first sync walks every id.
+        self._synced_id = 0
+        self._lexical_id = 0
+        self._lexical_behind = self.lexical is not None
+        self.searches = 0
+        self.lexical_fallbacks = 0
+        self.documents_ingested = 0
+        self.chunks_ingested = 0
+        self.duplicates_skipped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def stats(self) -> dict:
+        stats = {
+            **self.index.stats(),
+            "searches": self.searches,
+            "documents_ingested": self.documents_ingested,
+            "chunks_ingested": self.chunks_ingested,
+            "duplicates_skipped": self.duplicates_skipped,
+        }
+        if self.lexical is not None:
+            stats["lexical"] = {**self.lexical.stats(), "building": self._lexical_behind,
+                                "fallbacks": self.lexical_fallbacks}
+        return stats
+
+    async def start(self):
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.index.load)
+        try:
+            # The lexical index is built by the background task, not before serving
+            await self.sync(lexical=False)
+        except Exception:
+            logger.exception("Initial knowledge base sync failed, will retry")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._compaction is not None:
+            await asyncio.gather(self._compaction, return_exceptions=True)
+
+    async def _run(self):
+        # Syncs follow each other without a pause while the lexical index is being built
+        catching_up = self._lexical_behind
+        while True:
+            await asyncio.sleep(0 if catching_up else settings.KB_SYNC_INTERVAL)
+            try:
+                await self.sync()
+                catching_up = self._lexical_behind
+            except Exception:
+                logger.exception("Knowledge base sync failed")
+                catching_up = False
+            if self.index.delta_size >= settings.KB_COMPACT_THRESHOLD and self._compaction is None:
+                self._compaction = asyncio.ensure_future(self._compact())
+
+    async def compact(self) -> bool:
+        """Write the local delta and tombstones into a new index generation"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.index.compact)
+
+    async def _compact(self):
+        try:
+            await self.compact()
+        except Exception:
+            logger.exception("Knowledge base index compaction failed")
+        finally:
+            self._compaction = None
+
+    async def sync(self, lexical: bool = True):
+        """Bring the local indexes up to date with the database and other workers"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.index.load)
+        started = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            since = self._synced_at - DELETE_SLACK if self._synced_at else None
+            deleted = await KnowledgeDocumentRepository(db).deleted_since(since)
+            self.index.delete_documents(deleted)
+            if self.lexical is not None:
+                self.lexical.delete_documents(deleted)
+
+            chunk_repo = KnowledgeChunkRepository(db)
+            self._synced_id, _ = await self._pull(chunk_repo, self._synced_id, self.index.contains, self._add_vectors)
+            if lexical and self.lexical is not None:
+                self._lexical_id, self._lexical_behind = await self._pull(
+                    chunk_repo, self._lexical_id, self.lexical.contains, self._add_texts, LEXICAL_ROWS_PER_SYNC
+                )
+        self._synced_at = started
+
+    async def _pull(self, chunk_repo: KnowledgeChunkRepository, after: int,
+                    contains: Callable[[Sequence[int]], np.ndarray],
+                    add: Callable[[KnowledgeChunkRepository, List[int]], Awaitable[None]],
+                    limit: Optional[int] = None) -> Tuple[int, bool]:
+        """
+        Hand the chunk ids above ``after`` (less SYNC_LOOKBACK) that an index
+        lacks to ``add``. Returns the newest id read and whether ``limit``
+        missing rows cut the pass short.
+        """
+        last_id = max(0, after - SYNC_LOOKBACK)
+        added = 0
+        while True:
+            if limit is not None and added >= limit:
+                return after, True
+            ids = await chunk_repo.ids_after(last_id, SYNC_ID_BATCH)
+            if not ids:
+                return after, False
+            missing = np.asarray(ids, dtype=np.int64)[~contains(ids)].tolist()
+            if limit is not None and added + len(missing) > limit:
+                missing = missing[:limit - added]
+                await add(chunk_repo, missing)
+                return max(after, missing[-1]), True
+            await add(chunk_repo, missing)
+            added += len(missing)
+            last_id = ids[-1]
+            after = max(after, last_id)
+            if len(ids) < SYNC_ID_BATCH:
+                return after, False
+
+    async def _add_vectors(self, chunk_repo: KnowledgeChunkRepository, ids: List[int]):
+        for start in range(0, len(ids), SYNC_EMBEDDING_BATCH):
+            rows = await chunk_repo.get_embeddings(ids[start:start + SYNC_EMBEDDING_BATCH])
+            if rows:
+                self.index.add(
+                    [row[0] for row in rows],
+                    [row[1] for row in rows],
+                    np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+                )
+
+    async def _add_texts(self, chunk_repo: KnowledgeChunkRepository, ids: List[int]):
+        loop = asyncio.get_running_loop()
+        for start in range(0, len(ids), SYNC_TEXT_BATCH):
+            rows = await chunk_repo.get_texts(ids[start:start + SYNC_TEXT_BATCH])
+            if rows:
+                await loop.run_in_executor(
+                    None, self.lexical.add,
+                    [row[0] for row in rows], [row[1] for row in rows], [f"{row[2]}\n{row[3]}" for row in rows]
+                )
+
+    async def embed(self, openai_service, texts: Sequence[str]) -> np.ndarray:
+        """Embed in KB_EMBED_BATCH sized requests, KB_EMBED_CONCURRENCY at a time"""
+        semaphore = asyncio.Semaphore(settings.KB_EMBED_CONCURRENCY)
+        size = settings.KB_EMBED_BATCH
+
+        async def batch(start: int):
+            async with semaphore:
+                return await openai_service.create_embeddings(list(texts[start:start + size]))
+
+        batches = await asyncio.gather(*(batch(start) for start in range(0, len(texts), size)))
+        return np.asarray([vector for vectors in batches for vector in vectors], dtype=np.float32)
+
+    async def ingest(self, db, openai_service, documents: Sequence[Dict],
+                     user_id: Optional[int] = None) -> List[IngestResult]:
+        """
+        Chunk, embed and store a batch of documents, each a dict with title,
+        content and optionally source and meta. See ingest_prepared().
+        """
+        prepared = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: [prepare_document(**document) for document in documents]
+        )
+        return await self.ingest_prepared(db, openai_service, prepared, user_id)
+
+    async def ingest_prepared(self, db, openai_service, documents: Sequence[PreparedDocument],
+                              user_id: Optional[int] = None,
+                              add_to_index: Optional[bool] = None) -> List[IngestResult]:
+        """
+        Embed and store already chunked documents, returning one result per
+        document in order. A document whose text matches a live one (or an
+        earlier one in the batch) is not stored again; the existing document
+        is returned instead. Chunks of all documents share embedding requests
+        and identical chunk texts are embedded once. New rows go straight into
+        the local vector index when ``add_to_index`` (default: while the sync
+        task runs) and, while it runs, the lexical index; otherwise the
+        workers pick them up on their next sync.
+        """
+        existing = await KnowledgeDocumentRepository(db).get_live_by_hashes(
+            list({document.content_hash for document in documents})
+        )
+        results: List[Optional[IngestResult]] = [None] * len(documents)
+        first: Dict[str, int] = {}
+        pending = []
+        for i, document in enumerate(documents):
+            if document.content_hash in existing:
+                results[i] = IngestResult(existing[document.content_hash], False)
+            elif document.content_hash not in first:
+                first[document.content_hash] = i
+                pending.append(i)
+
+        # The title goes into every chunk's embedding so passages stay tied to their subject
+        rows: Dict[str, int] = {}
+        chunk_rows = [
+            [rows.setdefault(f"{documents[i].title}\n{chunk.content}", len(rows)) for chunk in documents[i].chunks]
+            for i in pending
+        ]
+        vectors = await self.embed(openai_service, list(rows)) if rows else np.zeros((0, 0), dtype=np.float32)
+
+        indexed = []
+        async with UnitOfWork(db) as uow:
+            for i, document_rows in zip(pending, chunk_rows):
+                document = documents[i]
+                created = await uow.kb_documents.create({
+                    "title": document.title,
+                    "source": document.source,
+                    "content_hash": document.content_hash,
+                    "chunk_count": len(document.chunks),
+                    "token_count": sum(chunk.tokens for chunk in document.chunks),
+                    "created_by": user_id,
+                    "meta": document.meta,
+                })
+                document_vectors = vectors[document_rows]
+                ids = await uow.kb_chunks.add_chunks(created.id, [
+                    {"position": chunk.position, "content": chunk.content, "tokens": chunk.tokens,
+                     "embedding": to_blob(vector)}
+                    for chunk, vector in zip(document.chunks, document_vectors)
+                ])
+                texts = [f"{document.title}\n{chunk.content}" for chunk in document.chunks]
+                indexed.append((ids, created.id, document_vectors, texts))
+                results[i] = IngestResult(created, True)
+
+        for i, document in enumerate(documents):
+            if results[i] is None:
+                results[i] = IngestResult(results[first[document.content_hash]].document, False)
+        if self.running if add_to_index is None else add_to_index:
+            for ids, document_id, document_vectors, _ in indexed:
+                self.index.add(ids, [document_id] * len(ids), document_vectors)
+            if self.running and self.lexical is not None and indexed:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.lexical.add,
+                    [chunk_id for ids, _, _, _ in indexed for chunk_id in ids],
+                    [document_id for ids, document_id, _, _ in indexed for _ in ids],
+                    [text for _, _, _, texts in indexed for text in texts]
+                )
+        self.documents_ingested += len(indexed)
+        self.chunks_ingested += sum(len(ids) for ids, _, _, _ in indexed)
+        self.duplicates_skipped += len(documents) - len(indexed)
+        return results
+
+    async def delete(self, db, document_id: int) -> bool:
+        deleted = await KnowledgeDocumentRepository(db).mark_deleted(document_id)
+        if deleted:
+            self.index.delete_documents([document_id])
+            if self.lexical is not None:
+                self.lexical.delete_documents([document_id])
+        return deleted
+
+    async def _query_vector(self, openai_service, query: str) -> np.ndarray:
+        key = normalise_text(query)
+        vector = self._query_vectors.get(key)
+        if vector is None:
+            vector = (await self.embed(openai_service, [query]))[0]
+            self._query_vectors.set(key, vector)
+        return vector
+
+    def query_vector(self, query: str) -> Optional[np.ndarray]:
+        """The embedding retrieve() computed for ``query``, if it is still cached"""
+        return self._query_vectors.get(normalise_text(query))
+
+    async def retrieve(self, db, openai_service, query: str, k: Optional[int] = None,
+                       min_score: Optional[float] = None, mode: str = "hybrid") -> List[Passage]:
+        """
+        The ``k`` best chunks for ``query``, best first. "vector" ranks by
+        embedding similarity, keeping chunks scoring at least ``min_score``;
+        "lexical" ranks by BM25 the chunks holding KB_LEXICAL_MIN_MATCH of the
+        query's term weight; "hybrid" fuses the top KB_FUSION_CANDIDATES of
+        both by reciprocal rank, and answers from the lexical index alone when
+        the query cannot be embedded.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}")
+        k = k or settings.KB_TOP_K
+        min_score = settings.KB_MIN_SCORE if min_score is None else min_score
+        use_vector = mode != "lexical" and len(self.index) > 0
+        use_lexical = mode != "vector" and self.lexical is not None and len(self.lexical) > 0
+        depth = max(k, settings.KB_FUSION_CANDIDATES) if use_vector and use_lexical else k
+        loop = asyncio.get_running_loop()
+
+        vector_hits: List[Tuple[int, int, float]] = []
+        if use_vector:
+            try:
+                vector = await self._query_vector(openai_service, query)
+            except OpenAIServiceError as e:
+                if not use_lexical:
+                    raise
+                logger.warning("Knowledge base search falling back to lexical matches: %s", e)
+                self.lexical_fallbacks += 1
+                use_vector = False
+            else:
+                hits = await loop.run_in_executor(None, self.index.search, vector, depth)
+                vector_hits = [hit for hit in hits if hit[2] >= min_score]
+        lexical_hits: List[Tuple[int, int, float]] = []
+        if use_lexical:
+            lexical_hits = await loop.run_in_executor(
+                None, self.lexical.search, query, depth, settings.KB_LEXICAL_MIN_MATCH
+            )
+        if not use_vector and not use_lexical:
+            return []
+        self.searches += 1
+        if use_vector and use_lexical:
+            hits = reciprocal_rank_fusion([vector_hits, lexical_hits], settings.KB_RRF_K)[:k]
+        else:
+            hits = vector_hits or lexical_hits
+
+        missing = [chunk_id for chunk_id, _, _ in hits if self._passages.get(str(chunk_id)) is None]
+        if missing:
+            for chunk, title, source in await KnowledgeChunkRepository(db).get_passages(missing):
+                self._passages.set(str(chunk.id), (title, source, chunk.content))
+
+        vector_scores = {chunk_id: score for chunk_id, _, score in vector_hits}
+        lexical_scores = {chunk_id: score for chunk_id, _, score in lexical_hits}
+        passages = []
+        for chunk_id, document_id, score in hits:
+            cached = self._passages.get(str(chunk_id))
+            if cached is not None:
+                title, source, content = cached
+                passages.append(Passage(chunk_id, document_id, title, source, content, score,
+                                        vector_scores.get(chunk_id), lexical_scores.get(chunk_id)))
+        return passages
+
+def format_knowledge(passages: Sequence[Passage], max_tokens: int) -> Optional[str]:
+    """Numbered passages for the prompt, best first, cut off at ``max_tokens``"""
+    parts = []
+    used = count_tokens(KNOWLEDGE_PREFIX)
+    for number, passage in enumerate(passages, 1):
+        heading = f"[{number}] {passage.title}" + (f"（{passage.source}）" if passage.source else "")
+        part = f"{heading}\n{passage.content}"
+        tokens = count_tokens(part) + 1
+        if used + tokens > max_tokens:
+            break
+        parts.append(part)
+        used += tokens
+    if not parts:
+        return None
+    return KNOWLEDGE_PREFIX + "\n\n".join(parts)
+
+knowledge_base = KnowledgeBase(
+    index_dir=settings.KB_INDEX_DIR,
+    nprobe=settings.KB_NPROBE,
+    analyzer=TextAnalyzer(settings.KB_TOKENIZER, settings.KB_JIEBA_USER_DICT or None)
+    if settings.KB_LEXICAL_ENABLED else None
+)
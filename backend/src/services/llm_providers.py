@@ -0,0 +1,238 @@
+import json
+import math
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+import httpx
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError, InternalServerError, RateLimitError
+from ..config import settings
+from ..core.metrics import OPENAI_REQUEST_DURATION
+from .admission import AdmissionController, AdmissionRejected, CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# 可重试的上游错误：限流、网络/超时、5xx
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+# 请求本身有问题，换一个服务商也不会成功
+CLIENT_ERROR_STATUSES = (400, 413, 422)
+
+class OpenAIServiceError(Exception):
+    """
+    上游调用失败
+    Args:
+        status_code: 建议返回给客户端的 HTTP 状态码
+        retry_after: 建议客户端重试前等待的秒数
+        retryable: 换一个服务商或稍后重试是否可能成功
+        upstream: 是否为上游返回的错误（否则为本地准入/熔断拒绝）
+    """
+
+    def __init__(self, message: str, status_code: int = 502, retry_after: Optional[float] = None,
+                 retryable: bool = False, upstream: bool = True):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.retryable = retryable
+        self.upstream = upstream
+
+    @property
+    def headers(self) -> Optional[Dict[str, str]]:
+        if self.retry_after is None:
+            return None
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+@dataclass
+class ProviderConfig:
+    name: str
+    base_url: str
+    api_key: str
+    model: str
+    embedding_model: str
+    weight: float = 1.0
+    max_concurrency: int = 50
+    rpm_limit: int = 0
+    tpm_limit: int = 0
+
+def load_provider_configs() -> List[ProviderConfig]:
+    """
+    读取 OPENAI_PROVIDERS（JSON 数组）；未配置时退回单个 OPENAI_API_BASE/OPENAI_MODEL
+    每项可包含 name、base_url、api_key、model、embedding_model、weight、
+    max_concurrency、rpm_limit、tpm_limit，缺省值取全局 OPENAI_* 配置
+    """
+    defaults = {
+        "base_url": settings.OPENAI_API_BASE,
+        "api_key": settings.OPENAI_API_KEY,
+        "model": settings.OPENAI_MODEL,
+        "embedding_model": settings.OPENAI_EMBEDDING_MODEL,
+        "max_concurrency": settings.OPENAI_MAX_CONCURRENCY,
+        "rpm_limit": settings.OPENAI_RPM_LIMIT,
+        "tpm_limit": settings.OPENAI_TPM_LIMIT
+    }
+    entries = json.loads(settings.OPENAI_PROVIDERS) if settings.OPENAI_PROVIDERS else [{}]
+    return [
+        ProviderConfig(**{**defaults, "name": f"provider{index}", **entry})
+        for index, entry in enumerate(entries)
+    ]
+
+class Provider:
+    """
+    一个 OpenAI 兼容的服务端点，拥有独立的准入控制、熔断器与延迟统计
+    延迟与错误率使用 EWMA 平滑，另保留最近若干次延迟用于计算分位数
+    """
+
+    def __init__(self, config: ProviderConfig, http_client: httpx.AsyncClient):
+        self.name = config.name
+        self.model = config.model
+        self.embedding_model = config.embedding_model
+        self.weight = config.weight
+        self.client = AsyncOpenAI(
+            api_key=config.api_key,
+            base_url=config.base_url,
+            http_client=http_client,
+            max_retries=0  # 重试与故障转移由 OpenAIService 统一处理
+        )
+        self.admission = AdmissionController(
+            max_concurrency=config.max_concurrency,
+            requests_per_minute=config.rpm_limit,
+            tokens_per_minute=config.tpm_limit,
+            max_wait=settings.OPENAI_ADMISSION_TIMEOUT
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.OPENAI_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.OPENAI_BREAKER_RESET_TIMEOUT
+        )
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.latencies = deque(maxlen=settings.OPENAI_LATENCY_WINDOW)
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def available(self) -> bool:
+        return self.breaker.state != "open"
+
+    def score(self) -> float:
+        """越低越好：按延迟、在途请求数与错误率打分，再按权重折算"""
+        latency = self.latency if self.latency is not None else 0.0
+        return (latency + 0.001) * (1 + self.admission.in_flight) * (1 + 10 * self.error_rate) / self.weight
+
+    def quantile(self, q: float) -> Optional[float]:
+        """样本不足时返回 None"""
+        if len(self.latencies) < settings.OPENAI_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def _observe(self, seconds: float, error: bool = False, cancelled: bool = False):
+        alpha = settings.OPENAI_LATENCY_EWMA_ALPHA
+        if not cancelled:
+            self.requests += 1
+            self.errors += error
+            self.error_rate = alpha * error + (1 - alpha) * self.error_rate
+        if error:
+            return
+        # 被取消的请求（如对冲中落败）只知道延迟的下界，不计入分位数样本
+        if not cancelled:
+            self.latencies.append(seconds)
+        if self.latency is None or not cancelled or seconds > self.latency:
+            self.latency = seconds if self.latency is None else alpha * seconds + (1 - alpha) * self.latency
+
+    def stats(self) -> dict:
+        return dict(
+            self.admission.stats(),
+            name=self.name,
+            model=self.model,
+            weight=self.weight,
+            breaker=self.breaker.state,
+            latency_ewma=self.latency,
+            latency_p95=self.quantile(0.95),
+            error_rate=self.error_rate,
+            requests=self.requests,
+            errors=self.errors
+        )
+
+    async def close(self):
+        await self.client.close()
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        """解析上游返回的 Retry-After / retry-after-ms 响应头"""
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        try:
+            if response.headers.get("retry-after-ms"):
+                return float(response.headers["retry-after-ms"]) / 1000
+            value = response.headers.get("retry-after")
+            if not value:
+                return None
+            try:
+                return float(value)
+            except ValueError:
+                return (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+
+    def to_error(self, error: Exception) -> OpenAIServiceError:
+        prefix = f"OpenAI API error ({self.name})"
+        if isinstance(error, RateLimitError):
+            return OpenAIServiceError(f"{prefix}: rate limited: {error}", 429, self._retry_after(error), retryable=True)
+        if isinstance(error, APITimeoutError):
+            return OpenAIServiceError(f"{prefix}: timed out: {error}", 504, retryable=True)
+        if isinstance(error, RETRYABLE_ERRORS):
+            return OpenAIServiceError(f"{prefix}: {error}", 502, self._retry_after(error), retryable=True)
+        if isinstance(error, APIStatusError):
+            return OpenAIServiceError(f"{prefix}: {error}", 502, retryable=error.status_code not in CLIENT_ERROR_STATUSES)
+        return OpenAIServiceError(f"{prefix}: {error}", 502)
+
+    async def attempt(self, estimated_tokens: int, request: Callable[["Provider"], Awaitable],
+                      keep_slot: bool = False, kind: str = "chat"):
+        """
+        经熔断与准入控制向该服务商发起一次请求（不重试）
+        Args:
+            estimated_tokens: 预估的 token 消耗，用于 TPM 预算
+            request: 接收 Provider、发起请求的协程函数
+            keep_slot: 成功后保留并发名额（流式响应结束时由调用方释放）
+            kind: 请求类型（chat/stream/embedding），用于监控指标
+        Raises:
+            OpenAIServiceError: 请求失败或被本地拒绝
+        """
+        try:
+            self.breaker.before_call()
+            await self.admission.acquire(estimated_tokens)
+        except AdmissionRejected as e:
+            self.breaker.release()
+            raise OpenAIServiceError(f"{self.name}: {e}", 503, e.retry_after, retryable=True, upstream=False)
+
+        started = time.monotonic()
+        try:
+            result = await request(self)
+        except BaseException as e:
+            elapsed = time.monotonic() - started
+            self.admission.release()
+            self.admission.adjust_tokens(estimated_tokens)
+            if not isinstance(e, Exception):
+                self.breaker.release()
+                self._observe(elapsed, cancelled=True)
+                OPENAI_REQUEST_DURATION.labels(self.name, kind, "cancelled").observe(elapsed)
+                raise
+            OPENAI_REQUEST_DURATION.labels(self.name, kind, "error").observe(elapsed)
+            error = self.to_error(e)
+            # 被限流或请求本身有误说明上游仍然可用，不计入熔断
+            if error.retryable and not isinstance(e, RateLimitError):
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+            self._observe(elapsed, error=error.retryable)
+            raise error from e
+
+        elapsed = time.monotonic() - started
+        self.breaker.record_success()
+        self._observe(elapsed)
+        OPENAI_REQUEST_DURATION.labels(self.name, kind, "ok").observe(elapsed)
+        if not keep_slot:
+            self.admission.release()
+        return result
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import re
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from ..config import settings
+from ..core.text_analysis import TextAnalyzer
+from ..models.base import Message
+from ..repositories import MessageRepository
+from ..repositories.pagination import decode_cursor
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("auto", "fulltext", "memory")
+MAX_QUERY_TERMS = 8
+# Characters of context returned around the first match
+SNIPPET_CHARS = 160
+CATCH_UP_BATCH = 5000
+# Candidate ids checked against the database per query
+CANDIDATE_BATCH = 500
+
+@dataclass
+class MessageHit:
+    message: Message
+    session_title: str
+    snippet: str
+    # (start, end) offsets into snippet of the matched text
+    highlights: List[Tuple[int, int]]
+
+def parse_query(query: str) -> List[str]:
+    """Whitespace-separated search terms, every one of which a message must contain"""
+    terms = []
+    # Terms become quoted phrases, inside which boolean-mode operators are plain text
+    for term in query.replace('"', " ").split():
+        if term.lower() not in terms:
+            terms.append(term.lower())
+    return terms[:MAX_QUERY_TERMS]
+
+def boolean_query(terms: Sequence[str]) -> str:
+    """All terms as required phrases; with the ngram parser a phrase matches as a substring"""
+    return " ".join(f'+"{term}"' for term in terms)
+
+def highlight(content: str, terms: Sequence[str], analyzer: Optional[TextAnalyzer] = None,
+              width: int = SNIPPET_CHARS) -> Tuple[str, List[Tuple[int, int]]]:
+    """
+    A window of ``content`` around the first match and the spans of every
+    match inside it. Terms are matched case-insensitively, longest first;
+    ``analyzer`` adds their parts, so a term found only in pieces (as the
+    in-process index allows) is still marked.
+    """
+    candidates = set(terms)
+    if analyzer is not None:
+        candidates.update(part for term in terms for part in analyzer(term))
+    candidates.discard("")
+    if not candidates:
+        return content[:width], []
+    pattern = re.compile("|".join(re.escape(term) for term in sorted(candidates, key=len, reverse=True)),
+                         re.IGNORECASE)
+    matches = list(pattern.finditer(content))
+    if not matches:
+        start = 0
+    else:
+        # Open a little before the first match so it reads in context
+        start = max(0, min(matches[0].start() - width // 4, len(content) - width))
+    end = min(len(content), start + width)
+    prefix = "…" if start else ""
+    suffix = "…" if end < len(content) else ""
+    offset = len(prefix) - start
+    spans = [(match.start() + offset, match.end() + offset) for match in matches
+             if match.start() >= start and match.end() <= end]
+    return prefix + content[start:end] + suffix, spans
+
+class FulltextBackend:
+    """MySQL FULLTEXT search over the ngram index created by migration 006"""
+
+    name = "fulltext"
+
+    async def search(self, db, user_id: int, terms: List[str], limit: int, cursor: Optional[str],
+                     session_id: Optional[int]) -> List[Tuple[Message, str]]:
+        return await MessageRepository(db).search_fulltext(user_id, boolean_query(terms), limit, cursor, session_id)
+
+class InvertedIndexBackend:
+    """
+    In-process stand-in for the FULLTEXT index on databases without one,
+    such as the SQLite used for tests and benchmarks.
+
+    Posting lists of message ids are kept per (user, term), with terms from a
+    bigram TextAnalyzer so matching behaves like MySQL's ngram parser. Before
+    each query the index reads the messages added since the last one; the
+    database then rechecks the candidates, dropping deleted messages and
+    applying the session filter and cursor. Messages are indexed in id
+    order, which relies on ids committing in order as they do under
+    SQLite's single writer.
+    """
+
+    name = "memory"
+
+    def __init__(self, analyzer: TextAnalyzer):
+        self.analyzer = analyzer
+        self._postings: Dict[Tuple[int, str], array] = {}
+        self._last_id = 0
+        self._indexed = 0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _add(self, rows: List[Tuple[int, int, str]]):
+        postings = self._postings
+        for message_id, user_id, content in rows:
+            for term in set(self.analyzer(content)):
+                key = (user_id, term)
+                ids = postings.get(key)
+                if ids is None:
+                    ids = postings[key] = array("q")
+                ids.append(message_id)
+        self._indexed += len(rows)
+
+    async def _catch_up(self, db):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            repo = MessageRepository(db)
+            loop = asyncio.get_running_loop()
+            while True:
+                rows = await repo.get_contents_after(self._last_id, CATCH_UP_BATCH)
+                if not rows:
+                    return
+                await loop.run_in_executor(None, self._add, rows)
+                self._last_id = rows[-1][0]
+                if len(rows) < CATCH_UP_BATCH:
+                    return
+
+    def _candidates(self, user_id: int, terms: List[str]) -> np.ndarray:
+        """Ids of the user's messages holding every term, ascending"""
+        parts = {part for term in terms for part in self.analyzer(term)}
+        lists = [self._postings.get((user_id, part)) for part in parts]
+        if not lists or any(ids is None for ids in lists):
+            return np.zeros(0, dtype=np.int64)
+        lists.sort(key=len)
+        candidates = np.array(lists[0], dtype=np.int64)
+        for ids in lists[1:]:
+            if not len(candidates):
+                break
+            candidates = np.intersect1d(candidates, np.array(ids, dtype=np.int64), assume_unique=True)
+        return candidates
+
+    async def search(self, db, user_id: int, terms: List[str], limit: int, cursor: Optional[str],
+                     session_id: Optional[int]) -> List[Tuple[Message, str]]:
+        await self._catch_up(db)
+        candidates = self._candidates(user_id, terms)[::-1]
+        if cursor:
+            _, before_id = decode_cursor(cursor)
+            candidates = candidates[candidates < before_id]
+        repo = MessageRepository(db)
+        found: List[Tuple[Message, str]] = []
+        for start in range(0, len(candidates), CANDIDATE_BATCH):
+            batch = candidates[start:start + CANDIDATE_BATCH].tolist()
+            found += await repo.search_by_ids(user_id, batch, limit - len(found), cursor, session_id)
+            if len(found) >= limit:
+                break
+        return found
+
+    def stats(self) -> dict:
+        return {"indexed_messages": self._indexed, "posting_lists": len(self._postings)}
+
+class MessageSearch:
+    """
+    Search over a user's message history, newest match first, with keyset
+    pagination and highlighted snippets. ``backend`` "auto" uses the MySQL
+    FULLTEXT index when connected to MySQL and the in-process
+    InvertedIndexBackend otherwise.
+    """
+
+    def __init__(self, backend: str = "auto"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown message search backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+        self.configured = backend
+        self.backend = None
+        # Bigrams like MySQL's ngram parser; also used to highlight partial matches
+        self.analyzer = TextAnalyzer("bigram")
+        self.searches = 0
+
+    def _select(self, db):
+        if self.backend is None:
+            backend = self.configured
+            if backend == "auto":
+                dialect = db.get_bind().dialect
+                mysql = dialect.name == "mysql" and not getattr(dialect, "is_mariadb", False)
+                backend = "fulltext" if mysql else "memory"
+            self.backend = FulltextBackend() if backend == "fulltext" else InvertedIndexBackend(self.analyzer)
+            logger.info("Message search uses the %s backend", self.backend.name)
+        return self.backend
+
+    async def search(self, db, user_id: int, query: str, limit: int = 20, cursor: Optional[str] = None,
+                     session_id: Optional[int] = None) -> List[MessageHit]:
+        """Messages containing every term of ``query``; raises InvalidCursor for a bad cursor"""
+        terms = parse_query(query)
+        if not terms:
+            return []
+        if cursor:
+            decode_cursor(cursor)
+        backend = self._select(db)
+        rows = await backend.search(db, user_id, terms, limit, cursor, session_id)
+        self.searches += 1
+        hits = []
+        for message, session_title in rows:
+            snippet, spans = highlight(message.content, terms, self.analyzer)
+            hits.append(MessageHit(message, session_title, snippet, spans))
+        return hits
+
+    def stats(self) -> dict:
+        stats = {"searches": self.searches, "backend": self.backend.name if self.backend else self.configured}
+        if isinstance(self.backend, InvertedIndexBackend):
+            stats.update(self.backend.stats())
+        return stats
+
+message_search = MessageSearch(settings.MESSAGE_SEARCH_BACKEND)
@@ -1,18 +1,162 @@
-from typing import List, Dict, Optional
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, List, Dict, Optional
+import httpx
+from ..config import settings
+from ..core.metrics import OPENAI_TIME_TO_FIRST_TOKEN, OPENAI_TOKENS, OPENAI_TOKENS_PER_SECOND
+from .llm_providers import OpenAIServiceError, Provider, load_provider_configs
+from .tokens import count_prompt_tokens, count_tokens
 
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+# 一小部分请求按权重随机路由，让较慢的服务商也能持续更新延迟统计
+EXPLORE_PROBABILITY = 0.05
 
 class OpenAIService:
     def __init__(self):
-        self.client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            base_url=os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1"),  # 可以配置自定义基础URL
+        # 进程内共享一个带连接池的 HTTP 客户端，避免每个请求重新建立 TLS 连接
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT)
         )
-        self.model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")  # 默认使用 gpt-3.5-turbo
-        
+        # 可配置多个 OpenAI 兼容的服务商（见 OPENAI_PROVIDERS），按延迟与错误率路由
+        self.providers = [Provider(config, self.http_client) for config in load_provider_configs()]
+        self.model = self.providers[0].model  # 默认使用 gpt-3.5-turbo
+        self.embedding_model = self.providers[0].embedding_model
+        self.retries = 0
+        self.failovers = 0
+        self.hedges = 0
+
+    async def close(self):
+        """关闭底层 HTTP 连接池"""
+        for provider in self.providers:
+            await provider.close()
+        await self.http_client.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "retries": self.retries,
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "providers": [provider.stats() for provider in self.providers]
+        }
+
+    @staticmethod
+    def _record_usage(provider: Provider, kind: str, prompt_tokens: int, completion_tokens: int, seconds: float):
+        OPENAI_TOKENS.labels(provider.name, "prompt").inc(prompt_tokens)
+        OPENAI_TOKENS.labels(provider.name, "completion").inc(completion_tokens)
+        if completion_tokens and seconds > 0:
+            OPENAI_TOKENS_PER_SECOND.labels(provider.name, kind).observe(completion_tokens / seconds)
+
+    def _pick(self, exclude: List[Provider], embeddings: bool = False) -> Optional[Provider]:
+        """
+        按权重随机抽取两个可用服务商，取得分较低者（power of two choices）
+        """
+        candidates = [
+            provider for provider in self.providers
+            if provider not in exclude and provider.available
+            # 向量必须来自同一模型，否则语义缓存中的相似度没有意义
+            and (not embeddings or provider.embedding_model == self.embedding_model)
+        ]
+        if len(candidates) <= 1:
+            return candidates[0] if candidates else None
+        first = random.choices(candidates, weights=[p.weight for p in candidates])[0]
+        if random.random() < EXPLORE_PROBABILITY:
+            return first
+        rest = [p for p in candidates if p is not first]
+        second = random.choices(rest, weights=[p.weight for p in rest])[0]
+        return min(first, second, key=lambda p: p.score())
+
+    async def _call(self, estimated_tokens: int, request: Callable[[Provider], Awaitable], kind: str,
+                    keep_slot: bool = False, hedge: bool = False, embeddings: bool = False):
+        """
+        选择服务商发起请求：失败时立即转移到其他服务商，所有服务商都失败后
+        再按带抖动的指数退避重试整轮
+        Args:
+            estimated_tokens: 预估的 token 消耗，用于 TPM 预算
+            request: 接收 Provider、发起请求的协程函数
+            kind: 请求类型（chat/stream/embedding），用于监控指标
+            keep_slot: 成功后保留并发名额（流式响应结束时由调用方释放）
+            hedge: 请求慢于该服务商的 p95 延迟时，向另一服务商并行发起备份请求
+        Returns:
+            (Provider, request 的返回值)
+        """
+        attempt = 0
+        tried: List[Provider] = []
+        last_error: Optional[OpenAIServiceError] = None
+        while True:
+            provider = self._pick(tried, embeddings)
+            if provider is None:
+                if last_error is None:
+                    raise OpenAIServiceError("No upstream provider available", 503, settings.OPENAI_BREAKER_RESET_TIMEOUT)
+                # 本地拒绝（预算耗尽/熔断）不做退避重试，直接返回给客户端
+                retry_after = last_error.retry_after or 0
+                if (not last_error.upstream or attempt >= settings.OPENAI_MAX_RETRIES
+                        or retry_after > settings.OPENAI_RETRY_MAX_DELAY):
+                    raise last_error
+                # 带抖动的指数退避，且不早于上游要求的 Retry-After
+                backoff = min(settings.OPENAI_RETRY_MAX_DELAY, settings.OPENAI_RETRY_BASE_DELAY * 2 ** attempt)
+                delay = max(retry_after, random.uniform(0, backoff))
+                attempt += 1
+                self.retries += 1
+                logger.warning("OpenAI request failed (%s), retry %d in %.2fs", last_error, attempt, delay)
+                await asyncio.sleep(delay)
+                tried = []
+                continue
+
+            try:
+                if hedge:
+                    return await self._hedged(provider, tried, estimated_tokens, request, kind)
+                return provider, await provider.attempt(estimated_tokens, request, keep_slot, kind)
+            except OpenAIServiceError as e:
+                if not e.retryable:
+                    raise
+                tried.append(provider)
+                last_error = e
+                if len(self.providers) > 1:
+                    self.failovers += 1
+
+    async def _hedged(self, provider: Provider, tried: List[Provider], estimated_tokens: int,
+                      request: Callable[[Provider], Awaitable], kind: str):
+        """
+        对冲请求：主请求超过 p95 延迟仍未返回时向另一服务商发起备份请求，
+        采用先成功的结果并取消另一个
+        """
+        primary = asyncio.ensure_future(provider.attempt(estimated_tokens, request, kind=kind))
+        attempts = {primary: provider}
+        try:
+            p95 = provider.quantile(settings.OPENAI_HEDGE_QUANTILE)
+            backup_provider = self._pick(tried + [provider]) if p95 is not None else None
+            if backup_provider is None:
+                return provider, await primary
+            done, _ = await asyncio.wait({primary}, timeout=max(p95, settings.OPENAI_HEDGE_MIN_DELAY))
+            if done:
+                return provider, primary.result()
+
+            self.hedges += 1
+            backup = asyncio.ensure_future(backup_provider.attempt(estimated_tokens, request, kind=kind))
+            attempts[backup] = backup_provider
+            pending = set(attempts)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return attempts[task], task.result()
+                    error = error or task.exception()
+            tried.append(backup_provider)
+            raise error
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+
     async def create_chat_completion(
         self,
         messages: List[Dict[str, str]],
@@ -27,26 +171,39 @@ class OpenAIService:
             max_tokens: 最大token数限制
         Returns:
             Dict: OpenAI的响应
+        Raises:
+            OpenAIServiceError: 上游调用失败（已按策略重试与故障转移）
         """
-        try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                stream=False
-            )
-            return {
-                "content": response.choices[0].message.content,
-                "role": "assistant",
-                "tokens": {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens
-                }
+        prompt_tokens = count_prompt_tokens(messages, self.model)
+        estimated_tokens = prompt_tokens + (max_tokens or settings.MAX_TOKENS)
+        started = time.monotonic()
+        provider, response = await self._call(estimated_tokens, lambda p: p.client.chat.completions.create(
+            model=p.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=False
+        ), "chat", hedge=settings.OPENAI_HEDGE_ENABLED)
+        content = response.choices[0].message.content
+        # 部分自建或镜像的兼容接口不返回 usage，按本地估算计数
+        if response.usage is not None:
+            prompt_tokens = response.usage.prompt_tokens
+            completion_tokens = response.usage.completion_tokens
+            total_tokens = response.usage.total_tokens
+        else:
+            completion_tokens = count_tokens(content or "", self.model)
+            total_tokens = prompt_tokens + completion_tokens
+        provider.admission.adjust_tokens(estimated_tokens - total_tokens)
+        self._record_usage(provider, "chat", prompt_tokens, completion_tokens, time.monotonic() - started)
+        return {
+            "content": content,
+            "role": "assistant",
+            "tokens": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": total_tokens
             }
-        except Exception as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
+        }
             
     async def create_streaming_chat_completion(
         self,
@@ -62,19 +219,72 @@ class OpenAIService:
             max_tokens: 最大token数限制
         Yields:
             str: 流式响应的文本片段
+        Raises:
+            OpenAIServiceError: 上游调用失败（仅在收到首个片段前重试与故障转移）
         """
+        prompt_tokens = count_prompt_tokens(messages, self.model)
+        estimated_tokens = prompt_tokens + (max_tokens or settings.MAX_TOKENS)
+        started = time.monotonic()
+        provider, response = await self._call(estimated_tokens, lambda p: p.client.chat.completions.create(
+            model=p.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        ), "stream", keep_slot=True)
+
+        chunks = []
+        first_token_at = None
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                stream=True
-            )
-            
             async for chunk in response:
-                if chunk.choices[0].delta.content:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                        OPENAI_TIME_TO_FIRST_TOKEN.labels(provider.name).observe(first_token_at - started)
+                    chunks.append(chunk.choices[0].delta.content)
                     yield chunk.choices[0].delta.content
-                    
         except Exception as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
\ No newline at end of file
+            provider.breaker.record_failure()
+            raise provider.to_error(e) from e
+        finally:
+            await response.close()
+            provider.admission.release()
+            completion_tokens = count_tokens("".join(chunks), self.model)
+            provider.admission.adjust_tokens(estimated_tokens - prompt_tokens - completion_tokens)
+            # 流式输出的速率从首个 token 开始计算，不含排队与首包等待
+            self._record_usage(
+                provider, "stream", prompt_tokens, completion_tokens,
+                time.monotonic() - first_token_at if first_token_at is not None else 0.0
+            )
+
+    async def create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        获取文本向量
+        Args:
+            texts: 待向量化的文本列表
+        Returns:
+            List[List[float]]: 与输入顺序一致的向量列表
+        """
+        estimated_tokens = sum(count_tokens(text) for text in texts)
+        provider, response = await self._call(estimated_tokens, lambda p: p.client.embeddings.create(
+            model=p.embedding_model,
+            input=texts
+        ), "embedding", embeddings=True)
+        if response.usage is not None:
+            OPENAI_TOKENS.labels(provider.name, "embedding").inc(response.usage.total_tokens)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+_openai_service: Optional[OpenAIService] = None
+
+def get_openai_service() -> OpenAIService:
+    """返回进程级共享的 OpenAIService（可作为 FastAPI 依赖使用）"""
+    global _openai_service
+    if _openai_service is None:
+        _openai_service = OpenAIService()
+    return _openai_service
+
+async def close_openai_service():
+    global _openai_service
+    if _openai_service is not None:
+        await _openai_service.close()
+        _openai_service = None
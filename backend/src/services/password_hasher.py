@@ -0,0 +1,84 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+from ..config import settings
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full and the request should be shed"""
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small dedicated thread pool so the ~100-300 ms of CPU per
+    hash never blocks the event loop. bcrypt releases the GIL, so threads
+    scale across cores. At most ``max_workers + max_queue`` operations may be
+    outstanding; beyond that callers get PasswordHasherBusy instead of
+    queueing without bound.
+    """
+
+    def __init__(self, context: CryptContext, max_workers: int, max_queue: int):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Operations waiting for a free worker"""
+        return max(0, self.in_flight - self.max_workers)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
+
+    async def _run(self, fn, *args):
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password. When the stored hash uses outdated parameters the
+        second item is a fresh hash to persist, otherwise None.
+        """
+        return await self._run(self.context.verify_and_update, password, hashed)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+# min/max rounds pin the cost factor, so hashes made with any other
+# BCRYPT_ROUNDS value report needs_update and are rehashed on next login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS
+)
+
+password_hasher = PasswordHasher(
+    pwd_context,
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE
+)
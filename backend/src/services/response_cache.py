@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+from ..config import settings
+from ..core.cache import Cache
+from ..core.vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalise_text(text: str) -> str:
+    """Fold width variants, case and whitespace so trivially different prompts share a key"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text or "")).strip().casefold()
+
+def fingerprint(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+def prompt_fingerprint(model: str, messages: List[Dict[str, str]], temperature: float,
+                       max_tokens: Optional[int]) -> str:
+    """Key identifying a completion request up to insignificant differences in the prompt text"""
+    normalised = [[m["role"], normalise_text(m["content"])] for m in messages]
+    return fingerprint(model, temperature, max_tokens, normalised)
+
+@dataclass
+class CacheLookup:
+    key: str
+    # Set only for turns eligible for the semantic tier
+    scope: Optional[str] = None
+    embedding: Optional[Sequence[float]] = None
+    response: Optional[Dict] = None
+    tier: Optional[str] = None
+
+class ResponseCache:
+    """
+    Cache of completed chat responses in front of OpenAIService.
+
+    The exact tier keys a response on a hash of the model, sampling settings
+    and the normalised prompt, and is stored through core.cache so all workers
+    share it. The optional semantic tier covers stateless turns (system prompt
+    plus a single user message): the question is embedded and matched against
+    earlier questions asked under the same system prompt and settings, and a
+    close enough match is served from the exact tier. The vector index is per
+    process.
+    """
+
+    def __init__(self, ttl: int, maxsize: int, semantic_maxsize: int):
+        self.cache = Cache("response", ttl=ttl, maxsize=maxsize)
+        self.index = VectorIndex(maxsize=semantic_maxsize, ttl=ttl)
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self.bypassed = 0
+        self.stored = 0
+
+    def stats(self) -> dict:
+        hits = sum(self.hits.values())
+        lookups = hits + self.misses
+        return {
+            "exact_hits": self.hits["exact"],
+            "semantic_hits": self.hits["semantic"],
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "stored": self.stored,
+            "semantic_entries": len(self.index),
+            "hit_rate": hits / lookups if lookups else 0.0
+        }
+
+    @staticmethod
+    def _is_stateless(messages: List[Dict[str, str]]) -> bool:
+        roles = [m["role"] for m in messages]
+        return roles == ["user"] or roles == ["system", "user"]
+
+    async def lookup(self, openai_service, messages: List[Dict[str, str]], temperature: float,
+                     max_tokens: Optional[int], bypass: bool = False,
+                     embedding: Optional[Sequence[float]] = None) -> Optional[CacheLookup]:
+        """
+        Look the prompt up in both tiers. Returns None when caching is off or
+        bypassed; otherwise a CacheLookup whose ``response`` is set on a hit and
+        which should be handed to store() after a miss. ``embedding`` is the
+        user message's embedding when the caller already has it, saving the
+        semantic tier a request.
+        """
+        if not settings.RESPONSE_CACHE_ENABLED or bypass:
+            self.bypassed += 1
+            return None
+
+        model = openai_service.model
+        lookup = CacheLookup(key=prompt_fingerprint(model, messages, temperature, max_tokens))
+
+        cached = await self.cache.get(lookup.key)
+        if cached is not None:
+            return self._hit(lookup, cached, "exact")
+
+        if settings.RESPONSE_CACHE_SEMANTIC_ENABLED and self._is_stateless(messages):
+            system_prompt = normalise_text(messages[0]["content"]) if len(messages) == 2 else None
+            lookup.scope = fingerprint(model, temperature, max_tokens, system_prompt)
+            try:
+                if embedding is None:
+                    embedding = (await openai_service.create_embeddings([messages[-1]["content"]]))[0]
+            except Exception as e:
+                logger.warning("Skipping semantic cache lookup: %s", e)
+            else:
+                lookup.embedding = embedding
+                match = self.index.search(lookup.embedding, lookup.scope, settings.RESPONSE_CACHE_SIMILARITY)
+                if match is not None:
+                    cached = await self.cache.get(match[0])
+                    if cached is not None:
+                        return self._hit(lookup, cached, "semantic")
+
+        self.misses += 1
+        return lookup
+
+    def _hit(self, lookup: CacheLookup, cached: Dict, tier: str) -> CacheLookup:
+        self.hits[tier] += 1
+        lookup.response = dict(cached, cached=True)
+        lookup.tier = tier
+        return lookup
+
+    async def store(self, lookup: CacheLookup, response: Dict):
+        if not response.get("content"):
+            return
+        await self.cache.set(lookup.key, {
+            "content": response["content"],
+            "role": response["role"],
+            "tokens": response["tokens"]
+        })
+        if lookup.embedding is not None:
+            self.index.add(lookup.embedding, lookup.scope, lookup.key)
+        self.stored += 1
+
+response_cache = ResponseCache(
+    ttl=settings.RESPONSE_CACHE_TTL,
+    maxsize=settings.RESPONSE_CACHE_MAXSIZE,
+    semantic_maxsize=settings.RESPONSE_CACHE_SEMANTIC_MAXSIZE
+)
@@ -0,0 +1,277 @@
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Sequence, Set, Tuple
+from ..config import settings
+from ..core.cache import RedisError, get_redis, mark_redis_failed
+from ..models.base import Message, Session as ChatSession
+
+logger = logging.getLogger(__name__)
+
+# What a chat turn reads from the session. None of these change during a turn;
+# archive_session() and save_summary(), which do change them, drop the entry.
+SESSION_FIELDS = ("id", "user_id", "title", "status", "system_prompt", "temperature", "max_tokens",
+                  "summary", "summary_message_id", "summary_tokens")
+MESSAGE_FIELDS = tuple(Message.__table__.columns.keys())
+# Head of a message list that holds the whole session; trimming to
+# SESSION_CACHE_MESSAGES pushes it out
+START = b"^"
+
+# Every write bumps the version, starting from a random value so an expired
+# and recreated version never repeats one a filler has read
+_BUMP_VERSION = """
+redis.call('SET', KEYS[3], ARGV[1], 'NX')
+redis.call('INCR', KEYS[3])
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+"""
+
+# ARGV: seed, ttl, max list length, messages...
+_APPEND = _BUMP_VERSION + """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 4, #ARGV do
+    redis.call('RPUSH', KEYS[2], ARGV[i])
+end
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[3]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+# ARGV: seed, ttl
+_INVALIDATE = _BUMP_VERSION + """
+redis.call('DEL', KEYS[1], KEYS[2])
+return 1
+"""
+
+# ARGV: version read before the database, ttl, session, list items oldest first.
+# Skipped when anything was written since, as the rows read may predate it.
+_FILL = """
+if (redis.call('GET', KEYS[3]) or '') ~= ARGV[1] or redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('DEL', KEYS[2])
+for i = 4, #ARGV do
+    redis.call('RPUSH', KEYS[2], ARGV[i])
+end
+redis.call('SET', KEYS[1], ARGV[3], 'EX', ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+SCRIPTS = {"append": _APPEND, "invalidate": _INVALIDATE, "fill": _FILL}
+
+def _dump_session(session: ChatSession) -> str:
+    return json.dumps({field: getattr(session, field) for field in SESSION_FIELDS}, ensure_ascii=False)
+
+def _dump_message(message: Message) -> str:
+    data = {field: getattr(message, field) for field in MESSAGE_FIELDS}
+    data["created_at"] = data["created_at"].isoformat()
+    return json.dumps(data, ensure_ascii=False)
+
+def _load_message(raw: bytes) -> Message:
+    data = json.loads(raw)
+    data["created_at"] = datetime.fromisoformat(data["created_at"])
+    return Message(**data)
+
+@dataclass
+class HotSession:
+    session: ChatSession
+    # Newest first
+    messages: List[Message]
+    # Whether messages are the whole session rather than only its newest part
+    complete: bool
+
+    def page(self, skip: int, limit: int, before: Optional[Tuple[datetime, int]] = None) -> Optional[List[Message]]:
+        """
+        A page of MessageRepository.get_session_messages() served from the
+        cached messages (``before`` is a decoded cursor), or None when the
+        page reaches past them.
+        """
+        if before is not None:
+            messages = [m for m in self.messages if (m.created_at, m.id) < before]
+        else:
+            messages = self.messages[skip:]
+        if len(messages) < limit and not self.complete:
+            return None
+        return messages[:limit]
+
+class SessionCache:
+    """
+    Write-through cache of active chat sessions in Redis: the fields a chat
+    turn reads from the session and its newest SESSION_CACHE_MESSAGES
+    messages, as a capped list that expires SESSION_CACHE_TTL seconds after
+    the last write. Chat turns and first pages of history are then served
+    without touching the database.
+
+    Repositories keep entries current once their transaction commits: new
+    messages are appended, and archiving or summarising a session drops its
+    entry. A miss reads the database and fills the entry, unless a write
+    raced with the read. Updates that cannot reach Redis are remembered and
+    the entries dropped once it is back; other workers may serve them until
+    then, at most for the TTL. Without Redis the cache is bypassed rather
+    than kept per process, since workers would not see each other's messages.
+    """
+
+    def __init__(self, enabled: bool, max_messages: int, ttl: int):
+        self.enabled = enabled
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self._client = None
+        self._scripts = {}
+        # Sessions whose update was lost while Redis was unreachable
+        self._lost: Set[int] = set()
+        self._lost_since = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.fill_conflicts = 0
+        self.writes = 0
+        self.errors = 0
+
+    @staticmethod
+    def _keys(session_id: int) -> List[str]:
+        # One hash tag so the scripts' keys share a cluster slot
+        prefix = f"zhida:hot_session:{{{session_id}}}"
+        return [f"{prefix}:meta", f"{prefix}:messages", f"{prefix}:version"]
+
+    def _failed(self, error: Exception):
+        self.errors += 1
+        mark_redis_failed(error)
+
+    def _lose(self, session_id: int):
+        if not self.enabled or not settings.REDIS_ENABLED:
+            return
+        if not self._lost:
+            self._lost_since = time.monotonic()
+        self._lost.add(session_id)
+
+    async def _redis(self):
+        """The Redis client with the scripts registered, or None when the cache is unavailable"""
+        if not self.enabled:
+            return None
+        redis = get_redis()
+        if redis is None:
+            return None
+        if redis is not self._client:
+            self._client = redis
+            self._scripts = {name: redis.register_script(source) for name, source in SCRIPTS.items()}
+        if self._lost:
+            lost, self._lost = self._lost, set()
+            # Entries older than the TTL have expired by themselves
+            if time.monotonic() - self._lost_since < self.ttl:
+                try:
+                    for session_id in lost:
+                        await self._run("invalidate", session_id)
+                except RedisError as e:
+                    self._lost |= lost
+                    self._failed(e)
+                    return None
+                logger.info("Dropped %d hot sessions updated while Redis was unavailable", len(lost))
+        return redis
+
+    async def _run(self, script: str, session_id: int, *args):
+        seed = random.getrandbits(48)
+        return await self._scripts[script](keys=self._keys(session_id), args=[seed, self.ttl, *args])
+
+    async def get(self, session_id: int, session_repo, message_repo) -> Optional[HotSession]:
+        """
+        The session with its newest messages, from Redis or else from the
+        database, filling the entry. None if the session does not exist or
+        the cache is unavailable.
+        """
+        redis = await self._redis()
+        if redis is None:
+            return None
+        meta_key, messages_key, version_key = self._keys(session_id)
+        try:
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.get(meta_key)
+                pipe.lrange(messages_key, 0, -1)
+                pipe.get(version_key)
+                meta, items, version = await pipe.execute()
+        except RedisError as e:
+            self._failed(e)
+            return None
+
+        if meta is not None:
+            self.hits += 1
+            complete = bool(items) and items[0] == START
+            # Concurrent turns may append out of order, and a fill racing an append may repeat one
+            messages = {message.id: message for message in map(_load_message, items[1:] if complete else items)}
+            ordered = sorted(messages.values(), key=lambda m: (m.created_at, m.id), reverse=True)
+            return HotSession(ChatSession(**json.loads(meta)), ordered, complete)
+
+        self.misses += 1
+        session = await session_repo.get(session_id)
+        if session is None:
+            return None
+        messages = await message_repo.get_session_messages(session_id, limit=self.max_messages)
+        hot = HotSession(session, messages, len(messages) < self.max_messages)
+        await self._fill(hot, version or b"")
+        return hot
+
+    async def _fill(self, hot: HotSession, version: bytes):
+        items = [START] if hot.complete else []
+        items += [_dump_message(message) for message in reversed(hot.messages)]
+        try:
+            filled = await self._scripts["fill"](
+                keys=self._keys(hot.session.id),
+                args=[version, self.ttl, _dump_session(hot.session), *items]
+            )
+        except RedisError as e:
+            self._failed(e)
+            return
+        if filled:
+            self.fills += 1
+        else:
+            self.fill_conflicts += 1
+
+    async def store_new(self, session: ChatSession):
+        """Cache a session just created, which has no messages yet"""
+        if await self._redis() is not None:
+            await self._fill(HotSession(session, [], True), b"")
+
+    async def add_messages(self, session_id: int, messages: Sequence[Message]):
+        """Append committed messages to the session's entry, if it is cached"""
+        if await self._redis() is None:
+            self._lose(session_id)
+            return
+        try:
+            await self._run("append", session_id, self.max_messages, *map(_dump_message, messages))
+            self.writes += 1
+        except RedisError as e:
+            self._failed(e)
+            self._lose(session_id)
+
+    async def invalidate(self, session_id: int):
+        if await self._redis() is None:
+            self._lose(session_id)
+            return
+        try:
+            await self._run("invalidate", session_id)
+            self.writes += 1
+        except RedisError as e:
+            self._failed(e)
+            self._lose(session_id)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "fills": self.fills,
+            "fill_conflicts": self.fill_conflicts,
+            "writes": self.writes,
+            "errors": self.errors,
+            "pending_invalidations": len(self._lost),
+        }
+
+session_cache = SessionCache(
+    enabled=settings.SESSION_CACHE_ENABLED,
+    max_messages=settings.SESSION_CACHE_MESSAGES,
+    ttl=settings.SESSION_CACHE_TTL
+)
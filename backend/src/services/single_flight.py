@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class _Stream:
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.event = asyncio.Event()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def publish(self):
+        # Wake everyone waiting on the current event and hand out a fresh one
+        self.event.set()
+        self.event = asyncio.Event()
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight upstream calls.
+
+    The first caller for a key starts the call; callers arriving while it
+    runs wait on the same result instead of issuing their own. Streams are
+    fanned out: every subscriber replays the chunks received so far and then
+    follows the live stream. The upstream call runs in its own task so one
+    caller disconnecting does not cancel it for the others; it is cancelled
+    once nobody is waiting any more.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Stream] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def stats(self) -> dict:
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "in_flight": len(self._calls) + len(self._streams)
+        }
+
+    @staticmethod
+    def eligible(temperature: float) -> bool:
+        """Only deterministic requests may share an answer"""
+        return settings.COALESCE_ENABLED and temperature <= settings.COALESCE_MAX_TEMPERATURE
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """Return ``(result, shared)``; ``shared`` is True for callers that joined another's call"""
+        call = self._calls.get(key)
+        shared = call is not None
+        if shared:
+            self.followers += 1
+        else:
+            self.leaders += 1
+            call = self._calls[key] = _Call(asyncio.create_task(fn()))
+            call.task.add_done_callback(lambda _: self._forget(self._calls, key, call))
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if not call.waiters and not call.task.done():
+                call.task.cancel()
+
+    def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> Tuple[AsyncIterator[str], bool]:
+        """Return ``(chunks, shared)`` for a streaming call"""
+        flight = self._streams.get(key)
+        shared = flight is not None
+        if shared:
+            self.followers += 1
+        else:
+            self.leaders += 1
+            flight = self._streams[key] = _Stream()
+            flight.task = asyncio.create_task(self._produce(key, flight, factory))
+        flight.subscribers += 1
+        return self._subscribe(flight), shared
+
+    @staticmethod
+    def _forget(table: dict, key: str, value):
+        if table.get(key) is value:
+            del table[key]
+
+    async def _produce(self, key: str, flight: _Stream, factory: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in factory():
+                flight.chunks.append(chunk)
+                flight.publish()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._forget(self._streams, key, flight)
+            flight.done = True
+            flight.publish()
+
+    async def _subscribe(self, flight: _Stream) -> AsyncIterator[str]:
+        position = 0
+        try:
+            while True:
+                while position < len(flight.chunks):
+                    yield flight.chunks[position]
+                    position += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.event.wait()
+        finally:
+            flight.subscribers -= 1
+            if not flight.subscribers and not flight.done:
+                flight.task.cancel()
+
+single_flight = SingleFlight()
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from datetime import date
+from typing import Dict, Optional, Tuple
+from ..config import settings
+from ..core.database import AsyncSessionLocal
+from ..repositories.statistics import StatisticsRepository, UnsupportedDatabaseError, COUNTER_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+class StatisticsAggregator:
+    """
+    Accumulates per-user daily statistics in memory and writes them in bulk.
+
+    Request handlers call record(), which only touches a dict. A background
+    task flushes every ``flush_interval`` seconds, or sooner once
+    ``max_pending`` (user, day) rows are buffered, using one multi-row upsert.
+    stop() flushes whatever is left on shutdown. Rows of a failed flush are
+    kept for the next one, up to ``max_buffered`` rows in all, so an outage
+    cannot grow the buffer without bound.
+    """
+
+    def __init__(self, flush_interval: float, max_pending: int, max_buffered: int):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_buffered = max_buffered
+        self._pending: Dict[Tuple[int, date], Dict[str, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+    def record(self, user_id: int, stats_date: date, **counters: int):
+        row = self._pending.get((user_id, stats_date))
+        if row is None:
+            row = self._pending[(user_id, stats_date)] = dict.fromkeys(COUNTER_COLUMNS, 0)
+        for name, value in counters.items():
+            row[name] += value
+        if self._wakeup is not None and len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write all buffered counters; on failure they are kept for the next attempt"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            rows = [
+                {"user_id": user_id, "date": stats_date, **counters}
+                for (user_id, stats_date), counters in pending.items()
+            ]
+            try:
+                async with AsyncSessionLocal() as db:
+                    await StatisticsRepository(db).bulk_update_daily_stats(rows)
+            except UnsupportedDatabaseError:
+                # Retrying cannot help, and the rows would pile up until the cap
+                logger.exception("Dropped %d statistics rows", len(rows))
+            except Exception:
+                if len(self._pending) + len(pending) > self.max_buffered:
+                    logger.exception("Failed to flush %d statistics rows, dropping them: %d rows are "
+                                     "already buffered", len(rows), len(self._pending))
+                    return
+                logger.exception("Failed to flush %d statistics rows, will retry", len(rows))
+                for (user_id, stats_date), counters in pending.items():
+                    self.record(user_id, stats_date, **counters)
+
+stats_aggregator = StatisticsAggregator(
+    flush_interval=settings.STATS_FLUSH_INTERVAL,
+    max_pending=settings.STATS_FLUSH_MAX_PENDING,
+    max_buffered=settings.STATS_MAX_BUFFERED
+)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from typing import Dict, List
+from ..config import settings
+from ..core.database import AsyncSessionLocal
+from ..models.base import Message
+from ..repositories import SessionRepository, MessageRepository
+from .context_builder import ChatContext
+from .openai_service import get_openai_service
+from .tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "你负责维护一段客服对话的滚动摘要。根据已有摘要和新增对话，输出一份更新后的完整摘要，"
+    "保留用户的问题、关键事实、产品名称和编号、已给出的结论以及尚未解决的事项。"
+    "使用对话本身的语言，只输出摘要正文。"
+)
+
+class SessionSummarizer:
+    """
+    Folds older turns of a session into ``Session.summary`` in the background.
+
+    After a turn, schedule() is called with the context that was sent. When the
+    unsummarised history has grown past SUMMARY_TRIGGER_MESSAGES or no longer
+    fits the prompt budget, a task summarises everything except the newest
+    SUMMARY_KEEP_RECENT messages, extending the previous summary rather than
+    starting over. The context builder then sends the summary plus only the
+    messages after it, so prompt size stays bounded however long a session
+    runs.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def schedule(self, session_id: int, context: ChatContext):
+        if not settings.SUMMARY_ENABLED or session_id in self._tasks:
+            return
+        if not context.truncated and context.history_count < settings.SUMMARY_TRIGGER_MESSAGES:
+            return
+        task = asyncio.create_task(self._run(session_id))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None))
+
+    async def stop(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def _run(self, session_id: int):
+        try:
+            await self.summarize(session_id)
+        except Exception:
+            logger.exception("Failed to summarise session %s", session_id)
+
+    async def summarize(self, session_id: int) -> bool:
+        async with AsyncSessionLocal() as db:
+            session_repo = SessionRepository(db)
+            session = await session_repo.get(session_id)
+            if session is None:
+                return False
+            messages = await MessageRepository(db).get_messages_after(
+                session_id, session.summary_message_id, settings.SUMMARY_MAX_BATCH + settings.SUMMARY_KEEP_RECENT
+            )
+            to_fold = messages[:-settings.SUMMARY_KEEP_RECENT] if settings.SUMMARY_KEEP_RECENT else messages
+            if len(to_fold) < settings.SUMMARY_MIN_BATCH:
+                return False
+            previous_summary, previous_message_id = session.summary, session.summary_message_id
+            # Do not hold a connection while the model works
+            await db.commit()
+
+            response = await get_openai_service().create_chat_completion(
+                messages=self._prompt(previous_summary, to_fold),
+                temperature=0.2,
+                max_tokens=settings.SUMMARY_MAX_TOKENS
+            )
+            summary = response["content"].strip()
+            return await session_repo.save_summary(
+                session_id,
+                summary,
+                response["tokens"]["completion_tokens"] or count_tokens(summary),
+                to_fold[-1].id,
+                previous_message_id
+            )
+
+    @staticmethod
+    def _prompt(previous_summary: str, messages: List[Message]) -> List[Dict[str, str]]:
+        transcript = "\n".join(f"{m.role}: {m.content}" for m in messages)
+        return [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": f"已有摘要：\n{previous_summary or '（无）'}\n\n新增对话：\n{transcript}"}
+        ]
+
+summarizer = SessionSummarizer()
@@ -0,0 +1,42 @@
+import logging
+import re
+from functools import lru_cache
+from typing import Dict, List
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Framing overhead OpenAI chat models add per message and to prime the reply
+TOKENS_PER_MESSAGE = 4
+REPLY_PRIMING_TOKENS = 3
+
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads its BPE tables on first use; offline hosts fall back to an estimate
+        logger.warning("tiktoken unavailable for %s, estimating token counts: %s", model, e)
+        return None
+
+def count_tokens(text: str, model: str = None) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding(model or settings.OPENAI_MODEL)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Roughly one token per CJK character and per four other characters
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def count_message_tokens(message: Dict[str, str], model: str = None) -> int:
+    return TOKENS_PER_MESSAGE + count_tokens(message["content"], model)
+
+def count_prompt_tokens(messages: List[Dict[str, str]], model: str = None) -> int:
+    return REPLY_PRIMING_TOKENS + sum(count_message_tokens(m, model) for m in messages)
@@ -0,0 +1,42 @@
+from datetime import datetime
+from typing import Optional
+from ..config import settings
+from ..core.cache import Cache
+from ..models.base import User
+
+# Everything the API needs from the principal; the password hash is never cached
+USER_FIELDS = ("id", "username", "email", "avatar", "role", "status",
+               "created_at", "updated_at", "last_login", "preferences")
+DATETIME_FIELDS = ("created_at", "updated_at", "last_login")
+
+class UserCache:
+    """
+    Caches authenticated users by token subject (username) so get_current_user
+    does not hit the database on every request. Entries expire after
+    USER_CACHE_TTL seconds and are dropped whenever the user row is updated.
+    """
+
+    def __init__(self):
+        self.cache = Cache("user", ttl=settings.USER_CACHE_TTL, maxsize=settings.USER_CACHE_MAXSIZE)
+
+    async def get(self, username: str) -> Optional[User]:
+        data = await self.cache.get(username)
+        if data is None:
+            return None
+        for field in DATETIME_FIELDS:
+            if data.get(field):
+                data[field] = datetime.fromisoformat(data[field])
+        # A detached instance: attribute access works, but it is not tracked by any session
+        return User(**data)
+
+    async def set(self, user: User):
+        data = {field: getattr(user, field) for field in USER_FIELDS}
+        for field in DATETIME_FIELDS:
+            if data[field] is not None:
+                data[field] = data[field].isoformat()
+        await self.cache.set(user.username, data)
+
+    async def invalidate(self, *usernames: str):
+        await self.cache.delete(*[name for name in usernames if name])
+
+user_cache = UserCache()